@@ -0,0 +1,227 @@
+"""
+Вспомогательные функции для бенчмарков сервера: тестовая база данных в памяти, запуск сервера
+и авторизация тестовых клиентов
+"""
+
+import binascii
+import hashlib
+import hmac
+import resource
+import os
+import socket
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from server_dist.server.common.utils import get_message, send_message, get_codec
+from server_dist.server.common.variables import *
+
+BENCH_PASSWORD_HASH = b'bench'
+# Пароль тестовых пользователей настоящего клиента ClientTransport
+PASSWORD = 'bench'
+
+
+class BenchDB:
+    """
+    Класс, имитирующий базу данных сервера в памяти, чтобы бенчмарки измеряли работу сервера, а не диска
+    """
+
+    def __init__(self, users=()):
+        self.users = set(users)
+        self.active = set()
+        self.messages = 0
+
+    def check_user(self, name):
+        return name in self.users
+
+    def get_hash(self, name):
+        return BENCH_PASSWORD_HASH
+
+    def user_login(self, name, ip, port, key):
+        self.active.add(name)
+
+    def user_logout(self, name):
+        self.active.discard(name)
+
+    def process_message(self, sender, receiver):
+        self.messages += 1
+
+    def stats_flush_timeout(self):
+        return None
+
+    def flush_message_stats(self):
+        pass
+
+    def release_session(self):
+        pass
+
+    def rollback_session(self):
+        pass
+
+    def dispose_connections(self):
+        pass
+
+    def invalidate_user_cache(self, name=None):
+        pass
+
+    def sync_directory_version(self, version):
+        pass
+
+    def store_offline_message(self, receiver, message):
+        pass
+
+    def get_offline_messages(self, receiver, limit):
+        return []
+
+    def delete_offline_messages(self, receiver, last_id):
+        pass
+
+    def get_contacts(self, name):
+        return []
+
+    def get_directory_version(self):
+        return 0
+
+    def get_directory_changes(self, version):
+        return []
+
+    def get_users(self):
+        return [(name, None) for name in self.users]
+
+    def get_public_key(self, name):
+        return 'bench-key'
+
+
+class PasswordDB(BenchDB):
+    """
+    Класс тестовой базы данных сервера, хранящей хэши паролей так же, как окно добавления пользователя
+    """
+
+    def get_hash(self, name):
+        return binascii.hexlify(hashlib.pbkdf2_hmac('sha512', PASSWORD.encode('utf-8'),
+                                                    name.lower().encode('utf-8'), 10000))
+
+
+class MemoryClientDB:
+    """
+    Класс, имитирующий базу данных клиента в памяти
+    """
+
+    def __init__(self):
+        self.users = set()
+        self.contacts = set()
+        self.public_keys = {}
+
+    def renew_users(self, users):
+        self.users = set(users)
+
+    def add_user(self, user):
+        self.users.add(user)
+
+    def remove_user(self, user):
+        self.users.discard(user)
+
+    def add_contact(self, contact):
+        self.contacts.add(contact)
+
+    def get_public_key(self, user):
+        return self.public_keys.get(user)
+
+    def save_public_key(self, user, key):
+        self.public_keys[user] = key
+
+    def forget_public_key(self, user):
+        self.public_keys.pop(user, None)
+
+    def clear_public_keys(self):
+        self.public_keys.clear()
+
+
+def remove_database(db):
+    """
+    :param db: база данных клиента
+
+    Функция, удаляющая файл базы данных клиента вместе с файлами журнала WAL
+    """
+
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db.engine.url.database + suffix):
+            os.remove(db.engine.url.database + suffix)
+
+
+def raise_open_files_limit(count):
+    """
+    :param count: необходимое количество одновременно открытых сокетов
+
+    Функция, поднимающая ограничение на число открытых файлов процесса. Возвращает число клиентов, которое
+    можно подключить при этом ограничении (сокеты клиента и сервера открыты в одном процессе)
+    """
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    need = count * 2 + 100
+    if soft < need:
+        soft = min(need, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+    return min(count, (soft - 100) // 2)
+
+
+def start_server(server_class, db, port, **kwargs):
+    """
+    :param server_class: класс сервера
+    :param db: база данных сервера
+    :param port: порт для подключений
+
+    Функция, запускающая сервер в отдельном потоке и дожидающаяся его готовности
+    """
+
+    server = server_class('127.0.0.1', port, db, **kwargs)
+    server.start()
+    for _ in range(50):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+    return server
+
+
+def login(port, name, framed=False, codec=CODEC_JSON, envelope=False):
+    """
+    :param port: порт сервера
+    :param name: имя тестового пользователя
+    :param framed: включить передачу сообщений с заголовком длины
+    :param codec: название формата сериализации, который клиент предлагает серверу (только с кадрированием)
+    :param envelope: предложить серверу пересылку сообщений кадрами-конвертами (только с кадрированием)
+
+    Функция, подключающая тестового клиента к серверу и проходящая авторизацию
+    """
+
+    sock = socket.create_connection(('127.0.0.1', port))
+    sock.settimeout(10)
+    presence = {ACTION: PRESENCE, TIME: time.time(), USER: {ACCOUNT_NAME: name, PUBLIC_KEY: 'bench-key'}}
+    if framed:
+        presence[FEATURES] = [FRAMING]
+        presence[CODECS] = [codec]
+        if envelope:
+            presence[FEATURES].append(ENVELOPE)
+    send_message(sock, presence)
+    challenge = get_message(sock)
+    negotiated = get_codec(challenge.get(CODEC))
+    digest = hmac.new(BENCH_PASSWORD_HASH, challenge[BIN].encode('utf-8'), 'MD5').digest()
+    send_message(sock, {RESPONSE: 511, BIN: binascii.b2a_base64(digest).decode('ascii')}, framed, negotiated)
+    answer = get_message(sock, framed, negotiated)
+    if answer.get(RESPONSE) != 200:
+        raise RuntimeError(f'Не удалось авторизовать {name}: {answer}')
+    return sock
+
+
+def percentile(values, percent):
+    """
+    :param values: список измерений
+    :param percent: процентиль от 0 до 100
+
+    Функция, возвращающая процентиль списка измерений
+    """
+
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(len(ordered) * percent / 100))
+    return ordered[index]
@@ -0,0 +1,93 @@
+"""
+Бенчмарк окна чата клиента без экрана (QT_QPA_PLATFORM=offscreen): время показа одного нового сообщения
+при переписке из 10 и 10 000 сообщений. Прежний способ после каждого сообщения заново читает из базы данных
+всю переписку, сортирует её и пересоздаёт элементы окна чата. Текущий добавляет в конец окна один элемент,
+а число элементов окна ограничено HISTORY_VIEW_LIMIT. Время включает обработку событий Qt, то есть
+раскладку окна; сохранение сообщения в базу данных в замер не входит.
+
+Запуск из папки project: python benchmarks/chat_view.py [число сообщений в замере]
+"""
+
+import os
+import sys
+import time
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from Cryptodome.PublicKey import RSA
+from PyQt5.QtWidgets import QApplication
+from sqlalchemy import or_
+from bench_utils import remove_database
+from client_dist.client.client_files.client_db import ClientDB
+from client_dist.client.client_files.main_window import ClientMainWindow
+
+HISTORY_SIZES = (10, 10000)
+
+
+class BenchTransport:
+    name = 'bench_a'
+
+
+def rebuild_history(window):
+    """
+    :param window: главное окно клиента
+
+    Функция, повторяющая прежнее обновление окна чата: вся переписка читается из базы данных и сортируется,
+    окно заполняется последними 20 сообщениями заново
+    """
+
+    window.db.flush()
+    history = window.db.MessageHistory
+    messages = sorted(((message.sender, message.receiver, message.message, message.time, message.id)
+                       for message in window.db.session.query(history).filter(
+                           or_(history.sender == window.current_chat, history.receiver == window.current_chat))),
+                      key=lambda message: message[3])
+    window.history_model.clear()
+    for message in messages[-20:]:
+        window.history_model.appendRow(window.history_item(message))
+    window.ui.messages.scrollToBottom()
+
+
+def measure(app, window, messages, incremental):
+    """
+    :param app: приложение Qt
+    :param window: главное окно клиента
+    :param messages: количество новых сообщений в замере
+    :param incremental: добавлять ли сообщения в конец окна или перестраивать окно целиком
+
+    Функция, возвращающая среднее время показа одного нового сообщения в миллисекундах
+    """
+
+    window.renew_message_history()
+    app.processEvents()
+    elapsed = 0
+    for number in range(messages):
+        saved = window.db.save_message('bench_a', 'bench_b', f'Новое сообщение {number}')
+        started = time.perf_counter()
+        if incremental:
+            window.append_message(saved)
+        else:
+            rebuild_history(window)
+        app.processEvents()
+        elapsed += time.perf_counter() - started
+    return elapsed / messages * 1000
+
+
+if __name__ == '__main__':
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    app = QApplication(sys.argv)
+    db = ClientDB('bench_chat_view')
+    try:
+        window = ClientMainWindow(BenchTransport(), db, RSA.generate(1024))
+        window.current_chat = 'bench_b'
+        stored = 0
+        for history_size in HISTORY_SIZES:
+            for number in range(history_size - stored):
+                db.save_message('bench_b', 'bench_a', f'Сообщение {number} ' * 5)
+            rebuild = measure(app, window, messages, False)
+            append = measure(app, window, messages, True)
+            stored = history_size + 2 * messages
+            print(f'Переписка {history_size:>6} сообщений: перестроение {rebuild:>8.3f} мс, '
+                  f'добавление {append:>7.3f} мс на сообщение')
+    finally:
+        db.close()
+        remove_database(db)
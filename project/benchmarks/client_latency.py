@@ -0,0 +1,62 @@
+"""
+Бенчмарк задержки доставки сообщений между двумя клиентами ClientTransport через сервер. Измеряется время
+от вызова send_message у отправителя до сигнала new_message у получателя, а также время выполнения запроса
+(отправка сообщения с ожиданием ответа сервера).
+
+Запуск из папки project: python benchmarks/client_latency.py [число сообщений]
+"""
+
+import os
+import struct
+import sys
+import threading
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from Cryptodome.PublicKey import RSA
+from PyQt5.QtCore import Qt
+from bench_utils import PASSWORD, PasswordDB, MemoryClientDB, start_server, percentile
+from server_dist.server.common.variables import *
+from server_dist.server.server_files.core import MessageProcessor
+from client_dist.client.client_files.transport import ClientTransport
+
+PORT = 18050
+
+
+if __name__ == '__main__':
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    server = start_server(MessageProcessor, PasswordDB(['bench_a', 'bench_b']), PORT)
+    keys = RSA.generate(1024, os.urandom)
+    sender = ClientTransport(PORT, '127.0.0.1', 'bench_a', MemoryClientDB(), PASSWORD, keys)
+    receiver = ClientTransport(PORT, '127.0.0.1', 'bench_b', MemoryClientDB(), PASSWORD, keys)
+
+    latencies = []
+    delivered = threading.Event()
+
+    def on_message(message):
+        latencies.append(time.perf_counter() - struct.unpack('!d', message[MESSAGE_TEXT])[0])
+        if len(latencies) == messages:
+            delivered.set()
+
+    receiver.new_message.connect(on_message, Qt.DirectConnection)
+    sender.start()
+    receiver.start()
+
+    requests = []
+    started = time.perf_counter()
+    for _ in range(messages):
+        sent = time.perf_counter()
+        sender.send_message('bench_b', struct.pack('!d', sent))
+        requests.append(time.perf_counter() - sent)
+    delivered.wait(30)
+    elapsed = time.perf_counter() - started
+
+    print(f'Доставлено {len(latencies)} из {messages} за {elapsed:.2f} с')
+    print(f'Задержка доставки: p50 {percentile(latencies, 50) * 1000:.2f} мс, '
+          f'p99 {percentile(latencies, 99) * 1000:.2f} мс, max {max(latencies) * 1000:.2f} мс')
+    print(f'Запрос с ожиданием ответа: p50 {percentile(requests, 50) * 1000:.2f} мс, '
+          f'p99 {percentile(requests, 99) * 1000:.2f} мс')
+    for transport in (sender, receiver):
+        transport.transport_shutdown()
+        transport.join()
+    server.stop()
+    server.join()
@@ -0,0 +1,78 @@
+"""
+Бенчмарк задержки доставки сообщений в кластере серверов. Запускаются три узла кластера на разных портах
+одного компьютера. Сообщения отправляются по одному (следующее - после получения предыдущего) получателю
+на том же узле и получателю на соседнем узле. Сравнивается задержка доставки с пересылкой между узлами
+и без неё.
+
+Запуск из папки project: python benchmarks/cluster_latency.py [число сообщений]
+"""
+
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bench_utils import BenchDB, login, start_server, percentile
+from server_dist.server.common.utils import MessageStream, get_codec, CODEC_PREFERENCE
+from server_dist.server.common.variables import *
+from server_dist.server.server_files.cluster import ClusterMessageProcessor
+
+CLIENT_PORTS = [18201, 18202, 18203]
+NODES = [f'127.0.0.1:{port}' for port in (18301, 18302, 18303)]
+USERS = ['bench_a', 'bench_b', 'bench_c']
+CIPHERTEXT = os.urandom(128)
+CLUSTER_SECRET = os.urandom(32)
+
+
+def measure(sender, receiver, receiver_name, messages):
+    """
+    :param sender: сокет отправителя
+    :param receiver: сокет получателя
+    :param receiver_name: имя получателя
+    :param messages: число сообщений
+
+    Функция, отправляющая сообщения по одному и возвращающая список задержек доставки
+    """
+
+    codec = get_codec(CODEC_PREFERENCE[0])
+    sender_stream = MessageStream(True, codec)
+    receiver_stream = MessageStream(True, codec)
+    pending = []
+    latencies = []
+    for request_id in range(1, messages + 1):
+        frame = sender_stream.encode_envelope({ACTION: MESSAGE, SENDER: 'bench_a', RECEIVER: receiver_name,
+                                               TIME: time.time(), MESSAGE_TEXT: CIPHERTEXT}, request_id)
+        started = time.perf_counter()
+        sender.sendall(frame)
+        while not pending:
+            pending = [message for message in receiver_stream.feed(receiver.recv(RECV_BUFFER_SIZE))
+                       if message.get(ACTION) == MESSAGE]
+        latencies.append(time.perf_counter() - started)
+        pending.pop()
+        sender.recv(RECV_BUFFER_SIZE)
+    return latencies
+
+
+if __name__ == '__main__':
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    nodes = [start_server(ClusterMessageProcessor, BenchDB(USERS), port, node=node, peers=NODES,
+                          cluster_secret=CLUSTER_SECRET)
+             for port, node in zip(CLIENT_PORTS, NODES)]
+    time.sleep(0.5)
+    codec_name = CODEC_PREFERENCE[0]
+    sender = login(CLIENT_PORTS[0], 'bench_a', True, codec_name, True)
+    local = login(CLIENT_PORTS[0], 'bench_c', True, codec_name, True)
+    remote = login(CLIENT_PORTS[1], 'bench_b', True, codec_name, True)
+    time.sleep(0.5)
+
+    for title, receiver, name in (('тот же узел', local, 'bench_c'), ('соседний узел', remote, 'bench_b')):
+        latencies = measure(sender, receiver, name, messages)
+        print(f'{title:>14}: p50 {percentile(latencies, 50) * 1000:.3f} мс, '
+              f'p99 {percentile(latencies, 99) * 1000:.3f} мс, max {max(latencies) * 1000:.3f} мс')
+    active = [sorted(node.db.active) for node in nodes]
+    print(f'Активные пользователи узлов: {active}')
+
+    for sock in (sender, local, remote):
+        sock.close()
+    for node in nodes:
+        node.stop()
+        node.join()
@@ -0,0 +1,154 @@
+"""
+Проверка защиты порта соседей узла кластера. Два узла с общим секретом должны соединиться друг с другом,
+а узел с другим секретом - нет. Постороннее подключение к порту соседей, приславшее сообщение ROUTE
+без приветствия или приветствие с неверной подписью, должно быть закрыто, а пользователь из ROUTE не должен
+появиться среди пользователей узла. На запрос постороннего подключения узел не должен отвечать подписанным
+приветствием, пока подключение само не представилось. Ошибка обработки сообщения проверенного соседа должна
+закрыть только соединение с ним, не останавливая узел, а вход соседа пользователя, уже вошедшего на этот узел,
+не должен записываться в базу данных узла.
+
+Запуск из папки project: python benchmarks/cluster_security.py
+"""
+
+import os
+import socket
+import sys
+import tempfile
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bench_utils import BenchDB, start_server
+from server_dist.server.common.utils import MessageStream
+from server_dist.server.common.variables import *
+from server_dist.server.server_files.cluster import ClusterMessageProcessor, parse_node_address, hello_digest, \
+    CHALLENGE, HELLO, NODE, NONCE, DIGEST
+from server_dist.server.server_files.peers import PEER_CODEC, ROUTE
+from server_dist.server.server_files.server_db import ServerDB
+
+CLIENT_PORTS = [18501, 18502, 18503]
+NODES = [f'127.0.0.1:{port}' for port in (18511, 18512, 18513)]
+USERS = ['alice', 'bob', 'mallory']
+CLUSTER_SECRET = os.urandom(32)
+
+
+def rogue_link(node, *messages):
+    """
+    :param node: адрес узла кластера
+    :param messages: сообщения, отправляемые узлу
+
+    Функция, подключающаяся к порту соседей узла, отправляющая сообщения и возвращающая полученные от узла
+    сообщения и признак закрытия соединения узлом
+    """
+
+    stream = MessageStream(True, PEER_CODEC)
+    sock = socket.create_connection(parse_node_address(node))
+    for message in messages:
+        sock.sendall(stream.encode(message))
+    received = []
+    closed = False
+    sock.settimeout(1)
+    try:
+        while True:
+            data = sock.recv(RECV_BUFFER_SIZE)
+            if not data:
+                closed = True
+                break
+            received.extend(stream.feed(data))
+    except socket.timeout:
+        pass
+    except OSError:
+        closed = True
+    sock.close()
+    return received, closed
+
+
+def route(name):
+    return {ACTION: ROUTE, ACCOUNT_NAME: name, PUBLIC_KEY: 'rogue-key', DIRECTORY_VERSION: 0}
+
+
+def broken_peer(node, peer):
+    """
+    :param node: адрес узла кластера
+    :param peer: адрес узла, которым представляется соседний узел
+
+    Функция, подключающаяся к порту соседей узла как проверенный сосед (со знанием общего секрета)
+    и отправляющая сообщение ROUTE без публичного ключа. Возвращает признак закрытия соединения узлом
+    """
+
+    stream = MessageStream(True, PEER_CODEC)
+    sock = socket.create_connection(parse_node_address(node))
+    sock.settimeout(1)
+    challenge = []
+    while not challenge:
+        challenge = stream.feed(sock.recv(RECV_BUFFER_SIZE))
+    digest = hello_digest(CLUSTER_SECRET, challenge[0][NONCE], peer, node)
+    sock.sendall(stream.encode({ACTION: HELLO, NODE: peer, DIGEST: digest}))
+    sock.sendall(stream.encode({ACTION: ROUTE, ACCOUNT_NAME: 'mallory'}))
+    closed = False
+    try:
+        while sock.recv(RECV_BUFFER_SIZE):
+            pass
+        closed = True
+    except socket.timeout:
+        pass
+    except OSError:
+        closed = True
+    sock.close()
+    return closed
+
+
+def check_duplicate_login():
+    """
+    Функция, передающая узлу с настоящей базой данных сообщение ROUTE о пользователе, вошедшем на этот узел
+    """
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = ServerDB(os.path.join(directory, 'bench_db'))
+        db.add_user('alice', b'hash')
+        db.user_login('alice', '127.0.0.1', 7777, 'local-key')
+        node = ClusterMessageProcessor('127.0.0.1', CLIENT_PORTS[0], db, NODES[0], NODES,
+                                       cluster_secret=CLUSTER_SECRET)
+        node.names['alice'] = object()
+        link = object()
+        node.links[link] = NODES[1]
+        node.process_peer_message({ACTION: ROUTE, ACCOUNT_NAME: 'alice', PUBLIC_KEY: 'remote-key',
+                                   DIRECTORY_VERSION: 0}, link)
+        assert db.get_public_key('alice') == 'local-key' and len(db.get_active_users()) == 1, \
+            db.get_active_users()
+        db.user_logout('alice')
+        db.release_session()
+        db.engine.dispose()
+    print('Вход на соседний узел пользователя, вошедшего на этот узел, не записан в базу данных')
+
+
+if __name__ == '__main__':
+    secrets = [CLUSTER_SECRET, CLUSTER_SECRET, os.urandom(32)]
+    nodes = [start_server(ClusterMessageProcessor, BenchDB(USERS), port, node=node, peers=NODES, cluster_secret=secret)
+             for port, node, secret in zip(CLIENT_PORTS, NODES, secrets)]
+    try:
+        time.sleep(1)
+        assert list(nodes[0].peers) == [NODES[1]] and list(nodes[1].peers) == [NODES[0]], \
+            [list(node.peers) for node in nodes]
+        assert not nodes[2].peers, list(nodes[2].peers)
+        print('Узлы с общим секретом соединились, узел с другим секретом отклонён')
+
+        received, closed = rogue_link(NODES[0], route('mallory'))
+        assert closed and 'mallory' not in nodes[0].remote_names, (closed, nodes[0].remote_names)
+        received, closed = rogue_link(NODES[0], {ACTION: HELLO, NODE: NODES[1], DIGEST: 'forged'}, route('mallory'))
+        assert closed and 'mallory' not in nodes[0].remote_names, (closed, nodes[0].remote_names)
+        print('Постороннее подключение без приветствия или с неверной подписью закрыто, ROUTE не принят')
+
+        received, closed = rogue_link(NODES[1], {ACTION: CHALLENGE, NONCE: 'rogue-nonce'})
+        assert not any(message.get(ACTION) == HELLO for message in received), received
+        assert list(nodes[1].peers) == [NODES[0]], list(nodes[1].peers)
+        print('На запрос непредставившегося подключения узел не ответил подписанным приветствием')
+
+        closed = broken_peer(NODES[1], NODES[2])
+        time.sleep(0.2)
+        assert closed and nodes[1].is_alive() and list(nodes[1].peers) == [NODES[0]], \
+            (closed, nodes[1].is_alive(), list(nodes[1].peers))
+        print('Ошибка обработки сообщения соседа закрыла соединение с ним, узел продолжает работу')
+    finally:
+        for node in nodes:
+            node.stop()
+            node.join()
+    check_duplicate_login()
@@ -0,0 +1,50 @@
+"""
+Микробенчмарк форматов сериализации: скорость кодирования и декодирования типичного сообщения с зашифрованным
+текстом и размер сообщения в байтах. В JSON зашифрованный текст передаётся строкой base64, в двоичном
+формате - байтами как есть.
+
+Запуск из папки project: python benchmarks/codec_micro.py [число повторений]
+"""
+
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from server_dist.server.common.utils import CODECS_AVAILABLE, message_bytes
+from server_dist.server.common.variables import *
+
+# Зашифрованный ключом RSA 1024 текст занимает 128 байт
+CIPHERTEXT = os.urandom(128)
+
+
+def measure(codec, repeat):
+    """
+    :param codec: формат сериализации
+    :param repeat: число повторений
+
+    Функция, возвращающая размер сообщения и число операций кодирования и декодирования в секунду.
+    Декодирование включает приведение зашифрованного текста к байтам, как это делает клиент
+    """
+
+    message = {ACTION: MESSAGE, SENDER: 'bench_a', RECEIVER: 'bench_b', TIME: time.time(),
+               MESSAGE_TEXT: CIPHERTEXT, REQUEST_ID: 12345}
+    encoded = codec.encode(message)
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        codec.encode(message)
+    encode_rate = repeat / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        message_bytes(codec.decode(encoded)[MESSAGE_TEXT])
+    decode_rate = repeat / (time.perf_counter() - started)
+    return len(encoded), encode_rate, decode_rate
+
+
+if __name__ == '__main__':
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    for name, codec in CODECS_AVAILABLE.items():
+        size, encode_rate, decode_rate = measure(codec, repeat)
+        print(f'{name:>8}: {size:>4} байт, кодирование {encode_rate:>9.0f} оп./с, '
+              f'декодирование {decode_rate:>9.0f} оп./с')
@@ -0,0 +1,83 @@
+"""
+Бенчмарк пересылки сообщений через сервер с разными форматами сериализации. Отправитель передаёт сообщения
+с 128-байтным зашифрованным текстом конвейером, получатель разбирает их (оба клиента используют кадрирование); измеряется число сообщений в секунду
+и объём данных, полученных получателем. Сервер декодирует каждое сообщение и кодирует его заново
+в формате получателя.
+
+Запуск из папки project: python benchmarks/codec_relay.py [число сообщений]
+"""
+
+import os
+import sys
+import threading
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bench_utils import BenchDB, login, start_server
+from server_dist.server.common.utils import CODECS_AVAILABLE, MessageStream, get_codec, message_bytes
+from server_dist.server.common.variables import *
+from server_dist.server.server_files.core import MessageProcessor
+
+BASE_PORT = 18070
+CIPHERTEXT = os.urandom(128)
+
+
+def run(port, messages, codec_name):
+    """
+    :param port: порт тестового сервера
+    :param messages: число сообщений
+    :param codec_name: название формата сериализации
+
+    Функция, пересылающая сообщения от одного клиента другому и возвращающая число сообщений в секунду
+    и число байт, полученных получателем
+    """
+
+    server = start_server(MessageProcessor, BenchDB(['bench_a', 'bench_b']), port)
+    codec = get_codec(codec_name)
+    sender = login(port, 'bench_a', True, codec_name)
+    receiver = login(port, 'bench_b', True, codec_name)
+    sender.settimeout(None)
+    receiver.settimeout(None)
+    received = [0, 0]
+
+    def receive():
+        stream = MessageStream(True, codec)
+        while received[0] < messages:
+            data = receiver.recv(RECV_BUFFER_SIZE)
+            if not data:
+                break
+            received[1] += len(data)
+            for message in stream.feed(data):
+                if message.get(ACTION) == MESSAGE:
+                    message_bytes(message[MESSAGE_TEXT])
+                    received[0] += 1
+
+    def drain_responses():
+        try:
+            while sender.recv(RECV_BUFFER_SIZE):
+                pass
+        except OSError:
+            pass
+
+    reader = threading.Thread(target=receive)
+    threading.Thread(target=drain_responses, daemon=True).start()
+    sender_stream = MessageStream(True, codec)
+    reader.start()
+    started = time.perf_counter()
+    for _ in range(messages):
+        sender.sendall(sender_stream.encode({ACTION: MESSAGE, SENDER: 'bench_a', RECEIVER: 'bench_b',
+                                             TIME: time.time(), MESSAGE_TEXT: CIPHERTEXT}))
+    reader.join(60)
+    elapsed = time.perf_counter() - started
+
+    for sock in (sender, receiver):
+        sock.close()
+    server.stop()
+    server.join()
+    return received[0] / elapsed, received[1] / max(received[0], 1)
+
+
+if __name__ == '__main__':
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    for number, codec_name in enumerate(CODECS_AVAILABLE):
+        throughput, size = run(BASE_PORT + number, messages, codec_name)
+        print(f'{codec_name:>8}: {throughput:>8.0f} сообщ./с, {size:.0f} байт на сообщение')
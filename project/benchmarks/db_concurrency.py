@@ -0,0 +1,108 @@
+"""
+Нагрузочная проверка конкурентного доступа к базе данных сервера: поток пересылки непрерывно записывает
+входы, выходы и статистику сообщений, а поток интерфейса одновременно читает списки пользователей и историю,
+как это делает таймер главного окна. Проверяется отсутствие ошибок, сохранность статистики и задержка чтения.
+
+Запуск из папки project: python benchmarks/db_concurrency.py [длительность в секундах]
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bench_utils import BENCH_PASSWORD_HASH, percentile
+from server_dist.server.server_files.server_db import ServerDB
+
+USERS = 50
+
+
+def relay_writer(db, stop_event, result):
+    """
+    :param db: база данных сервера
+    :param stop_event: событие остановки
+    :param result: словарь для результатов
+
+    Функция потока пересылки: входы и выходы пользователей и учёт сообщений со сбросом статистики пакетами
+    """
+
+    messages = errors = number = 0
+    while not stop_event.is_set():
+        name = f'user_{number % USERS}'
+        try:
+            db.user_login(name, '127.0.0.1', 7777, 'key')
+            for receiver in range(10):
+                db.process_message(name, f'user_{receiver}')
+                messages += 1
+            db.user_logout(name)
+        except Exception as e:
+            errors += 1
+            result.setdefault('error', repr(e))
+        number += 1
+    db.flush_message_stats()
+    db.release_session()
+    result.update(messages=messages, errors=errors)
+
+
+def gui_reader(db, stop_event, result):
+    """
+    :param db: база данных сервера
+    :param stop_event: событие остановки
+    :param result: словарь для результатов
+
+    Функция потока интерфейса: чтение активных пользователей, списка пользователей, контактов и истории
+    """
+
+    latencies = []
+    errors = 0
+    while not stop_event.is_set():
+        started = time.perf_counter()
+        try:
+            db.get_active_users()
+            db.get_users()
+            db.get_contacts('user_0')
+            db.get_message_history()
+        except Exception as e:
+            errors += 1
+            result.setdefault('error', repr(e))
+        latencies.append(time.perf_counter() - started)
+    db.release_session()
+    result.update(latencies=latencies, errors=errors)
+
+
+if __name__ == '__main__':
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    with tempfile.TemporaryDirectory() as directory:
+        db = ServerDB(os.path.join(directory, 'bench_db'), stats_flush_size=100)
+        for number in range(USERS):
+            db.add_user(f'user_{number}', BENCH_PASSWORD_HASH)
+        db.release_session()
+
+        stop_event = threading.Event()
+        writer_result, reader_result = {}, {}
+        threads = [threading.Thread(target=relay_writer, args=(db, stop_event, writer_result)),
+                   threading.Thread(target=gui_reader, args=(db, stop_event, reader_result))]
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+
+        history = db.get_message_history()
+        sent = sum(row[2] for row in history)
+        received = sum(row[3] for row in history)
+        latencies = reader_result['latencies']
+        print(f'Поток пересылки: {writer_result["messages"] / duration:.0f} сообщ./с, '
+              f'ошибок: {writer_result["errors"]} {writer_result.get("error", "")}')
+        print(f'Поток интерфейса: {len(latencies)} циклов чтения, p50 {percentile(latencies, 50) * 1000:.2f} мс, '
+              f'p99 {percentile(latencies, 99) * 1000:.2f} мс, ошибок: {reader_result["errors"]} '
+              f'{reader_result.get("error", "")}')
+        print(f'Учтено сообщений: отправлено {sent}, получено {received}, '
+              f'ожидалось {writer_result["messages"]}')
+        db.release_session()
+        db.engine.dispose()
+        if writer_result['errors'] or reader_result['errors'] or \
+                sent != writer_result['messages'] or received != writer_result['messages']:
+            sys.exit(1)
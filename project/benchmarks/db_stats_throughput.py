@@ -0,0 +1,73 @@
+"""
+Бенчмарк пропускной способности пересылки сообщений сервером с реальной базой данных: запись статистики
+каждого сообщения отдельной транзакцией (как было раньше) и накопление статистики в памяти с записью пакетами.
+
+Запуск из папки project: python benchmarks/db_stats_throughput.py [число сообщений]
+"""
+
+import os
+import sys
+import tempfile
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bench_utils import BENCH_PASSWORD_HASH, start_server, login
+from server_dist.server.common.utils import get_message, send_message
+from server_dist.server.common.variables import *
+from server_dist.server.server_files.core import MessageProcessor
+from server_dist.server.server_files.server_db import ServerDB
+
+BASE_PORT = 17850
+
+
+def legacy_process_message(db, sender_name, receiver_name):
+    """
+    Прежняя реализация ServerDB.process_message: два поиска пользователей, два запроса и commit на каждое сообщение
+    """
+
+    sender = db.session.query(db.User).filter_by(name=sender_name).first().id
+    receiver = db.session.query(db.User).filter_by(name=receiver_name).first().id
+    db.session.query(db.MessageHistory).filter_by(user=sender).first().sent += 1
+    db.session.query(db.MessageHistory).filter_by(user=receiver).first().received += 1
+    db.session.commit()
+
+
+def relay(port, db, messages):
+    """
+    :param port: порт тестового сервера
+    :param db: база данных сервера
+    :param messages: число сообщений
+
+    Функция, пересылающая сообщения через сервер и возвращающая число сообщений в секунду
+    """
+
+    server = start_server(MessageProcessor, db, port)
+    sender, receiver = login(port, 'bench_a'), login(port, 'bench_b')
+    started = time.perf_counter()
+    for _ in range(messages):
+        send_message(sender, {ACTION: MESSAGE, SENDER: 'bench_a', RECEIVER: 'bench_b',
+                              TIME: time.time(), MESSAGE_TEXT: 'x' * 64})
+        get_message(receiver)
+        get_message(sender)
+    elapsed = time.perf_counter() - started
+    sender.close()
+    receiver.close()
+    server.stop()
+    server.join()
+    return messages / elapsed
+
+
+if __name__ == '__main__':
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with tempfile.TemporaryDirectory() as directory:
+        db = ServerDB(os.path.join(directory, 'bench_db'))
+        for name in ('bench_a', 'bench_b'):
+            db.add_user(name, BENCH_PASSWORD_HASH)
+        for number, mode in enumerate(('commit на сообщение', 'пакетная запись')):
+            if number == 0:
+                db.process_message = lambda sender, receiver: legacy_process_message(db, sender, receiver)
+            else:
+                del db.process_message
+            throughput = relay(BASE_PORT + number, db, messages)
+            sent = {row[0]: row[2] for row in db.get_message_history()}['bench_a']
+            print(f'{mode:>20}: {throughput:>8.0f} сообщ./с, всего учтено отправленных: {sent}')
+        db.engine.dispose()
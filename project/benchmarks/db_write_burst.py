@@ -0,0 +1,92 @@
+"""
+Бенчмарк блокировки потока интерфейса клиента при всплеске входящих сообщений: поток интерфейса подряд
+сохраняет 1000 сообщений. Прежний способ фиксирует каждое сообщение отдельной транзакцией в потоке интерфейса
+(журнал DELETE, synchronous=FULL - настройки SQLite по умолчанию), тот же способ проверяется и в режиме WAL.
+Текущий способ (ClientDB.save_message) помещает сообщения в очередь потока записи, который записывает их
+пачками. Для каждого способа выводятся суммарное время блокировки потока интерфейса, 99-й процентиль
+и максимум времени одного сохранения, а для очереди - и время до записи всех сообщений (ClientDB.flush).
+База данных прежнего способа создаётся рядом с базой данных клиента, чтобы обе находились на одном диске.
+
+Запуск из папки project: python benchmarks/db_write_burst.py [число сообщений] [уровень synchronous]
+"""
+
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from bench_utils import percentile, remove_database
+from client_dist.client.client_files.client_db import ClientDB
+
+
+def report(title, timings, note=''):
+    print(f'{title:>38}: всего {sum(timings) * 1000:>8.1f} мс, 99% {percentile(timings, 99) * 1000:>6.3f} мс, '
+          f'максимум {max(timings) * 1000:>6.2f} мс{note}')
+
+
+def commit_each(db, path, journal_mode, messages):
+    """
+    :param db: база данных клиента, схема которой используется
+    :param path: путь к отдельной базе данных для замера
+    :param journal_mode: режим журнала SQLite
+    :param messages: число сообщений
+
+    Функция, сохраняющая сообщения прежним способом - транзакцией на сообщение через сессию - и возвращающая
+    время каждого сохранения
+    """
+
+    engine = create_engine(f'sqlite:///{path}')
+    event.listen(engine, 'connect',
+                 lambda connection, record: connection.execute(f'PRAGMA journal_mode={journal_mode}'))
+    db.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    timings = []
+    try:
+        for number in range(messages):
+            started = time.perf_counter()
+            session.add(db.MessageHistory('bench_b', 'bench_a', f'Сообщение {number}'))
+            session.commit()
+            timings.append(time.perf_counter() - started)
+    finally:
+        session.close()
+        engine.dispose()
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    return timings
+
+
+def write_behind(db, messages):
+    """
+    :param db: база данных клиента
+    :param messages: число сообщений
+
+    Функция, сохраняющая сообщения через очередь потока записи. Возвращает время каждого сохранения и время
+    до записи всех сообщений в базу данных
+    """
+
+    timings = []
+    burst_started = time.perf_counter()
+    for number in range(messages):
+        started = time.perf_counter()
+        db.save_message('bench_b', 'bench_a', f'Сообщение {number}')
+        timings.append(time.perf_counter() - started)
+    db.flush()
+    return timings, time.perf_counter() - burst_started
+
+
+if __name__ == '__main__':
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    synchronous = sys.argv[2] if len(sys.argv) > 2 else 'NORMAL'
+    db = ClientDB('bench_write_burst', synchronous=synchronous)
+    legacy_path = os.path.join(os.path.dirname(db.engine.url.database), 'client_base_bench_legacy.db3')
+    try:
+        print(f'Всплеск из {messages} сообщений')
+        report('commit в потоке интерфейса, DELETE', commit_each(db, legacy_path, 'DELETE', messages))
+        report('commit в потоке интерфейса, WAL', commit_each(db, legacy_path, 'WAL', messages))
+        timings, written = write_behind(db, messages)
+        report(f'очередь записи, WAL, {synchronous}', timings, f', записано за {written * 1000:.1f} мс')
+    finally:
+        db.close()
+        remove_database(db)
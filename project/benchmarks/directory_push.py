@@ -0,0 +1,139 @@
+"""
+Бенчмарк рассылки изменений списка пользователей: к серверу подключено множество клиентов, на сервере
+регистрируются новые пользователи. Прежние клиенты получают RESPONSE_205 и каждый раз заново запрашивают
+полные списки пользователей и контактов, клиенты с поддержкой версий получают только изменения.
+Измеряется время до обновления всех клиентов и объём переданных клиентам данных.
+
+Запуск из папки project: python benchmarks/directory_push.py [число клиентов] [пользователей в базе] [регистраций]
+"""
+
+import asyncio
+import binascii
+import hmac
+import os
+import sys
+import tempfile
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bench_utils import BENCH_PASSWORD_HASH, raise_open_files_limit, start_server
+from server_dist.server.common.utils import MessageStream
+from server_dist.server.common.variables import *
+from server_dist.server.server_files.core import MessageProcessor
+from server_dist.server.server_files.server_db import ServerDB
+
+BASE_PORT = 18000
+
+
+class DirectoryClient:
+    """
+    Класс асинхронного тестового клиента, поддерживающего список пользователей в актуальном состоянии
+    """
+
+    def __init__(self, name, features):
+        self.name = name
+        self.features = features
+        self.stream = MessageStream()
+        self.reader = None
+        self.writer = None
+        self.inbox = []
+        self.received_bytes = 0
+        self.version = 0
+        self.updated = None
+
+    async def connect(self, port):
+        self.reader, self.writer = await asyncio.open_connection('127.0.0.1', port)
+        self.send({ACTION: PRESENCE, TIME: time.time(), USER: {ACCOUNT_NAME: self.name, PUBLIC_KEY: 'bench-key'},
+                   FEATURES: self.features})
+        challenge = await self.receive()
+        self.stream.framed = FRAMING in challenge[FEATURES]
+        digest = hmac.new(BENCH_PASSWORD_HASH, challenge[BIN].encode('utf-8'), 'MD5').digest()
+        self.send({RESPONSE: 511, BIN: binascii.b2a_base64(digest).decode('ascii')})
+        await self.receive()
+        self.send({ACTION: GET_USERS, TIME: time.time(), ACCOUNT_NAME: self.name})
+        self.version = (await self.receive())[DIRECTORY_VERSION]
+
+    def send(self, message):
+        self.writer.write(self.stream.encode(message))
+
+    async def receive(self):
+        while not self.inbox:
+            data = await self.reader.read(RECV_BUFFER_SIZE)
+            if not data:
+                raise ConnectionError('Сервер закрыл соединение')
+            self.received_bytes += len(data)
+            self.inbox.extend(self.stream.feed(data))
+        return self.inbox.pop(0)
+
+    async def follow(self, target_version):
+        """
+        :param target_version: версия списка пользователей, до которой нужно обновиться
+
+        Метод, обрабатывающий сообщения сервера, пока список пользователей клиента не достигнет данной версии
+        """
+
+        while self.version < target_version:
+            message = await self.receive()
+            if message.get(ACTION) == DIRECTORY_UPDATE:
+                self.version = message[DIRECTORY_VERSION]
+            elif message.get(RESPONSE) == 205:
+                self.send({ACTION: GET_USERS, TIME: time.time(), ACCOUNT_NAME: self.name})
+                self.send({ACTION: GET_CONTACTS, TIME: time.time(), ACCOUNT_NAME: self.name})
+                self.version = (await self.receive())[DIRECTORY_VERSION]
+                await self.receive()
+        self.updated = time.perf_counter()
+
+
+async def run(port, db, server, clients, features, registrations, prefix):
+    """
+    :param port: порт сервера
+    :param db: база данных сервера
+    :param server: сервер
+    :param clients: число клиентов
+    :param features: возможности протокола, которые заявляют клиенты
+    :param registrations: число регистраций новых пользователей
+    :param prefix: префикс имён регистрируемых пользователей
+
+    Функция, подключающая клиентов и регистрирующая новых пользователей. Возвращает среднее время обновления
+    всех клиентов после одной регистрации и средний объём данных, полученных клиентами за одну регистрацию
+    """
+
+    load_clients = [DirectoryClient(f'bench_{i}', features) for i in range(clients)]
+    for client in load_clients:
+        await client.connect(port)
+    received_before = sum(client.received_bytes for client in load_clients)
+    elapsed = 0
+    for number in range(registrations):
+        started = time.perf_counter()
+        db.add_user(f'{prefix}_{number}', BENCH_PASSWORD_HASH)
+        server.service_update_lists()
+        await asyncio.gather(*(client.follow(db.get_directory_version()) for client in load_clients))
+        elapsed += max(client.updated for client in load_clients) - started
+    received = sum(client.received_bytes for client in load_clients) - received_before
+    for client in load_clients:
+        client.writer.close()
+    return elapsed / registrations, received / registrations
+
+
+if __name__ == '__main__':
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    registrations = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    clients = raise_open_files_limit(min(clients, users))
+    with tempfile.TemporaryDirectory() as directory:
+        db = ServerDB(os.path.join(directory, 'bench_db'))
+        for number in range(users):
+            db.add_user(f'bench_{number}', BENCH_PASSWORD_HASH)
+            db.user_login(f'bench_{number}', '127.0.0.1', 0, 'bench-key')
+            db.user_logout(f'bench_{number}')
+        print(f'Клиентов: {clients}, пользователей: {users}, регистраций: {registrations}')
+        for number, (mode, features) in enumerate((('RESPONSE_205', [FRAMING]),
+                                                    ('изменения', [FRAMING, DIRECTORY]))):
+            server = start_server(MessageProcessor, db, BASE_PORT + number)
+            elapsed, received = asyncio.run(run(BASE_PORT + number, db, server, clients, features, registrations,
+                                                f'new_{number}'))
+            server.stop()
+            server.join()
+            print(f'{mode:>13}: обновление всех клиентов {elapsed * 1000:.1f} мс, '
+                  f'получено клиентами {received / 1024:.0f} КиБ на регистрацию')
+        db.release_session()
+        db.engine.dispose()
@@ -0,0 +1,120 @@
+"""
+Нагрузочный тест, сравнивающий серверы MessageProcessor и AsyncMessageProcessor. Клиенты разбиваются на пары,
+в каждой паре один клиент отправляет сообщения другому. Измеряется пропускная способность сервера и задержка
+доставки сообщений.
+
+Запуск из папки project: python benchmarks/engine_load.py [число клиентов] [сообщений на пару]
+"""
+
+import asyncio
+import binascii
+import hmac
+import json
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bench_utils import BenchDB, BENCH_PASSWORD_HASH, raise_open_files_limit, start_server, percentile
+from server_dist.server.common.variables import *
+from server_dist.server.server_files.core import MessageProcessor
+from server_dist.server.server_files.async_core import AsyncMessageProcessor
+
+BASE_PORT = 17800
+decoder = json.JSONDecoder()
+
+
+class LoadClient:
+    """
+    Класс асинхронного тестового клиента, разбирающего склеенные в одном пакете сообщения
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.reader = None
+        self.writer = None
+        self.buffer = ''
+        self.inbox = []
+
+    async def connect(self, port):
+        self.reader, self.writer = await asyncio.open_connection('127.0.0.1', port)
+        self.send({ACTION: PRESENCE, TIME: time.time(), USER: {ACCOUNT_NAME: self.name, PUBLIC_KEY: 'bench-key'}})
+        challenge = await self.receive()
+        digest = hmac.new(BENCH_PASSWORD_HASH, challenge[BIN].encode('utf-8'), 'MD5').digest()
+        self.send({RESPONSE: 511, BIN: binascii.b2a_base64(digest).decode('ascii')})
+        answer = await self.receive()
+        if answer.get(RESPONSE) != 200:
+            raise RuntimeError(f'Не удалось авторизовать {self.name}: {answer}')
+
+    def send(self, message):
+        self.writer.write(json.dumps(message).encode(ENCODING))
+
+    async def receive(self):
+        while not self.inbox:
+            data = await self.reader.read(MAX_PACKAGE_LENGTH)
+            if not data:
+                raise ConnectionError('Сервер закрыл соединение')
+            self.buffer += data.decode(ENCODING)
+            while self.buffer:
+                message, end = decoder.raw_decode(self.buffer)
+                self.inbox.append(message)
+                self.buffer = self.buffer[end:]
+        return self.inbox.pop(0)
+
+
+async def run_pair(sender, receiver, messages, latencies):
+    """
+    :param sender: клиент-отправитель
+    :param receiver: клиент-получатель
+    :param messages: число сообщений
+    :param latencies: список, в который записываются задержки доставки
+
+    Функция, отправляющая сообщения от одного клиента другому
+    """
+
+    async def receive_all():
+        for _ in range(messages):
+            message = await receiver.receive()
+            latencies.append(time.perf_counter() - float(message[MESSAGE_TEXT]))
+
+    receiving = asyncio.create_task(receive_all())
+    for _ in range(messages):
+        sender.send({ACTION: MESSAGE, SENDER: sender.name, RECEIVER: receiver.name,
+                     TIME: time.time(), MESSAGE_TEXT: repr(time.perf_counter())})
+        await sender.receive()
+    await receiving
+
+
+async def load(port, clients, messages):
+    """
+    :param port: порт тестового сервера
+    :param clients: число клиентов
+    :param messages: число сообщений на пару клиентов
+
+    Функция, подключающая клиентов и запускающая обмен сообщениями во всех парах одновременно
+    """
+
+    load_clients = [LoadClient(f'bench_{i}') for i in range(clients)]
+    for client in load_clients:
+        await client.connect(port)
+    latencies = []
+    started = time.perf_counter()
+    await asyncio.gather(*(run_pair(load_clients[i], load_clients[i + 1], messages, latencies)
+                           for i in range(0, clients - 1, 2)))
+    elapsed = time.perf_counter() - started
+    for client in load_clients:
+        client.writer.close()
+    return len(latencies) / elapsed, percentile(latencies, 50), percentile(latencies, 99)
+
+
+if __name__ == '__main__':
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    messages = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    clients = raise_open_files_limit(clients)
+    print(f'{"сервер":>22} {"сообщ./с":>10} {"p50, мс":>10} {"p99, мс":>10}')
+    for number, server_class in enumerate((MessageProcessor, AsyncMessageProcessor)):
+        port = BASE_PORT + number
+        server = start_server(server_class, BenchDB(f'bench_{i}' for i in range(clients)), port)
+        throughput, p50, p99 = asyncio.run(load(port, clients, messages))
+        server.stop()
+        server.join()
+        print(f'{server_class.__name__:>22} {throughput:>10.0f} {p50 * 1000:>10.3f} {p99 * 1000:>10.3f}')
@@ -0,0 +1,108 @@
+"""
+Бенчмарк поиска по истории сообщений клиента: время поиска по полнотекстовому индексу (search_messages)
+и прежним способом - перебором всех сообщений запросом LIKE - при истории из миллиона сообщений со многими
+собеседниками. Слова сообщений выбираются из словаря с распределением Ципфа, поэтому среди запросов есть
+и редкие слова, и слова, встречающиеся в значительной части сообщений. Перебор останавливается на первых
+100 совпадениях без ранжирования, поэтому частые слова он находит быстро, а редкие - только просмотрев всю
+историю. Заполнение базы данных в замер не входит.
+
+Запуск из папки project: python benchmarks/history_search.py [число сообщений] [число повторов запроса]
+"""
+
+import datetime
+import itertools
+import os
+import random
+import statistics
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bench_utils import remove_database
+from client_dist.client.client_files.client_db import ClientDB
+
+VOCABULARY_SIZE = 50000
+CONTACTS = 200
+WORDS_PER_MESSAGE = (3, 15)
+BATCH_SIZE = 50000
+
+
+def make_vocabulary(size):
+    """
+    :param size: размер словаря
+
+    Функция, создающая словарь псевдослов и накопленные веса слов по закону Ципфа
+    """
+
+    letters = 'абвгдежзиклмнопрстуфхцчшэюя'
+    words = list(dict.fromkeys(''.join(random.choice(letters) for _ in range(random.randint(3, 10)))
+                               for _ in range(size * 2)))[:size]
+    return words, list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+
+
+def fill_history(db, messages, words, weights):
+    """
+    :param db: база данных клиента
+    :param messages: число сообщений
+    :param words: словарь
+    :param weights: накопленные веса слов словаря
+
+    Функция, заполняющая историю сообщений пачками в одной транзакции на пачку
+    """
+
+    started = datetime.datetime(2022, 1, 1)
+    connection = db.engine.raw_connection()
+    try:
+        for first in range(0, messages, BATCH_SIZE):
+            rows = []
+            for number in range(first, min(first + BATCH_SIZE, messages)):
+                contact = f'contact_{random.randrange(CONTACTS)}'
+                sender, receiver = ('bench', contact) if number % 2 else (contact, 'bench')
+                text = ' '.join(random.choices(words, cum_weights=weights, k=random.randint(*WORDS_PER_MESSAGE)))
+                rows.append((sender, receiver, text, str(started + datetime.timedelta(seconds=number))))
+            connection.execute('BEGIN')
+            connection.executemany(
+                'INSERT INTO message_history (sender, receiver, message, time) VALUES (?, ?, ?, ?)', rows)
+            connection.execute('COMMIT')
+    finally:
+        connection.close()
+
+
+def measure(search, repeats):
+    """
+    :param search: выполняемый поиск
+    :param repeats: число повторов
+
+    Функция, возвращающая медианное время поиска в миллисекундах и число найденных сообщений
+    """
+
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        found = search()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000, len(found)
+
+
+if __name__ == '__main__':
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    random.seed(1)
+    words, weights = make_vocabulary(VOCABULARY_SIZE)
+    db = ClientDB('bench_search')
+    try:
+        started = time.perf_counter()
+        fill_history(db, messages, words, weights)
+        print(f'Заполнение {messages} сообщений с индексацией: {time.perf_counter() - started:.1f} с')
+        history = db.MessageHistory
+        queries = [('частое слово', words[0]), ('среднее слово', words[100]), ('редкое слово', words[20000]),
+                   ('два слова', f'{words[5]} {words[50]}'), ('три слова', f'{words[2]} {words[30]} {words[300]}'),
+                   ('нет совпадений', 'йцукен')]
+        for title, query in queries:
+            indexed, found = measure(lambda: db.search_messages(query), repeats)
+            scan, _ = measure(lambda: db.session.query(history).filter(
+                *(history.message.like(f'%{word}%') for word in query.split())).limit(100).all(), 1)
+            print(f'{title:>15} ({query}): индекс {indexed:>7.2f} мс ({found} найдено), '
+                  f'перебор LIKE {scan:>8.1f} мс')
+    finally:
+        db.close()
+        remove_database(db)
@@ -0,0 +1,67 @@
+"""
+Микробенчмарк декоратора log: затраты на один вызов функции без декоратора, с прежним декоратором
+(f-строка с параметрами собиралась при каждом вызове) и с текущим декоратором при выключенном уровне DEBUG,
+при включённом уровне и при записи каждого сотого вызова. Функция получает сокет и словарь сообщения,
+как send_message. Записи уходят в обработчик, который ничего не делает, поэтому измеряются только затраты
+декоратора и логгера.
+
+Запуск из папки project: python benchmarks/log_overhead.py [число повторений]
+"""
+
+import logging
+import os
+import socket
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from server_dist.server.common.decos import log, logger
+from server_dist.server.common.variables import *
+
+
+def old_log(func_to_log):
+    """
+    :param func_to_log: функция для декорирования
+    Прежний вариант декоратора log
+    """
+
+    def log_saver(*args, **kwargs):
+        logger.debug(f'Была вызвана функция {func_to_log.__name__} c параметрами {args} , {kwargs}. Вызов из модуля {func_to_log.__module__}')
+        ret = func_to_log(*args, **kwargs)
+        return ret
+    return log_saver
+
+
+def send(sock, message, framed=False):
+    return message
+
+
+def per_call(func, args, repeat):
+    """
+    :param func: измеряемая функция
+    :param args: аргументы вызова
+    :param repeat: число вызовов
+
+    Функция, возвращающая время одного вызова в наносекундах
+    """
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func(*args)
+    return (time.perf_counter() - started) / repeat * 1e9
+
+
+if __name__ == '__main__':
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    logger.handlers = [logging.NullHandler()]
+    logger.propagate = False
+    sock = socket.socket()
+    args = (sock, {ACTION: MESSAGE, SENDER: 'bench_a', RECEIVER: 'bench_b', TIME: time.time(),
+                   MESSAGE_TEXT: os.urandom(128)}, True)
+    variants = [('без декоратора', send), ('прежний', old_log(send)), ('текущий', log(send)),
+                ('текущий, 1%', log(sample_rate=0.01)(send))]
+    for level in (logging.INFO, logging.DEBUG):
+        logger.setLevel(level)
+        print(f'Уровень логирования {logging.getLevelName(level)}:')
+        for title, func in variants:
+            print(f'  {title:>15}: {per_call(func, args, repeat):>8.0f} нс на вызов')
+    sock.close()
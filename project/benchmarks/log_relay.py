@@ -0,0 +1,154 @@
+"""
+Бенчмарк пересылки сообщений через сервер с разными способами логирования: логирование выключено (уровень
+WARNING), записи уровня DEBUG пишутся в файл в потоке сервера обычным обработчиком и те же записи передаются
+в очередь потока записи логов (DroppingQueueHandler и BatchQueueListener). Отправитель передаёт сообщения
+конвейером, сервер пишет в лог по две записи на сообщение. Для асинхронного варианта выводится и число
+отброшенных при переполнении очереди записей. Каждый вариант запускается с файлом без задержки и с задержкой
+сброса файла на диск, имитирующей медленный диск.
+
+Запуск из папки project: python benchmarks/log_relay.py [число сообщений] [задержка сброса в мс]
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bench_utils import BenchDB, login, start_server
+from server_dist.server.common.log_queue import BatchFileHandler, BatchQueueListener, DroppingQueueHandler, \
+    LogBuffer
+from server_dist.server.common.utils import MessageStream, JSON_CODEC
+from server_dist.server.common.variables import *
+from server_dist.server.server_files.core import MessageProcessor
+
+BASE_PORT = 18100
+CIPHERTEXT = os.urandom(128)
+FORMATTER = logging.Formatter('%(asctime)s %(levelname)s %(filename)s %(message)s')
+logger = logging.getLogger('server_dist')
+
+
+class SlowStream:
+    """
+    Класс файла, сброс которого на диск занимает заданное время
+    """
+
+    def __init__(self, stream, latency):
+        self.stream = stream
+        self.latency = latency
+
+    def write(self, data):
+        return self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+        time.sleep(self.latency)
+
+    def close(self):
+        self.stream.close()
+
+
+def open_handler(handler_class, path, latency):
+    handler = handler_class(path, encoding='utf8')
+    handler.setFormatter(FORMATTER)
+    if latency:
+        handler.stream = SlowStream(handler.stream, latency)
+    return handler
+
+
+def relay(port, messages):
+    """
+    :param port: порт тестового сервера
+    :param messages: число сообщений
+
+    Функция, пересылающая сообщения от одного клиента другому и возвращающая число сообщений в секунду
+    """
+
+    server = start_server(MessageProcessor, BenchDB(['bench_a', 'bench_b']), port)
+    sender = login(port, 'bench_a', True)
+    receiver = login(port, 'bench_b', True)
+    sender.settimeout(None)
+    receiver.settimeout(None)
+    received = [0]
+
+    def receive():
+        stream = MessageStream(True)
+        while received[0] < messages:
+            data = receiver.recv(RECV_BUFFER_SIZE)
+            if not data:
+                break
+            received[0] += sum(1 for message in stream.feed(data) if message.get(ACTION) == MESSAGE)
+
+    def drain_responses():
+        try:
+            while sender.recv(RECV_BUFFER_SIZE):
+                pass
+        except OSError:
+            pass
+
+    reader = threading.Thread(target=receive)
+    threading.Thread(target=drain_responses, daemon=True).start()
+    sender_stream = MessageStream(True, JSON_CODEC)
+    reader.start()
+    started = time.perf_counter()
+    for _ in range(messages):
+        sender.sendall(sender_stream.encode({ACTION: MESSAGE, SENDER: 'bench_a', RECEIVER: 'bench_b',
+                                             TIME: time.time(), MESSAGE_TEXT: CIPHERTEXT}))
+    reader.join(60)
+    elapsed = time.perf_counter() - started
+
+    for sock in (sender, receiver):
+        sock.close()
+    server.stop()
+    server.join()
+    return received[0] / elapsed
+
+
+def run_off(port, messages, path, latency):
+    logger.setLevel(logging.WARNING)
+    return relay(port, messages), ''
+
+
+def run_sync(port, messages, path, latency):
+    handler = open_handler(logging.FileHandler, path, latency)
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    try:
+        return relay(port, messages), ''
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
+
+
+def run_async(port, messages, path, latency):
+    handler = open_handler(BatchFileHandler, path, latency)
+    log_queue = LogBuffer(LOG_QUEUE_SIZE)
+    listener = BatchQueueListener(log_queue, handler)
+    queue_handler = DroppingQueueHandler(log_queue)
+    dropped = []
+    queue_handler.count_dropped = lambda record: dropped.append(record.levelname)
+    logger.addHandler(queue_handler)
+    logger.setLevel(logging.DEBUG)
+    listener.start()
+    try:
+        return relay(port, messages), f', отброшено записей: {len(dropped)}'
+    finally:
+        logger.removeHandler(queue_handler)
+        listener.stop()
+        handler.close()
+
+
+if __name__ == '__main__':
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    slow_latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.001
+    logger.propagate = False
+    variants = [('выключено', run_off), ('в потоке сервера', run_sync), ('асинхронно', run_async)]
+    port = BASE_PORT
+    with tempfile.TemporaryDirectory() as directory:
+        for latency in (0, slow_latency):
+            print(f'Задержка сброса файла: {latency * 1000:.1f} мс')
+            for title, run in variants:
+                throughput, note = run(port, messages, os.path.join(directory, f'{port}.log'), latency)
+                print(f'  {title:>16}: {throughput:>8.0f} сообщ./с{note}')
+                port += 1
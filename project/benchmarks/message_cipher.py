@@ -0,0 +1,73 @@
+"""
+Бенчмарк шифрования сообщений клиента: число операций шифрования и расшифровки в секунду для сообщений
+100 байт, 10 КБ и 1 МБ. Прежняя схема шифрует текст ключом RSA-2048 (PKCS1_OAEP), поэтому подходит только
+для сообщений до 190 байт и требует операции с закрытым ключом на каждое сообщение. Новая схема шифрует
+текст AES-GCM сеансовым ключом собеседника; отдельно измеряется первое сообщение сеанса, когда сеансовый
+ключ создаётся и расшифровывается закрытым ключом.
+
+Запуск из папки project: python benchmarks/message_cipher.py [время измерения одного варианта в секундах]
+"""
+
+import os
+import sys
+import time
+from Cryptodome.Cipher import PKCS1_OAEP
+from Cryptodome.PublicKey import RSA
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from client_dist.client.client_files.message_cipher import MessageCipher
+
+SIZES = (100, 10 * 1024, 1024 * 1024)
+RSA_LIMIT = 190
+
+
+def measure(operation, duration):
+    """
+    :param operation: измеряемая операция
+    :param duration: время измерения в секундах
+
+    Функция, возвращающая число выполнений операции в секунду
+    """
+
+    count = 0
+    started = time.perf_counter()
+    while True:
+        operation()
+        count += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= duration:
+            return count / elapsed
+
+
+if __name__ == '__main__':
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 1
+    sender_keys, receiver_keys = RSA.generate(2048), RSA.generate(2048)
+    receiver_public = receiver_keys.publickey().export_key().decode('ascii')
+    encryptor = PKCS1_OAEP.new(RSA.import_key(receiver_public))
+    decrypter = PKCS1_OAEP.new(receiver_keys)
+    sender = MessageCipher('bench_a', sender_keys)
+    receiver = MessageCipher('bench_b', receiver_keys)
+
+    def rsa_round(data):
+        assert decrypter.decrypt(encryptor.encrypt(data)) == data
+
+    def hybrid_round(data):
+        assert receiver.decrypt('bench_a', sender.encrypt('bench_b', receiver_public, data)) == data
+
+    def first_message(data):
+        sender.forget('bench_b')
+        receiver.received.clear()
+        hybrid_round(data)
+
+    for size in SIZES:
+        data = os.urandom(size)
+        print(f'Сообщение {size} байт, шифрование и расшифровка:')
+        if size <= RSA_LIMIT:
+            rate = measure(lambda: rsa_round(data), duration)
+            print(f'  {"RSA-2048":>18}: {rate:>9.0f} оп./с')
+        else:
+            print(f'  {"RSA-2048":>18}: не помещается в один блок RSA')
+        rate = measure(lambda: first_message(data), duration)
+        print(f'  {"новый сеанс":>18}: {rate:>9.0f} оп./с')
+        rate = measure(lambda: hybrid_round(data), duration)
+        print(f'  {"сеансовый ключ":>18}: {rate:>9.0f} оп./с, {rate * size / 1024 / 1024:>8.1f} МБ/с, '
+              f'{1e6 / rate:.0f} мкс на сообщение')
@@ -0,0 +1,111 @@
+"""
+Бенчмарк передачи сообщений, сохранённых для отключённого пользователя: в базу сервера записывается очередь
+сообщений, после чего пользователь входит на сервер и принимает их. Одновременно другой клиент запрашивает
+список пользователей, чтобы показать, что передача большой очереди не останавливает обслуживание остальных.
+
+Запуск из папки project: python benchmarks/offline_drain.py [число сообщений]
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bench_utils import BENCH_PASSWORD_HASH, start_server, login, percentile
+from server_dist.server.common.utils import MessageStream, get_message, send_message
+from server_dist.server.common.variables import *
+from server_dist.server.server_files.core import MessageProcessor
+from server_dist.server.server_files.async_core import AsyncMessageProcessor
+from server_dist.server.server_files.server_db import ServerDB
+
+BASE_PORT = 17900
+
+
+def fill_queue(db, count):
+    """
+    :param db: база данных сервера
+    :param count: число сообщений
+
+    Функция, записывающая в базу очередь сообщений для пользователя bench_b
+    """
+
+    receiver = db.get_user_id('bench_b')
+    db.session.bulk_insert_mappings(db.OfflineMessage, [
+        {'receiver': receiver, 'message': json.dumps({ACTION: MESSAGE, SENDER: 'bench_a', RECEIVER: 'bench_b',
+                                                      TIME: time.time(), MESSAGE_TEXT: f'{number:064d}'})}
+        for number in range(count)])
+    db.session.commit()
+
+
+def probe(port, stop_event, latencies):
+    """
+    :param port: порт сервера
+    :param stop_event: событие остановки
+    :param latencies: список для задержек ответа
+
+    Функция потока клиента, измеряющего задержку ответа сервера во время передачи очереди
+    """
+
+    sock = login(port, 'bench_c', framed=True)
+    while not stop_event.is_set():
+        started = time.perf_counter()
+        send_message(sock, {ACTION: GET_USERS, TIME: time.time(), ACCOUNT_NAME: 'bench_c'}, True)
+        get_message(sock, True)
+        latencies.append(time.perf_counter() - started)
+        time.sleep(0.001)
+    sock.close()
+
+
+def drain(server_class, port, db, count):
+    """
+    :param server_class: класс сервера
+    :param port: порт тестового сервера
+    :param db: база данных сервера
+    :param count: число сообщений в очереди
+
+    Функция, возвращающая скорость передачи очереди (сообщ./с) и задержки ответа другому клиенту
+    """
+
+    fill_queue(db, count)
+    server = start_server(server_class, db, port)
+    latencies = []
+    stop_event = threading.Event()
+    prober = threading.Thread(target=probe, args=(port, stop_event, latencies))
+    prober.start()
+    time.sleep(0.2)
+
+    started = time.perf_counter()
+    sock = login(port, 'bench_b', framed=True)
+    stream = MessageStream(framed=True)
+    received = 0
+    while received < count:
+        data = sock.recv(RECV_BUFFER_SIZE)
+        if not data:
+            break
+        received += len(stream.feed(data))
+    elapsed = time.perf_counter() - started
+
+    stop_event.set()
+    prober.join()
+    sock.close()
+    server.stop()
+    server.join()
+    left = db.count_offline_messages('bench_b')
+    return received / elapsed, received, left, latencies
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with tempfile.TemporaryDirectory() as directory:
+        db = ServerDB(os.path.join(directory, 'bench_db'))
+        for name in ('bench_a', 'bench_b', 'bench_c'):
+            db.add_user(name, BENCH_PASSWORD_HASH)
+        for number, server_class in enumerate((MessageProcessor, AsyncMessageProcessor)):
+            throughput, received, left, latencies = drain(server_class, BASE_PORT + number, db, count)
+            print(f'{server_class.__name__:>21}: {throughput:>8.0f} сообщ./с, получено {received} из {count}, '
+                  f'осталось в базе {left}; ответ другому клиенту p50 {percentile(latencies, 50) * 1000:.1f} мс, '
+                  f'max {max(latencies) * 1000:.1f} мс')
+        db.release_session()
+        db.engine.dispose()
@@ -0,0 +1,95 @@
+"""
+Проверка одновременной передачи сохранённых сообщений многим пользователям сервером MessageProcessor: для каждого
+из 400 пользователей в базу сервера записывается очередь из 1000 сообщений, после чего пользователи входят
+на сервер один за другим, не дожидаясь окончания передачи очередей предыдущим. Сообщения передаются по одному
+на страницу, поэтому передача каждой очереди занимает много шагов цикла сервера, и следующие страницы сотен
+пользователей планируются на одном шаге цикла. Все пользователи должны войти и получить все свои сообщения:
+если планирование страниц будит селектор через сокет пробуждения, цикл сервера блокируется на записи
+в переполненный сокет и очередной вход не завершается.
+
+Запуск из папки project: python benchmarks/offline_drain_storm.py [число пользователей] [сообщений на пользователя]
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bench_utils import BENCH_PASSWORD_HASH, login, raise_open_files_limit, start_server
+from server_dist.server.common.utils import MessageStream
+from server_dist.server.common.variables import *
+from server_dist.server.server_files.core import MessageProcessor
+from server_dist.server.server_files.server_db import ServerDB
+
+BASE_PORT = 18600
+
+
+def fill_queues(db, users, count):
+    """
+    :param db: база данных сервера
+    :param users: имена пользователей
+    :param count: число сообщений на пользователя
+
+    Функция, записывающая в базу очереди сообщений для пользователей
+    """
+
+    for name in users:
+        receiver = db.get_user_id(name)
+        db.session.bulk_insert_mappings(db.OfflineMessage, [
+            {'receiver': receiver, 'message': json.dumps({ACTION: MESSAGE, SENDER: 'bench_sender', RECEIVER: name,
+                                                          TIME: time.time(), MESSAGE_TEXT: f'{number:016d}'})}
+            for number in range(count)])
+    db.session.commit()
+
+
+def storm(server_class, port, db, users, count):
+    """
+    :param server_class: класс сервера
+    :param port: порт тестового сервера
+    :param db: база данных сервера
+    :param users: имена пользователей
+    :param count: число сообщений на пользователя
+
+    Функция, возвращающая время входа всех пользователей, время до получения всех сообщений и число
+    полученных сообщений
+    """
+
+    fill_queues(db, users, count)
+    server = start_server(server_class, db, port)
+    server.offline_page_size = 1
+    started = time.perf_counter()
+    sockets = [login(port, name, framed=True) for name in users]
+    logged_in = time.perf_counter() - started
+    received = 0
+    for sock in sockets:
+        stream = MessageStream(framed=True)
+        messages = 0
+        while messages < count:
+            data = sock.recv(RECV_BUFFER_SIZE)
+            if not data:
+                break
+            messages += sum(message.get(ACTION) == MESSAGE for message in stream.feed(data))
+        received += messages
+    elapsed = time.perf_counter() - started
+    for sock in sockets:
+        sock.close()
+    server.stop()
+    server.join()
+    return logged_in, elapsed, received
+
+
+if __name__ == '__main__':
+    users_count = raise_open_files_limit(int(sys.argv[1]) if len(sys.argv) > 1 else 400)
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    users = [f'bench_{number}' for number in range(users_count)]
+    with tempfile.TemporaryDirectory() as directory:
+        db = ServerDB(os.path.join(directory, 'bench_db'))
+        for name in users + ['bench_sender']:
+            db.add_user(name, BENCH_PASSWORD_HASH)
+        logged_in, elapsed, received = storm(MessageProcessor, BASE_PORT, db, users, count)
+        assert received == users_count * count, received
+        print(f'{users_count} пользователей вошли за {logged_in:.1f} с, '
+              f'получено {received} из {users_count * count} сообщений за {elapsed:.1f} с')
+        db.release_session()
+        db.engine.dispose()
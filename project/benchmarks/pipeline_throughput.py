@@ -0,0 +1,88 @@
+"""
+Бенчмарк отправки большого числа сообщений одним клиентом ClientTransport: по одному запросу с ожиданием
+ответа сервера и конвейером, когда следующие запросы отправляются, не дожидаясь ответов на предыдущие
+(ответы сопоставляются с запросами по идентификатору). Для наглядности к каждому приёму данных сервером
+можно добавить задержку, имитирующую время прохождения сети.
+
+Запуск из папки project: python benchmarks/pipeline_throughput.py [число сообщений] [задержка сети, мс]
+"""
+
+import os
+import sys
+import threading
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from Cryptodome.PublicKey import RSA
+from PyQt5.QtCore import Qt
+from bench_utils import PASSWORD, PasswordDB, MemoryClientDB, start_server
+from server_dist.server.common.variables import *
+from server_dist.server.server_files.core import MessageProcessor
+from client_dist.client.client_files.transport import ClientTransport
+
+BASE_PORT = 18060
+PAYLOAD = os.urandom(256)
+
+
+class DelayedMessageProcessor(MessageProcessor):
+    """
+    Класс сервера, задерживающего обработку каждого приёма данных на время прохождения сети
+    """
+
+    delay = 0
+
+    def read_client(self, client):
+        if self.delay:
+            time.sleep(self.delay)
+        super().read_client(client)
+
+
+def run(port, messages, pipelined):
+    """
+    :param port: порт тестового сервера
+    :param messages: число сообщений
+    :param pipelined: отправлять ли сообщения конвейером
+
+    Функция, отправляющая сообщения от одного клиента другому и возвращающая число сообщений в секунду
+    """
+
+    server = start_server(DelayedMessageProcessor, PasswordDB(['bench_a', 'bench_b']), port)
+    keys = RSA.generate(1024, os.urandom)
+    sender = ClientTransport(port, '127.0.0.1', 'bench_a', MemoryClientDB(), PASSWORD, keys)
+    receiver = ClientTransport(port, '127.0.0.1', 'bench_b', MemoryClientDB(), PASSWORD, keys)
+    received = []
+    delivered = threading.Event()
+
+    def on_message(message):
+        received.append(message)
+        if len(received) == messages:
+            delivered.set()
+
+    receiver.new_message.connect(on_message, Qt.DirectConnection)
+    sender.start()
+    receiver.start()
+
+    started = time.perf_counter()
+    if pipelined:
+        responses = [sender.send_message_async('bench_b', PAYLOAD) for _ in range(messages)]
+        for response in responses:
+            sender.process_response_ans(response.result(timeout=60))
+    else:
+        for _ in range(messages):
+            sender.send_message('bench_b', PAYLOAD)
+    delivered.wait(60)
+    elapsed = time.perf_counter() - started
+
+    for transport in (sender, receiver):
+        transport.transport_shutdown()
+        transport.join()
+    server.stop()
+    server.join()
+    return len(received) / elapsed
+
+
+if __name__ == '__main__':
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    DelayedMessageProcessor.delay = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0
+    for number, (mode, pipelined) in enumerate((('по одному', False), ('конвейер', True))):
+        throughput = run(BASE_PORT + number, messages, pipelined)
+        print(f'{mode:>10}: {throughput:>8.0f} сообщ./с, {throughput * len(PAYLOAD) / 1024 / 1024:.2f} МиБ/с')
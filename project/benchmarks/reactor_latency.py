@@ -0,0 +1,57 @@
+"""
+Бенчмарк задержки доставки сообщений сервером при 10, 1000 и 10000 подключённых клиентов.
+Два клиента обмениваются сообщениями, остальные держат простаивающие соединения.
+
+Запуск из папки project: python benchmarks/reactor_latency.py
+"""
+
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bench_utils import BenchDB, raise_open_files_limit, start_server, login, percentile
+from server_dist.server.common.utils import get_message, send_message
+from server_dist.server.common.variables import *
+from server_dist.server.server_files.core import MessageProcessor
+
+CONNECTIONS = (10, 1000, 10000)
+MESSAGES = 2000
+BASE_PORT = 17700
+
+
+def measure(connections, port):
+    """
+    :param connections: общее число подключённых клиентов
+    :param port: порт тестового сервера
+
+    Функция, измеряющая задержку доставки сообщения от одного клиента другому
+    """
+
+    names = [f'bench_{i}' for i in range(connections)]
+    server = start_server(MessageProcessor, BenchDB(names), port)
+    sockets = [login(port, name) for name in names]
+    sender, receiver = sockets[0], sockets[1]
+
+    latencies = []
+    for _ in range(MESSAGES):
+        started = time.perf_counter()
+        send_message(sender, {ACTION: MESSAGE, SENDER: names[0], RECEIVER: names[1],
+                              TIME: time.time(), MESSAGE_TEXT: 'x' * 64})
+        get_message(receiver)
+        latencies.append(time.perf_counter() - started)
+        get_message(sender)
+
+    for sock in sockets:
+        sock.close()
+    server.stop()
+    server.join()
+    return percentile(latencies, 50), percentile(latencies, 99)
+
+
+if __name__ == '__main__':
+    max_connections = raise_open_files_limit(max(CONNECTIONS))
+    print(f'{"клиентов":>10} {"p50, мс":>10} {"p99, мс":>10}')
+    for number, connections in enumerate(CONNECTIONS):
+        connections = min(connections, max_connections)
+        p50, p99 = measure(connections, BASE_PORT + number)
+        print(f'{connections:>10} {p50 * 1000:>10.3f} {p99 * 1000:>10.3f}')
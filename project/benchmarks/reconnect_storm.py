@@ -0,0 +1,123 @@
+"""
+Бенчмарк повторного подключения большого числа клиентов после перезапуска сервера. Клиенты один раз входят
+с проверкой пароля и получают токены возобновления сессии, после чего сервер перезапускается и все клиенты
+подключаются одновременно: сначала с полной проверкой пароля (с вычислением PBKDF2 на стороне клиента, как
+в ClientTransport), затем по токенам. Измеряется время до авторизации всех клиентов.
+
+Запуск из папки project: python benchmarks/reconnect_storm.py [число клиентов]
+"""
+
+import asyncio
+import binascii
+import hashlib
+import hmac
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bench_utils import BenchDB, raise_open_files_limit, start_server, percentile
+from server_dist.server.common.utils import MessageStream
+from server_dist.server.common.variables import *
+from server_dist.server.server_files.core import MessageProcessor
+from server_dist.server.server_files.async_core import AsyncMessageProcessor
+from server_dist.server.server_files.session_tokens import SessionTokens
+
+BASE_PORT = 17950
+PASSWORD = 'bench'
+
+
+def password_hash():
+    """
+    Функция, вычисляющая хэш пароля так же, как ClientTransport. Чтобы сервер не пересчитывал хэши,
+    у всех тестовых пользователей одинаковая соль
+    """
+
+    return binascii.hexlify(hashlib.pbkdf2_hmac('sha512', PASSWORD.encode('utf-8'), b'bench', 10000))
+
+
+class StormDB(BenchDB):
+    """
+    Класс тестовой базы данных, у всех пользователей которой пароль PASSWORD
+    """
+
+    def __init__(self, users):
+        super().__init__(users)
+        self.hash = password_hash()
+
+    def get_hash(self, name):
+        return self.hash
+
+
+async def connect(port, name, token):
+    """
+    :param port: порт сервера
+    :param name: имя пользователя
+    :param token: токен возобновления сессии или None
+
+    Функция, подключающая клиента и проходящая авторизацию. Возвращает новый токен, время авторизации
+    и соединение
+    """
+
+    started = time.perf_counter()
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    stream = MessageStream()
+    presence = {ACTION: PRESENCE, TIME: time.time(), USER: {ACCOUNT_NAME: name, PUBLIC_KEY: 'bench-key'}}
+    if token:
+        presence[SESSION_TOKEN] = token
+
+    async def receive():
+        messages = []
+        while not messages:
+            data = await reader.read(RECV_BUFFER_SIZE)
+            if not data:
+                raise ConnectionError('Сервер закрыл соединение')
+            messages = stream.feed(data)
+        return messages[0]
+
+    writer.write(stream.encode(presence))
+    answer = await receive()
+    if answer[RESPONSE] == 511:
+        secret = await asyncio.get_running_loop().run_in_executor(None, password_hash)
+        digest = hmac.new(secret, answer[BIN].encode('utf-8'), 'MD5').digest()
+        writer.write(stream.encode({RESPONSE: 511, BIN: binascii.b2a_base64(digest).decode('ascii')}))
+        answer = await receive()
+    if answer[RESPONSE] != 200:
+        raise RuntimeError(f'Не удалось авторизовать {name}: {answer}')
+    return answer[SESSION_TOKEN], time.perf_counter() - started, writer
+
+
+async def storm(port, names, tokens):
+    """
+    :param port: порт сервера
+    :param names: имена пользователей
+    :param tokens: словарь токенов пользователей (пустой - вход с проверкой пароля)
+
+    Функция, одновременно подключающая всех клиентов. Возвращает время до авторизации всех клиентов,
+    задержки авторизации и новые токены
+    """
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(connect(port, name, tokens.get(name)) for name in names))
+    elapsed = time.perf_counter() - started
+    for _, _, writer in results:
+        writer.close()
+    return elapsed, [latency for _, latency, _ in results], {name: result[0] for name, result in zip(names, results)}
+
+
+if __name__ == '__main__':
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    clients = raise_open_files_limit(clients)
+    names = [f'bench_{i}' for i in range(clients)]
+    print(f'Клиентов: {clients}')
+    for number, server_class in enumerate((MessageProcessor, AsyncMessageProcessor)):
+        db = StormDB(names)
+        session_tokens = SessionTokens()
+        tokens = {}
+        for mode in ('пароль', 'токен'):
+            server = start_server(server_class, db, BASE_PORT + number, session_tokens=session_tokens)
+            elapsed, latencies, new_tokens = asyncio.run(storm(BASE_PORT + number, names, tokens))
+            server.stop()
+            server.join()
+            print(f'{server_class.__name__:>21}, вход по {mode}: все авторизованы за {elapsed:.2f} с, '
+                  f'p50 {percentile(latencies, 50) * 1000:.0f} мс, p99 {percentile(latencies, 99) * 1000:.0f} мс')
+            tokens = new_tokens
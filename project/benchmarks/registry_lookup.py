@@ -0,0 +1,89 @@
+"""
+Микробенчмарк реестра подключений сервера: поиск имени пользователя по сокету (проверка входа в login_required),
+поиск сокета по имени, проверка подключения и удаление клиента. Прежний способ - перебор словаря имён и поиск
+в списке клиентов - сравнивается с реестром ConnectionRegistry при 10 000 и 100 000 подключений.
+
+Запуск из папки project: python benchmarks/registry_lookup.py [число повторений]
+"""
+
+import os
+import random
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from server_dist.server.server_files.registry import ConnectionRegistry
+
+
+class FakeSocket:
+    """
+    Класс подключения для бенчмарка: объект с номером файлового дескриптора
+    """
+
+    def __init__(self, fileno):
+        self.number = fileno
+
+    def fileno(self):
+        return self.number
+
+
+def rate(func, args):
+    """
+    :param func: измеряемая функция
+    :param args: список аргументов, с каждым из которых функция вызывается один раз
+
+    Функция, возвращающая число вызовов в секунду
+    """
+
+    started = time.perf_counter()
+    for arg in args:
+        func(arg)
+    return len(args) / (time.perf_counter() - started)
+
+
+def old_name_of(names, sock):
+    for name in names:
+        if names[name] == sock:
+            return name
+
+
+def measure(size, repeat):
+    """
+    :param size: число подключений
+    :param repeat: число поисков
+
+    Функция, возвращающая скорость операций со списком и словарём имён и с реестром
+    """
+
+    sockets = [FakeSocket(fileno) for fileno in range(size)]
+    clients = list(sockets)
+    names = {f'user_{number}': sock for number, sock in enumerate(sockets)}
+    registry = ConnectionRegistry()
+    for number, sock in enumerate(sockets):
+        registry.add(sock)
+        registry.bind(f'user_{number}', sock)
+
+    targets = random.sample(sockets, repeat)
+    target_names = [f'user_{sock.fileno()}' for sock in targets]
+    results = {
+        'имя по сокету': (rate(lambda sock: old_name_of(names, sock), targets), rate(registry.name_of, targets)),
+        'сокет по имени': (rate(names.get, target_names), rate(registry.socket_of, target_names)),
+        'проверка подключения': (rate(clients.__contains__, targets), rate(registry.__contains__, targets)),
+    }
+
+    def old_remove(sock):
+        old_name = old_name_of(names, sock)
+        del names[old_name]
+        clients.remove(sock)
+
+    results['удаление клиента'] = (rate(old_remove, targets), rate(registry.remove, targets))
+    return results
+
+
+if __name__ == '__main__':
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    random.seed(0)
+    for size in (10000, 100000):
+        print(f'Подключений: {size}')
+        for operation, (old_rate, new_rate) in measure(size, repeat).items():
+            print(f'  {operation:>20}: перебор {old_rate:>12.0f} оп./с, реестр {new_rate:>12.0f} оп./с '
+                  f'(x{new_rate / old_rate:.1f})')
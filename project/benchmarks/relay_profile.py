@@ -0,0 +1,119 @@
+"""
+Профилирующий бенчмарк пересылки сообщений сервером: процессорное время потока сервера на одно сообщение
+при обычной обработке (сообщение декодируется, проверяется и кодируется заново) и при пересылке
+кадров-конвертов без разбора. С ключом --cprofile для каждого варианта выводятся функции сервера,
+занимающие больше всего времени.
+
+Запуск из папки project: python benchmarks/relay_profile.py [число сообщений] [--cprofile]
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bench_utils import BenchDB, login, start_server
+from server_dist.server.common.utils import CODECS_AVAILABLE, MessageStream, get_codec
+from server_dist.server.common.variables import *
+from server_dist.server.server_files.core import MessageProcessor
+
+BASE_PORT = 18080
+CIPHERTEXT = os.urandom(128)
+
+
+class ProfiledMessageProcessor(MessageProcessor):
+    """
+    Класс сервера, подсчитывающего процессорное время, затраченное на обработку принятых данных
+    """
+
+    profile = False
+
+    def run(self):
+        self.cpu_time = 0
+        self.profiler = cProfile.Profile() if self.profile else None
+        super().run()
+
+    def read_client(self, client):
+        started = time.thread_time()
+        if self.profiler:
+            self.profiler.enable()
+        super().read_client(client)
+        if self.profiler:
+            self.profiler.disable()
+        self.cpu_time += time.thread_time() - started
+
+
+def run(port, messages, codec_name, envelope):
+    """
+    :param port: порт тестового сервера
+    :param messages: число сообщений
+    :param codec_name: название формата сериализации
+    :param envelope: отправлять ли сообщения кадрами-конвертами
+
+    Функция, пересылающая сообщения от одного клиента другому и возвращающая процессорное время сервера
+    на одно сообщение в микросекундах и сервер
+    """
+
+    server = start_server(ProfiledMessageProcessor, BenchDB(['bench_a', 'bench_b']), port)
+    codec = get_codec(codec_name)
+    sender = login(port, 'bench_a', True, codec_name, envelope)
+    receiver = login(port, 'bench_b', True, codec_name, envelope)
+    sender.settimeout(None)
+    receiver.settimeout(None)
+    received = [0]
+
+    def receive():
+        stream = MessageStream(True, codec)
+        while received[0] < messages:
+            data = receiver.recv(RECV_BUFFER_SIZE)
+            if not data:
+                break
+            received[0] += sum(1 for message in stream.feed(data) if message.get(ACTION) == MESSAGE)
+
+    def drain_responses():
+        try:
+            while sender.recv(RECV_BUFFER_SIZE):
+                pass
+        except OSError:
+            pass
+
+    reader = threading.Thread(target=receive)
+    threading.Thread(target=drain_responses, daemon=True).start()
+    sender_stream = MessageStream(True, codec)
+    reader.start()
+    server.cpu_time = 0
+    for request_id in range(1, messages + 1):
+        message = {ACTION: MESSAGE, SENDER: 'bench_a', RECEIVER: 'bench_b', TIME: time.time(),
+                   MESSAGE_TEXT: CIPHERTEXT}
+        if envelope:
+            sender.sendall(sender_stream.encode_envelope(message, request_id))
+        else:
+            message[REQUEST_ID] = request_id
+            sender.sendall(sender_stream.encode(message))
+    reader.join(60)
+    cpu_time = server.cpu_time
+
+    for sock in (sender, receiver):
+        sock.close()
+    server.stop()
+    server.join()
+    return cpu_time / max(received[0], 1) * 1000000, server
+
+
+if __name__ == '__main__':
+    arguments = [argument for argument in sys.argv[1:] if not argument.startswith('--')]
+    messages = int(arguments[0]) if arguments else 50000
+    ProfiledMessageProcessor.profile = '--cprofile' in sys.argv
+    port = BASE_PORT
+    for codec_name in CODECS_AVAILABLE:
+        for title, envelope in (('разбор', False), ('конверт', True)):
+            cpu, server = run(port, messages, codec_name, envelope)
+            port += 1
+            print(f'{codec_name:>8}, {title:>8}: {cpu:>6.1f} мкс процессорного времени сервера на сообщение')
+            if server.profiler:
+                output = io.StringIO()
+                pstats.Stats(server.profiler, stream=output).sort_stats('tottime').print_stats(8)
+                print(output.getvalue())
@@ -0,0 +1,154 @@
+"""
+Проверка пересылки сообщений кадрами-конвертами: пользователь mallory отправляет пользователю bob конверт,
+в заголовке которого указан он сам, а в сообщении отправителем указана alice. Сервер пересылает конверт
+не разбирая, поэтому поддельное сообщение должен отбросить получатель, не разрывая соединения. Следом
+mallory отправляет обычное сообщение, которое bob должен получить. Если получатель не в сети, сервер сам
+декодирует конверт и должен отключить отправителя поддельного конверта, не сохраняя сообщение.
+Кроме того, проверяется, что идентификатор запроса отправителя не попадает к получателю ни в обычном
+сообщении, ни в конверте, ни в сообщении, сохранённом для пользователя не в сети.
+
+Запуск из папки project: python benchmarks/relay_security.py
+"""
+
+import os
+import socket
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bench_utils import BenchDB, login, start_server
+from server_dist.server.common.utils import ENVELOPE_HEADER, ENVELOPE_MARKER, FRAME_HEADER, MessageStream, \
+    JSON_CODEC
+from server_dist.server.common.variables import *
+from server_dist.server.server_files.core import MessageProcessor
+
+BASE_PORT = 18200
+
+
+class StoringDB(BenchDB):
+    """
+    Класс тестовой базы данных сервера, запоминающий сообщения для пользователей не в сети
+    """
+
+    def __init__(self, users=()):
+        super().__init__(users)
+        self.offline = []
+
+    def store_offline_message(self, receiver, message):
+        self.offline.append((receiver, message))
+
+
+def user_message(sender, receiver, text):
+    return {ACTION: MESSAGE, SENDER: sender, RECEIVER: receiver, TIME: time.time(), MESSAGE_TEXT: text}
+
+
+def forged_envelope(header_sender, receiver, request_id=1):
+    """
+    :param header_sender: отправитель, указанный в заголовке конверта
+    :param receiver: получатель
+    :param request_id: идентификатор запроса
+
+    Функция, упаковывающая конверт, отправитель в заголовке которого не совпадает с отправителем в сообщении
+    """
+
+    sender, receiver_name = header_sender.encode(ENCODING), receiver.encode(ENCODING)
+    header = ENVELOPE_HEADER.pack(ENVELOPE_MARKER, request_id, len(sender), len(receiver_name))
+    payload = JSON_CODEC.encode(user_message('alice', receiver, b'I am alice'))
+    length = len(header) + len(sender) + len(receiver_name) + len(payload)
+    return b''.join((FRAME_HEADER.pack(length), header, sender, receiver_name, payload))
+
+
+def receive(sock, stream, count, timeout=2):
+    """
+    :param sock: сокет клиента
+    :param stream: разборщик потока клиента
+    :param count: ожидаемое число сообщений пользователю
+    :param timeout: время ожидания в секундах
+
+    Функция, принимающая сообщения пользователю, пока их не станет count или не истечёт время ожидания
+    """
+
+    messages = []
+    sock.settimeout(timeout)
+    try:
+        while len(messages) < count:
+            data = sock.recv(RECV_BUFFER_SIZE)
+            if not data:
+                break
+            messages.extend(message for message in stream.feed(data) if message.get(ACTION) == MESSAGE)
+    except OSError:
+        pass
+    return messages
+
+
+def check_online_receiver(port):
+    server = start_server(MessageProcessor, StoringDB(['mallory', 'bob', 'alice']), port)
+    try:
+        mallory = login(port, 'mallory', True, envelope=True)
+        bob = login(port, 'bob', True, envelope=True)
+        mallory.sendall(forged_envelope('mallory', 'bob'))
+        mallory.sendall(MessageStream(True).encode_envelope(user_message('mallory', 'bob', b'hello'), 2))
+        received = receive(bob, MessageStream(True), 2)
+        assert [message[SENDER] for message in received] == ['mallory'], received
+        print('Получатель в сети: поддельный конверт отброшен, обычное сообщение доставлено')
+        for sock in (mallory, bob):
+            sock.close()
+    finally:
+        server.stop()
+        server.join()
+
+
+def check_offline_receiver(port):
+    db = StoringDB(['mallory', 'bob', 'alice'])
+    server = start_server(MessageProcessor, db, port)
+    try:
+        mallory = login(port, 'mallory', True, envelope=True)
+        mallory.sendall(forged_envelope('mallory', 'bob'))
+        mallory.settimeout(2)
+        try:
+            while mallory.recv(RECV_BUFFER_SIZE):
+                pass
+            closed = True
+        except socket.timeout:
+            closed = False
+        except OSError:
+            closed = True
+        assert closed and not db.offline, db.offline
+        print('Получатель не в сети: отправитель поддельного конверта отключён, сообщение не сохранено')
+        mallory.close()
+    finally:
+        server.stop()
+        server.join()
+
+
+def check_request_ids(port):
+    db = StoringDB(['mallory', 'bob', 'alice'])
+    server = start_server(MessageProcessor, db, port)
+    try:
+        mallory = login(port, 'mallory', True, envelope=True)
+        bob = login(port, 'bob', True, envelope=True)
+        sender_stream = MessageStream(True)
+        message = user_message('mallory', 'bob', b'dict')
+        message[REQUEST_ID] = 7
+        mallory.sendall(sender_stream.encode(message))
+        mallory.sendall(sender_stream.encode_envelope(user_message('mallory', 'bob', b'envelope'), 8))
+        received = receive(bob, MessageStream(True), 2)
+        assert len(received) == 2 and not any(REQUEST_ID in message for message in received), received
+        bob.close()
+        time.sleep(0.2)
+        message = user_message('mallory', 'bob', b'offline')
+        message[REQUEST_ID] = 9
+        mallory.sendall(sender_stream.encode(message))
+        mallory.sendall(sender_stream.encode_envelope(user_message('mallory', 'bob', b'offline'), 10))
+        time.sleep(0.5)
+        assert len(db.offline) == 2 and not any(REQUEST_ID in message for _, message in db.offline), db.offline
+        print('Идентификаторы запросов отправителя не переданы получателю и не сохранены')
+        mallory.close()
+    finally:
+        server.stop()
+        server.join()
+
+
+if __name__ == '__main__':
+    check_online_receiver(BASE_PORT)
+    check_offline_receiver(BASE_PORT + 1)
+    check_request_ids(BASE_PORT + 2)
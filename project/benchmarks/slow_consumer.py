@@ -0,0 +1,77 @@
+"""
+Проверка противодавления при медленном получателе для серверов MessageProcessor и AsyncMessageProcessor:
+пользователь alice отправляет пользователю bob поток сообщений, а bob их не читает. Сервер должен
+приостановить приём от alice, как только очередь отправки bob превысит верхнюю границу, не накапливая
+в памяти больше нескольких верхних границ, и отключить bob, если очередь не освобождается дольше
+slow_consumer_timeout. После отключения bob приём от alice должен возобновиться.
+
+Запуск из папки project: python benchmarks/slow_consumer.py
+"""
+
+import os
+import sys
+import threading
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bench_utils import BenchDB, login, start_server
+from server_dist.server.common.utils import MessageStream
+from server_dist.server.common.variables import *
+from server_dist.server.server_files.core import MessageProcessor
+from server_dist.server.server_files.async_core import AsyncMessageProcessor
+
+BASE_PORT = 18400
+HIGH_WATER = 64 * 1024
+SLOW_CONSUMER_TIMEOUT = 2
+MESSAGES = 20000
+
+
+def flood(sock, done):
+    """
+    :param sock: сокет отправителя
+    :param done: событие, устанавливаемое после отправки всех сообщений
+
+    Функция, отправляющая пользователю bob поток сообщений
+    """
+
+    stream = MessageStream(True)
+    text = 'x' * 1000
+    try:
+        for _ in range(MESSAGES):
+            sock.sendall(stream.encode({ACTION: MESSAGE, SENDER: 'alice', RECEIVER: 'bob', TIME: time.time(),
+                                        MESSAGE_TEXT: text}))
+    except OSError:
+        return
+    done.set()
+
+
+def check(server_class, port):
+    server = start_server(server_class, BenchDB(['alice', 'bob']), port, high_water=HIGH_WATER,
+                          buffer_limit=1024 * 1024 * 1024, slow_consumer_timeout=SLOW_CONSUMER_TIMEOUT)
+    try:
+        alice = login(port, 'alice', True)
+        bob = login(port, 'bob', True)
+        alice.settimeout(SLOW_CONSUMER_TIMEOUT * 5)
+        done = threading.Event()
+        sender = threading.Thread(target=flood, args=(alice, done), daemon=True)
+        started = time.monotonic()
+        sender.start()
+        time.sleep(SLOW_CONSUMER_TIMEOUT / 2)
+        receiver = server.names.get('bob')
+        paused = receiver is not None and bool(server.paused.get(receiver))
+        depth = server.get_queue_depth('bob')
+        assert paused and depth < HIGH_WATER * 4, (paused, depth)
+        finished = done.wait(SLOW_CONSUMER_TIMEOUT * 4)
+        disconnected = time.monotonic() - started
+        assert finished and not server.user_online('bob'), (finished, server.user_online('bob'))
+        print(f'{server_class.__name__:>21}: приём приостановлен при очереди {depth} байт, '
+              f'получатель отключён и отправка завершена через {disconnected:.1f} с')
+        for sock in (alice, bob):
+            sock.close()
+    finally:
+        server.stop()
+        server.join()
+
+
+if __name__ == '__main__':
+    check(MessageProcessor, BASE_PORT)
+    check(AsyncMessageProcessor, BASE_PORT + 1)
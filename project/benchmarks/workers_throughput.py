@@ -0,0 +1,115 @@
+"""
+Нагрузочный тест многопроцессного сервера. Рабочие процессы слушают один порт (SO_REUSEPORT). Клиенты
+разбиты на пары, и в каждой паре один клиент отправляет сообщения другому конвейером. Отправитель
+и получатель пары могут оказаться в разных процессах сервера, тогда сообщения пересылаются между процессами.
+Нагрузку создают отдельные процессы, по одному на пару. Измеряется суммарная пропускная способность.
+Прирост от числа рабочих процессов ограничен числом ядер процессора.
+
+Запуск из папки project: python benchmarks/workers_throughput.py [число пар] [сообщений на пару]
+"""
+
+import multiprocessing
+import os
+import sys
+import threading
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bench_utils import BenchDB, login
+from server_dist.server.common.utils import MessageStream, get_codec, CODEC_PREFERENCE
+from server_dist.server.common.variables import *
+from server_dist.server.server_files.workers import start_workers, stop_workers
+
+BASE_PORT = 18090
+CIPHERTEXT = os.urandom(128)
+BATCH = 100
+
+
+def run_pair(pair, port, messages, barrier, results):
+    """
+    :param pair: номер пары
+    :param port: порт сервера
+    :param messages: число сообщений
+    :param barrier: барьер одновременного начала отправки
+    :param results: очередь результатов
+
+    Функция процесса нагрузки: отправляет сообщения от одного клиента пары другому и передаёт в очередь
+    результатов число доставленных сообщений и время от начала отправки до получения последнего сообщения
+    """
+
+    codec_name = CODEC_PREFERENCE[0]
+    codec = get_codec(codec_name)
+    sender = login(port, f'bench_s{pair}', True, codec_name, True)
+    receiver = login(port, f'bench_r{pair}', True, codec_name, True)
+    sender.settimeout(None)
+    receiver.settimeout(None)
+    sender_stream = MessageStream(True, codec)
+    batch = b''.join(sender_stream.encode_envelope(
+        {ACTION: MESSAGE, SENDER: f'bench_s{pair}', RECEIVER: f'bench_r{pair}', TIME: time.time(),
+         MESSAGE_TEXT: CIPHERTEXT}) for _ in range(BATCH))
+    received = [0]
+
+    def receive():
+        stream = MessageStream(True, codec)
+        while received[0] < messages:
+            data = receiver.recv(RECV_BUFFER_SIZE)
+            if not data:
+                break
+            received[0] += sum(1 for message in stream.feed(data) if message.get(ACTION) == MESSAGE)
+
+    def drain_responses():
+        try:
+            while sender.recv(RECV_BUFFER_SIZE):
+                pass
+        except OSError:
+            pass
+
+    reader = threading.Thread(target=receive)
+    threading.Thread(target=drain_responses, daemon=True).start()
+    barrier.wait()
+    started = time.perf_counter()
+    reader.start()
+    for _ in range(messages // BATCH):
+        sender.sendall(batch)
+    reader.join(120)
+    results.put((received[0], time.perf_counter() - started))
+    sender.close()
+    receiver.close()
+
+
+def run(port, workers, pairs, messages):
+    """
+    :param port: порт сервера
+    :param workers: число рабочих процессов сервера
+    :param pairs: число пар клиентов
+    :param messages: число сообщений на пару
+
+    Функция, запускающая сервер и процессы нагрузки и возвращающая число доставленных сообщений и суммарную
+    пропускную способность
+    """
+
+    names = [f'bench_{role}{pair}' for pair in range(pairs) for role in 'sr']
+    processes, stop_event = start_workers(workers, '127.0.0.1', port, BenchDB(names))
+    time.sleep(0.5)
+    context = multiprocessing.get_context('fork')
+    barrier = context.Barrier(pairs)
+    results = context.Queue()
+    loaders = [context.Process(target=run_pair, args=(pair, port, messages, barrier, results))
+               for pair in range(pairs)]
+    for loader in loaders:
+        loader.start()
+    outcome = [results.get(timeout=180) for _ in loaders]
+    for loader in loaders:
+        loader.join()
+    stop_workers(processes, stop_event)
+    delivered = sum(count for count, _ in outcome)
+    return delivered, delivered / max(elapsed for _, elapsed in outcome)
+
+
+if __name__ == '__main__':
+    pairs = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    messages = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    print(f'Ядер процессора: {os.cpu_count()}')
+    for number, workers in enumerate(sorted({1, 2, os.cpu_count() or 1, 4})):
+        delivered, throughput = run(BASE_PORT + number, workers, pairs, messages)
+        print(f'Рабочих процессов {workers}: доставлено {delivered} из {pairs * messages}, '
+              f'{throughput:>8.0f} сообщ./с')
@@ -1,4 +1,5 @@
 import argparse
+import logging
 import os
 from Cryptodome.PublicKey import RSA
 from PyQt5.QtWidgets import QApplication, QMessageBox
@@ -8,6 +9,7 @@ from client_dist.client.client_files.transport import ClientTransport
 from server_dist.server.common import ServerError
 from server_dist.server.common.decos import log
 from client_dist.client.client_files import ClientDB
+import client_dist.client.logs.config_client_log
 
 logger = logging.getLogger('client_dist')
 
@@ -71,7 +73,8 @@ if __name__ == '__main__':
     db = ClientDB(client_name)
 
     try:
-        transport = ClientTransport(server_port, server_address, client_name, db, client_password, keys)
+        token_file = os.path.join(os.path.dirname(os.path.realpath(__file__)), f'{client_name}.token')
+        transport = ClientTransport(server_port, server_address, client_name, db, client_password, keys, token_file)
     except ServerError as error:
         message = QMessageBox()
         message.critical(start_dialog, 'Ошибка сервера', error.text)
@@ -87,3 +90,4 @@ if __name__ == '__main__':
 
     transport.transport_shutdown()
     transport.join()
+    db.close()
@@ -0,0 +1,419 @@
+from sqlalchemy import *
+from sqlalchemy import event
+from sqlalchemy.orm import mapper, sessionmaker
+import datetime
+import hashlib
+import itertools
+import os
+import re
+import sys
+sys.path.append('../../../')
+from client_dist.client.client_files.db_writer import DBWriter
+from server_dist.server.common.variables import PUBLIC_KEY_TTL, HISTORY_PAGE_SIZE, SEARCH_RESULTS_LIMIT, \
+    SEARCH_CANDIDATES, CLIENT_DB_SYNCHRONOUS, CLIENT_DB_WRITE_BATCH, DB_BUSY_TIMEOUT
+
+
+class ClientDB:
+    """
+    Класс, определяющий, создающий и изменяющий клиентскую базу данных.
+    Изменения выполняет отдельный поток записи (DBWriter): методы, изменяющие базу данных, только помещают
+    изменение в очередь и не ждут диска, а чтение таблицы сначала дожидается записи ранее помещённых изменений
+    этой таблицы. База данных переведена в режим WAL, в котором чтение не ждёт записи
+    """
+
+    class User:
+        def __init__(self, name):
+            self.id = None
+            self.name = name
+
+        def __repr__(self):
+            return self.name
+
+    class Contact:
+        def __init__(self, name):
+            self.id = None
+            self.name = name
+
+        def __repr__(self):
+            return self.name
+
+    class MessageHistory:
+        def __init__(self, sender, receiver, message):
+            self.id = None
+            self.sender = sender
+            self.receiver = receiver
+            self.time = datetime.datetime.now()
+            self.message = message
+
+        def __repr__(self):
+            return f'From {self.sender} to {self.receiver} at {self.time}: \n {self.message}'
+
+    class PublicKey:
+        def __init__(self, name, key, fingerprint, fetched):
+            self.id = None
+            self.name = name
+            self.key = key
+            self.fingerprint = fingerprint
+            self.fetched = fetched
+
+        def __repr__(self):
+            return f'{self.name}: {self.fingerprint}'
+
+    def __init__(self, client_name, key_ttl=PUBLIC_KEY_TTL, synchronous=CLIENT_DB_SYNCHRONOUS,
+                 write_batch=CLIENT_DB_WRITE_BATCH, busy_timeout=DB_BUSY_TIMEOUT):
+        self.client_name = client_name
+        if synchronous.upper() not in ('OFF', 'NORMAL', 'FULL', 'EXTRA'):
+            raise ValueError(f'Неизвестный уровень синхронизации базы данных: {synchronous}')
+        self.synchronous = synchronous.upper()
+        path = os.path.join(os.path.dirname(os.path.realpath(__file__)), f'client_base_{self.client_name}.db3')
+        self.engine = create_engine(f'sqlite:///{path}', echo=False, pool_recycle=7200,
+                                    connect_args={'check_same_thread': False, 'timeout': busy_timeout})
+        event.listen(self.engine, 'connect', self.configure_connection)
+        self.metadata = MetaData()
+
+        users_table = Table('users', self.metadata,
+                            Column('id', Integer, primary_key=True),
+                            Column('name', String, unique=True)
+                            )
+
+        contacts_table = Table('contacts', self.metadata,
+                               Column('id', Integer, primary_key=True),
+                               Column('name', String, unique=True)
+                               )
+
+        message_history_table = Table('message_history', self.metadata,
+                                      Column('id', Integer, primary_key=True),
+                                      Column('sender', String),
+                                      Column('receiver', String),
+                                      Column('time', DateTime),
+                                      Column('message', Text),
+                                      Index('ix_message_history_sender_time', 'sender', 'time'),
+                                      Index('ix_message_history_receiver_time', 'receiver', 'time')
+                                      )
+
+        public_keys_table = Table('public_keys', self.metadata,
+                                  Column('id', Integer, primary_key=True),
+                                  Column('name', String, unique=True),
+                                  Column('key', Text),
+                                  Column('fingerprint', String),
+                                  Column('fetched', DateTime)
+                                  )
+
+        self.users_table = users_table
+        self.contacts_table = contacts_table
+        self.message_history_table = message_history_table
+        self.public_keys_table = public_keys_table
+        # Запросы изменений собираются один раз: поток записи объединяет одинаковые запросы пачки в executemany
+        self.insert_user_query = users_table.insert().prefix_with('OR IGNORE')
+        self.delete_user_query = users_table.delete().where(users_table.c.name == bindparam('user'))
+        self.insert_contact_query = contacts_table.insert().prefix_with('OR IGNORE')
+        self.delete_contact_query = contacts_table.delete().where(contacts_table.c.name == bindparam('user'))
+        self.insert_message_query = message_history_table.insert()
+        self.save_key_query = public_keys_table.insert().prefix_with('OR REPLACE')
+        self.delete_key_query = public_keys_table.delete().where(public_keys_table.c.name == bindparam('user'))
+
+        self.metadata.create_all(self.engine)
+        existing_indexes = {index['name'] for index in inspect(self.engine).get_indexes('message_history')}
+        for index in message_history_table.indexes:
+            if index.name not in existing_indexes:
+                index.create(self.engine)
+        self.create_search_index()
+
+        mapper(self.User, users_table)
+        mapper(self.Contact, contacts_table)
+        mapper(self.MessageHistory, message_history_table)
+        mapper(self.PublicKey, public_keys_table)
+
+        self.session = sessionmaker(bind=self.engine)()
+        self.session.query(self.Contact).delete()
+        self.session.commit()
+
+        self.key_ttl = datetime.timedelta(seconds=key_ttl)
+        self.public_keys = {row.name: (row.key, row.fetched) for row in self.session.query(self.PublicKey).all()}
+
+        self.message_ids = itertools.count((self.session.query(func.max(self.MessageHistory.id)).scalar() or 0) + 1)
+        self.writer = DBWriter(self.engine, write_batch)
+        self.writer.start()
+
+    def configure_connection(self, connection, connection_record):
+        """
+        :param connection: новое соединение с базой данных
+        :param connection_record: запись пула о соединении
+
+        Метод, настраивающий каждое новое соединение: включает режим WAL и заданный уровень синхронизации
+        с диском. В режиме WAL уровень NORMAL не повреждает базу данных при сбое, но последние зафиксированные
+        транзакции могут быть потеряны при отключении питания
+        """
+
+        cursor = connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA synchronous={self.synchronous}')
+        cursor.close()
+
+    def write(self, *operations):
+        """
+        :param operations: пары (запрос, параметры), выполняемые в одной транзакции
+
+        Метод, передающий изменение потоку записи
+        """
+
+        self.writer.write(*operations)
+
+    def flush(self, table=None):
+        """
+        :param table: таблица или None для всех таблиц
+
+        Метод, дожидающийся записи в базу данных всех ранее переданных изменений таблицы. Чтение из базы данных
+        ждёт только изменений читаемой таблицы, поэтому, например, список контактов читается без ожидания
+        записи потока входящих сообщений
+        """
+
+        self.writer.flush(table)
+
+    def close(self):
+        """
+        Метод, дописывающий изменения, останавливающий поток записи и закрывающий сессию. Вызывается
+        при завершении работы клиента
+        """
+
+        self.writer.stop()
+        self.session.close()
+
+    def create_search_index(self):
+        """
+        Метод, создающий полнотекстовый индекс FTS5 по тексту сообщений. Индекс хранит только слова и ссылается
+        на строки таблицы message_history, а триггеры обновляют его при каждом изменении таблицы. Если индекс
+        создаётся для уже заполненной базы данных, в него добавляются все сохранённые сообщения
+        """
+        with self.engine.begin() as connection:
+            exists = connection.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'message_search'")).scalar()
+            if exists:
+                return
+            connection.execute(text(
+                "CREATE VIRTUAL TABLE message_search USING fts5(message, content='message_history', "
+                "content_rowid='id', tokenize='unicode61 remove_diacritics 2')"))
+            connection.execute(text(
+                "CREATE TRIGGER message_search_insert AFTER INSERT ON message_history BEGIN "
+                "INSERT INTO message_search(rowid, message) VALUES (new.id, new.message); END"))
+            connection.execute(text(
+                "CREATE TRIGGER message_search_delete AFTER DELETE ON message_history BEGIN "
+                "INSERT INTO message_search(message_search, rowid, message) VALUES ('delete', old.id, old.message); "
+                "END"))
+            connection.execute(text(
+                "CREATE TRIGGER message_search_update AFTER UPDATE OF message ON message_history BEGIN "
+                "INSERT INTO message_search(message_search, rowid, message) VALUES ('delete', old.id, old.message); "
+                "INSERT INTO message_search(rowid, message) VALUES (new.id, new.message); END"))
+            connection.execute(text("INSERT INTO message_search(message_search) VALUES ('rebuild')"))
+
+    def get_users(self):
+        """
+        Метод, возвращающий список доступных пользователей из базы данных текущего пользователя
+        """
+        self.flush(self.users_table)
+        return [user[0] for user in self.session.query(self.User.name).all()]
+
+    def get_contacts(self):
+        """
+        Метод, возвращающий список контактов текущего пользователя из его базы данных
+        """
+
+        self.flush(self.contacts_table)
+        return [contact[0] for contact in self.session.query(self.Contact.name).all()]
+
+    def get_message_history(self, contact, before=None, limit=HISTORY_PAGE_SIZE, after=None):
+        """
+        :param contact: имя пользователя, историю сообщений с которым нужно получить
+        :param before: позиция (время, id) самого старого уже загруженного сообщения или None
+        :param limit: наибольшее количество сообщений
+        :param after: позиция (время, id) самого нового уже загруженного сообщения или None
+
+        Метод, возвращающий limit последних сообщений текущего пользователя с другим пользователем, отправленных
+        раньше позиции before, а если задана позиция after - limit первых сообщений после неё, в порядке
+        отправки. Каждое сообщение - кортеж (отправитель, получатель, текст, время, id); время и id крайнего
+        сообщения списка - позиция для загрузки следующей страницы. Отправленные и полученные сообщения
+        выбираются двумя запросами по индексам (sender, time) и (receiver, time), поэтому время запроса
+        не зависит от длины переписки
+        """
+        self.flush(self.message_history_table)
+        history = self.MessageHistory
+        position = tuple_(history.time, history.id)
+        pages = []
+        for column in (history.sender, history.receiver):
+            query = self.session.query(history.sender, history.receiver, history.message, history.time, history.id) \
+                .filter(column == contact)
+            if after is not None:
+                query = query.filter(position > tuple_(*after)).order_by(history.time, history.id)
+            else:
+                if before is not None:
+                    query = query.filter(position < tuple_(*before))
+                query = query.order_by(history.time.desc(), history.id.desc())
+            pages.extend(query.limit(limit).all())
+        page = sorted({message[4]: message for message in pages}.values(), key=lambda message: (message[3], message[4]))
+        page = page[:limit] if after is not None else page[-limit:]
+        return [tuple(message) for message in page]
+
+    def search_messages(self, query, limit=SEARCH_RESULTS_LIMIT, candidates=SEARCH_CANDIDATES):
+        """
+        :param query: строка поиска
+        :param limit: наибольшее количество результатов
+        :param candidates: количество последних найденных сообщений, которые ранжируются
+
+        Метод, ищущий сообщения со всеми собеседниками, содержащие все слова строки поиска. Возвращает сообщения
+        в том же виде, что и get_message_history, начиная с наиболее подходящих (ранжирование BM25). Оценка BM25
+        вычисляется для каждого найденного сообщения, поэтому ранжируются только candidates последних из них:
+        индекс отдаёт их в порядке id без оценки, и время поиска частого слова почти не растёт с длиной истории
+        """
+
+        words = re.findall(r'\w+', query)
+        if not words:
+            return []
+        self.flush(self.message_history_table)
+        match = ' '.join(f'"{word}"' for word in words)
+        search = text(
+            'SELECT message_history.sender, message_history.receiver, message_history.message, '
+            'message_history.time, message_history.id FROM ('
+            'SELECT rowid, rank FROM message_search WHERE message_search MATCH :match '
+            'ORDER BY rowid DESC LIMIT :candidates) AS hits '
+            'JOIN message_history ON message_history.id = hits.rowid ORDER BY hits.rank LIMIT :limit'
+        ).columns(sender=String, receiver=String, message=Text, time=DateTime, id=Integer)
+        found = self.session.execute(search, {'match': match, 'candidates': candidates, 'limit': limit})
+        return [tuple(message) for message in found]
+
+    def clear_contacts(self):
+        """
+        Метод, очищающий таблицу контактов текущего пользователя
+        """
+
+        self.write((self.contacts_table.delete(), {}))
+
+    def add_contact(self, contact):
+        """
+        :param contact: имя пользователя, которого нужно добавить в таблицу контактов текущего пользователя
+
+        Метод, добавляющий в таблицу контактов нового пользователя, если его там ещё нет
+        """
+        self.write((self.insert_contact_query, {'name': contact}))
+
+    def delete_contact(self, contact):
+        """
+        :param contact: имя пользователя, которого нужно удалить из таблицы контактов текущего пользователя
+
+        Метод, удаляющий из таблицы контактов данного пользователя
+        """
+        self.write((self.delete_contact_query, {'user': contact}))
+
+    def save_message(self, sender, receiver, message):
+        """
+        :param sender: отправитель сообщения
+        :param receiver: получатель сообщения
+        :param message: текст сообщения
+
+        Метод, сохраняющий сообщение в таблице сообщений текущего пользователя. Возвращает сохранённое
+        сообщение в том же виде, что и get_message_history, не дожидаясь записи. Время и id сообщения
+        назначаются сразу: все сообщения сохраняются через этот метод, поэтому id из счётчика не повторяются
+        """
+        time, message_id = datetime.datetime.now(), next(self.message_ids)
+        self.write((self.insert_message_query, {'id': message_id, 'sender': sender, 'receiver': receiver,
+                                                'time': time, 'message': message}))
+        return sender, receiver, message, time, message_id
+
+    def renew_users(self, users):
+        """
+        :param users: доступные пользователи, которыми нужно заполнить таблицу
+
+        Метод, обновляющий таблицу доступных пользователей
+        """
+        self.write((self.users_table.delete(), {}), *((self.insert_user_query, {'name': user}) for user in users))
+
+    def add_user(self, user):
+        """
+        :param user: имя пользователя, зарегистрированного на сервере
+
+        Метод, добавляющий пользователя в таблицу доступных пользователей, если его там ещё нет
+        """
+        self.write((self.insert_user_query, {'name': user}))
+
+    def remove_user(self, user):
+        """
+        :param user: имя пользователя, удалённого с сервера
+
+        Метод, удаляющий пользователя из таблиц доступных пользователей, контактов и открытых ключей
+        """
+        self.write(*((query, {'user': user})
+                     for query in (self.delete_user_query, self.delete_contact_query, self.delete_key_query)))
+        self.public_keys.pop(user, None)
+
+    def get_public_key(self, user):
+        """
+        :param user: имя пользователя
+
+        Метод, возвращающий сохранённый открытый ключ пользователя или None, если ключа нет или он получен
+        с сервера раньше, чем key_ttl секунд назад. Ключи хранятся в базе данных и в памяти, поэтому
+        чтение не обращается к базе данных
+        """
+        cached = self.public_keys.get(user)
+        if cached is None or datetime.datetime.now() - cached[1] >= self.key_ttl:
+            return None
+        return cached[0]
+
+    def save_public_key(self, user, key):
+        """
+        :param user: имя пользователя
+        :param key: открытый ключ пользователя, полученный с сервера
+
+        Метод, сохраняющий открытый ключ пользователя вместе с его отпечатком и временем получения
+        """
+        fetched = datetime.datetime.now()
+        fingerprint = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        self.write((self.save_key_query, {'name': user, 'key': key, 'fingerprint': fingerprint, 'fetched': fetched}))
+        self.public_keys[user] = (key, fetched)
+
+    def forget_public_key(self, user):
+        """
+        :param user: имя пользователя
+
+        Метод, удаляющий сохранённый открытый ключ пользователя, например после смены ключа
+        """
+        self.write((self.delete_key_query, {'user': user}))
+        self.public_keys.pop(user, None)
+
+    def clear_public_keys(self):
+        """
+        Метод, удаляющий все сохранённые открытые ключи
+        """
+        self.write((self.public_keys_table.delete(), {}))
+        self.public_keys.clear()
+
+
+if __name__ == '__main__':
+    test_db = ClientDB('client_1')
+
+    print(' ---- test_db.get_users() ----')
+    print(test_db.get_users())
+
+    print(' ---- test_db.renew_users(["client_2", "client_3"]) ----')
+    test_db.renew_users(["client_2", "client_3"])
+    print(test_db.get_users())
+
+    print(' ---- test_db.get_contacts() ----')
+    print(test_db.get_contacts())
+
+    print(' ---- test_db.add_contact("client_2") ----')
+    test_db.add_contact("client_2")
+    print(test_db.get_contacts())
+
+    print(' ---- test_db.add_contact("client_2") ----')
+    test_db.add_contact("client_2")
+
+    print(' ---- test_db.add_contact("client_14") ----')
+    test_db.add_contact("client_14")
+
+    print(' ---- test_db.delete_contact("client_2") ----')
+    test_db.delete_contact("client_2")
+    print(test_db.get_contacts())
+
+    print(' ---- test_db.save_message("client_1", "client_2", "hi") ---- \n'
+          ' ---- test_db.get_message_history()                      ---- ')
+    test_db.save_message("client_1", "client_2", "hi")
+    print(test_db.get_message_history())
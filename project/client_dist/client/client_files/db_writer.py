@@ -0,0 +1,112 @@
+import itertools
+import logging
+import queue
+import sys
+import threading
+sys.path.append('../../../')
+from server_dist.server.common.variables import CLIENT_DB_WRITE_BATCH
+
+logger = logging.getLogger('client_dist')
+
+
+class DBWriter(threading.Thread):
+    """
+    Класс потока записи в базу данных клиента. Потоки интерфейса и транспорта только помещают изменения
+    в очередь и не ждут диска, а поток записи выполняет накопившиеся изменения одной транзакцией - до batch_size
+    изменений на одну фиксацию. Изменение - последовательность пар (запрос, параметры), выполняемых вместе;
+    подряд идущие одинаковые запросы выполняются одним executemany. Если транзакция пачки не удалась, изменения
+    повторяются по одному, и ошибка одного изменения не отменяет остальные. Изменения нумеруются в порядке
+    очереди, а для каждой таблицы запоминается номер последнего её изменения, поэтому чтение таблицы ждёт
+    записи только её собственных изменений
+    """
+
+    def __init__(self, engine, batch_size=CLIENT_DB_WRITE_BATCH):
+        super().__init__(daemon=True)
+        self.engine = engine
+        self.batch_size = batch_size
+        self.writes = queue.Queue()
+        self.lock = threading.Lock()
+        self.written_changed = threading.Condition()
+        self.queued = 0
+        self.written = 0
+        self.pending = {}
+
+    def write(self, *operations):
+        """
+        :param operations: пары (запрос, параметры), выполняемые в одной транзакции
+
+        Метод, помещающий изменение в очередь записи и возвращающий его номер
+        """
+
+        with self.lock:
+            self.queued += 1
+            for statement, params in operations:
+                self.pending[statement.table.name] = self.queued
+            self.writes.put((self.queued, operations))
+            return self.queued
+
+    def flush(self, table=None):
+        """
+        :param table: таблица или None для всех таблиц
+
+        Метод, дожидающийся записи в базу данных всех изменений таблицы, помещённых в очередь до его вызова.
+        Если все они уже записаны, метод возвращается сразу
+        """
+
+        number = self.queued if table is None else self.pending.get(table.name, 0)
+        if self.written >= number or not self.is_alive():
+            return
+        with self.written_changed:
+            self.written_changed.wait_for(lambda: self.written >= number)
+
+    def stop(self):
+        """
+        Метод, дописывающий очередь изменений и останавливающий поток записи
+        """
+
+        if self.is_alive():
+            self.writes.put((None, None))
+            self.join()
+
+    def run(self):
+        with self.engine.connect() as connection:
+            running = True
+            while running:
+                batch = [self.writes.get()]
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self.writes.get_nowait())
+                    except queue.Empty:
+                        break
+                running = all(number is not None for number, operations in batch)
+                changes = [operations for number, operations in batch if number is not None]
+                try:
+                    self.execute(connection, changes)
+                except Exception:
+                    logger.exception('Не удалось записать пачку изменений в базу данных, изменения '
+                                     'записываются по одному')
+                    for operations in changes:
+                        try:
+                            self.execute(connection, [operations])
+                        except Exception:
+                            logger.exception('Не удалось записать изменение в базу данных')
+                with self.written_changed:
+                    self.written = max((number for number, operations in batch if number is not None),
+                                       default=self.written)
+                    self.written_changed.notify_all()
+
+    @staticmethod
+    def execute(connection, changes):
+        """
+        :param connection: соединение потока записи с базой данных
+        :param changes: изменения
+
+        Метод, выполняющий изменения одной транзакцией
+        """
+
+        if not changes:
+            return
+        with connection.begin():
+            operations = itertools.chain.from_iterable(changes)
+            for statement, group in itertools.groupby(operations, key=lambda operation: operation[0]):
+                connection.execute(statement, [params for _, params in group])
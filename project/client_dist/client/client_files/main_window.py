@@ -1,15 +1,12 @@
-from PyQt5.QtWidgets import QMainWindow, qApp, QMessageBox, QApplication
+from PyQt5.QtWidgets import QMainWindow, qApp, QMessageBox, QApplication, QAbstractItemView
 from PyQt5.QtGui import QStandardItemModel, QStandardItem, QBrush, QColor
 from PyQt5.QtCore import pyqtSlot, Qt
 import sys
-import json
-from Cryptodome.Cipher import PKCS1_OAEP
-from Cryptodome.PublicKey import RSA
-import base64
 sys.path.append('../../../')
 from client_dist.client.client_files.main_window_ui import MainClientWindowUI
 from client_dist.client.client_files.add_contact_dialog import AddContactDialog
 from client_dist.client.client_files.delete_contact_dialog import DeleteContactDialog
+from client_dist.client.client_files.message_cipher import MessageCipher
 from server_dist.server.common.errors import ServerError
 from server_dist.server.common.variables import *
 
@@ -25,7 +22,7 @@ class ClientMainWindow(QMainWindow):
         super().__init__()
         self.transport = transport
         self.db = db
-        self.decrypter = PKCS1_OAEP.new(keys)
+        self.cipher = MessageCipher(transport.name, keys)
 
         self.ui = MainClientWindowUI(self)
 
@@ -40,14 +37,20 @@ class ClientMainWindow(QMainWindow):
 
         self.contacts_model = None
         self.history_model = None
+        self.search_model = QStandardItemModel()
+        self.history_complete = True
+        self.history_at_end = True
         self.messages = QMessageBox()
         self.current_chat = None
         self.current_chat_key = None
-        self.encryptor = None
         self.ui.messages.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
         self.ui.messages.setWordWrap(True)
+        self.ui.messages.verticalScrollBar().valueChanged.connect(self.history_scrolled)
 
         self.ui.contacts.doubleClicked.connect(self.select_active_user)
+        self.ui.search_line.returnPressed.connect(self.search_messages)
+        self.ui.search_line.textChanged.connect(self.search_text_changed)
+        self.ui.messages.doubleClicked.connect(self.open_search_result)
 
         self.renew_clients()
         self.set_disabled_input()
@@ -63,46 +66,219 @@ class ClientMainWindow(QMainWindow):
         self.ui.text_message.clear()
         if self.history_model:
             self.history_model.clear()
+        self.history_complete = True
+        self.history_at_end = True
 
         self.ui.clear_button.setDisabled(True)
         self.ui.send_button.setDisabled(True)
         self.ui.text_message.setDisabled(True)
 
-        self.encryptor = None
         self.current_chat = None
         self.current_chat_key = None
 
+    def history_item(self, message):
+        """
+        :param message: кортеж (отправитель, получатель, текст, время, id) из истории сообщений
+
+        Метод, создающий элемент окна чата для сообщения. Позиция сообщения (время, id) хранится в элементе
+        для подгрузки соседних страниц переписки
+        """
+
+        if message[1] == self.transport.name:
+            item = QStandardItem(f'Входящее от {message[3].replace(microsecond=0)}:\n {message[2]}')
+            item.setBackground(QBrush(QColor(255, 213, 213)))
+            item.setTextAlignment(Qt.AlignLeft)
+        else:
+            item = QStandardItem(f'Исходящее от {message[3].replace(microsecond=0)}:\n {message[2]}')
+            item.setTextAlignment(Qt.AlignRight)
+            item.setBackground(QBrush(QColor(204, 255, 204)))
+        item.setEditable(False)
+        item.setData((message[3], message[4]), Qt.UserRole)
+        return item
+
+    def history_position(self, row):
+        return self.history_model.item(row).data(Qt.UserRole)
+
     def renew_message_history(self):
         """
-        Метод, обновляющий историю сообщений текущего пользователя
+        Метод, обновляющий историю сообщений текущего пользователя: загружает последнюю страницу переписки,
+        соседние страницы подгружаются при прокрутке окна чата
         """
 
-        list_messages = sorted(self.db.get_message_history(self.current_chat),
-                               key=lambda m: m[3])
         if not self.history_model:
             self.history_model = QStandardItemModel()
             self.ui.messages.setModel(self.history_model)
         self.history_model.clear()
-        length = len(list_messages)
-        start_index = 0
-        if length > 20:
-            start_index = length - 20
-        for i in range(start_index, length):
-            item = list_messages[i]
-            if item[1] == self.transport.name:
-                mess = QStandardItem(f'Входящее от {item[3].replace(microsecond=0)}:\n {item[2]}')
-                mess.setEditable(False)
-                mess.setBackground(QBrush(QColor(255, 213, 213)))
-                mess.setTextAlignment(Qt.AlignLeft)
-                self.history_model.appendRow(mess)
-            else:
-                mess = QStandardItem(f'Исходящее от {item[3].replace(microsecond=0)}:\n {item[2]}')
-                mess.setEditable(False)
-                mess.setTextAlignment(Qt.AlignRight)
-                mess.setBackground(QBrush(QColor(204, 255, 204)))
-                self.history_model.appendRow(mess)
+        page = self.db.get_message_history(self.current_chat)
+        for message in page:
+            self.history_model.appendRow(self.history_item(message))
+        self.history_complete = len(page) < HISTORY_PAGE_SIZE
+        self.history_at_end = True
         self.ui.messages.scrollToBottom()
 
+    def trim_history(self, from_top):
+        """
+        :param from_top: удалять ли сообщения из начала окна чата (иначе из конца)
+
+        Метод, удаляющий из окна чата сообщения сверх HISTORY_VIEW_LIMIT. Окно чата раскладывает все свои
+        элементы при каждом изменении, поэтому число элементов ограничено, а удалённые сообщения снова
+        загружаются из базы данных при прокрутке
+        """
+
+        excess = self.history_model.rowCount() - HISTORY_VIEW_LIMIT
+        if excess <= 0:
+            return
+        if from_top:
+            self.history_model.removeRows(0, excess)
+            self.history_complete = False
+        else:
+            self.history_model.removeRows(HISTORY_VIEW_LIMIT, excess)
+            self.history_at_end = False
+
+    def append_message(self, message):
+        """
+        :param message: кортеж (отправитель, получатель, текст, время, id) нового сообщения
+
+        Метод, добавляющий новое сообщение в конец окна чата. Уже показанные сообщения не перечитываются
+        из базы данных и не создаются заново, а число элементов окна ограничено, поэтому время добавления
+        не зависит от длины переписки. Если в окне открыта старая часть переписки, входящее сообщение
+        появится при прокрутке вниз, а после отправки сообщения окно переходит к концу переписки
+        """
+
+        if not self.history_at_end:
+            if message[0] == self.transport.name:
+                self.renew_message_history()
+            return
+        self.history_model.appendRow(self.history_item(message))
+        self.trim_history(True)
+        self.ui.messages.scrollToBottom()
+
+    def load_older_history(self):
+        """
+        Метод, добавляющий в начало окна чата предыдущую страницу переписки и сохраняющий положение прокрутки
+        """
+
+        if self.history_complete or not self.current_chat or not self.history_model.rowCount():
+            return
+        page = self.db.get_message_history(self.current_chat, before=self.history_position(0))
+        self.history_complete = len(page) < HISTORY_PAGE_SIZE
+        if not page:
+            return
+        for row, message in enumerate(page):
+            self.history_model.insertRow(row, self.history_item(message))
+        self.trim_history(False)
+        self.ui.messages.scrollTo(self.history_model.index(len(page), 0), QAbstractItemView.PositionAtTop)
+
+    def load_newer_history(self):
+        """
+        Метод, добавляющий в конец окна чата следующую страницу переписки и сохраняющий положение прокрутки
+        """
+
+        if self.history_at_end or not self.current_chat or not self.history_model.rowCount():
+            return
+        last_row = self.history_model.rowCount() - 1
+        page = self.db.get_message_history(self.current_chat, after=self.history_position(last_row))
+        self.history_at_end = len(page) < HISTORY_PAGE_SIZE
+        for message in page:
+            self.history_model.appendRow(self.history_item(message))
+        excess = max(0, self.history_model.rowCount() - HISTORY_VIEW_LIMIT)
+        self.trim_history(True)
+        self.ui.messages.scrollTo(self.history_model.index(last_row - excess, 0), QAbstractItemView.PositionAtBottom)
+
+    def history_scrolled(self, value):
+        """
+        :param value: положение полосы прокрутки окна чата
+
+        Метод, подгружающий соседние страницы переписки, когда окно чата прокручено до начала или до конца
+        """
+
+        if self.ui.messages.model() is not self.history_model:
+            return
+        scroll_bar = self.ui.messages.verticalScrollBar()
+        if value == scroll_bar.minimum():
+            self.load_older_history()
+        elif value == scroll_bar.maximum():
+            self.load_newer_history()
+
+    def show_history(self):
+        """
+        Метод, возвращающий в окно чата историю сообщений вместо результатов поиска
+        """
+
+        self.ui.label_history.setText('История сообщений:')
+        if not self.history_model:
+            self.history_model = QStandardItemModel()
+        self.ui.messages.setModel(self.history_model)
+        self.ui.messages.scrollToBottom()
+
+    def search_messages(self):
+        """
+        Метод, показывающий в окне чата сообщения со всеми собеседниками, найденные по строке поиска,
+        начиная с наиболее подходящих
+        """
+
+        query = self.ui.search_line.text().strip()
+        if not query:
+            self.show_history()
+            return
+        found = self.db.search_messages(query)
+        self.search_model.clear()
+        for message in found:
+            contact = message[0] if message[1] == self.transport.name else message[1]
+            direction = 'от' if message[1] == self.transport.name else 'для'
+            item = QStandardItem(f'{direction} {contact}, {message[3].replace(microsecond=0)}:\n {message[2]}')
+            item.setEditable(False)
+            item.setData((contact, message), Qt.UserRole)
+            self.search_model.appendRow(item)
+        self.ui.label_history.setText(f'Найдено сообщений: {len(found)}')
+        self.ui.messages.setModel(self.search_model)
+
+    def search_text_changed(self, text):
+        """
+        :param text: строка поиска
+
+        Метод, возвращающий в окно чата историю сообщений, когда строка поиска очищена
+        """
+
+        if not text and self.ui.messages.model() is self.search_model:
+            self.show_history()
+
+    def open_search_result(self, index):
+        """
+        :param index: индекс выбранного результата поиска
+
+        Метод, открывающий чат с собеседником из выбранного результата поиска на найденном сообщении
+        """
+
+        if self.ui.messages.model() is not self.search_model:
+            return
+        contact, message = index.data(Qt.UserRole)
+        self.ui.search_line.clear()
+        self.show_history()
+        self.current_chat = contact
+        self.set_active_user()
+        if self.current_chat_key:
+            self.show_history_around(message)
+
+    def show_history_around(self, message):
+        """
+        :param message: кортеж (отправитель, получатель, текст, время, id) сообщения
+
+        Метод, показывающий в окне чата страницу переписки до сообщения, само сообщение и страницу после него
+        """
+
+        position = (message[3], message[4])
+        older = self.db.get_message_history(self.current_chat, before=position)
+        newer = self.db.get_message_history(self.current_chat, after=position)
+        self.history_model.clear()
+        for row in older + [message] + newer:
+            self.history_model.appendRow(self.history_item(row))
+        self.history_complete = len(older) < HISTORY_PAGE_SIZE
+        self.history_at_end = len(newer) < HISTORY_PAGE_SIZE
+        found = self.history_model.index(len(older), 0)
+        self.ui.messages.setCurrentIndex(found)
+        self.ui.messages.scrollTo(found, QAbstractItemView.PositionAtCenter)
+
     def select_active_user(self):
         """
         Метод, получающий информацию о новом активном чате текущего пользователя
@@ -120,10 +296,9 @@ class ClientMainWindow(QMainWindow):
             self.current_chat_key = self.transport.get_key(self.current_chat)
             logger.debug(f'Загружен открытый ключ для {self.current_chat}')
             if self.current_chat_key:
-                self.encryptor = PKCS1_OAEP.new(RSA.import_key(self.current_chat_key))
-        except (OSError, json.JSONDecodeError):
+                self.cipher.session(self.current_chat, self.current_chat_key)
+        except (OSError, ValueError):
             self.current_chat_key = None
-            self.encryptor = None
             logger.debug(f'Не удалось получить ключ для {self.current_chat}')
 
         if not self.current_chat_key:
@@ -243,10 +418,11 @@ class ClientMainWindow(QMainWindow):
         self.ui.text_message.clear()
         if not message_text:
             return
-        message_text_encrypted = base64.b64encode(self.encryptor.encrypt(message_text.encode('utf8')))
         try:
-            self.transport.send_message(self.current_chat, message_text_encrypted.decode('ascii'))
-            pass
+            self.current_chat_key = self.transport.get_key(self.current_chat) or self.current_chat_key
+            message_text_encrypted = self.cipher.encrypt(self.current_chat, self.current_chat_key,
+                                                         message_text.encode('utf8'))
+            self.transport.send_message(self.current_chat, message_text_encrypted)
         except ServerError as err:
             self.messages.critical(self, 'Ошибка', err.text)
         except OSError as err:
@@ -258,9 +434,9 @@ class ClientMainWindow(QMainWindow):
             self.messages.critical(self, 'Ошибка', 'Потеряно соединение с сервером!')
             self.close()
         else:
-            self.db.save_message(self.transport.name, self.current_chat, message_text)
+            saved = self.db.save_message(self.transport.name, self.current_chat, message_text)
             logger.debug(f'Отправлено сообщение для {self.current_chat}: {message_text}')
-            self.renew_message_history()
+            self.append_message(saved)
 
     @pyqtSlot(dict)
     def new_message_slot(self, message):
@@ -271,19 +447,18 @@ class ClientMainWindow(QMainWindow):
         окна
         """
 
-        encrypted_message = base64.b64decode(message[MESSAGE_TEXT])
         try:
-            decrypted_message = self.decrypter.decrypt(encrypted_message)
+            decrypted_message = self.cipher.decrypt(message[SENDER], message[MESSAGE_TEXT])
         except (ValueError, TypeError):
             self.messages.warning(self, 'Ошибка', 'Не удалось декодировать сообщение.')
             return
-        self.db.save_message(
+        saved = self.db.save_message(
             message[SENDER],
             self.transport.name,
             decrypted_message.decode('utf8'))
         sender = message[SENDER]
         if sender == self.current_chat:
-            self.renew_message_history()
+            self.append_message(saved)
         else:
             if sender in self.db.get_contacts():
                 if self.messages.question(self, 'Новое сообщение',
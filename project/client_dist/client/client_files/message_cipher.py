@@ -0,0 +1,161 @@
+import os
+import struct
+import sys
+import time
+from collections import OrderedDict
+from Cryptodome.Cipher import AES, PKCS1_OAEP
+from Cryptodome.PublicKey import RSA
+sys.path.append('../../../')
+from server_dist.server.common.variables import SESSION_KEY_LIFETIME, SESSION_KEY_MESSAGES, SESSION_KEY_CACHE_SIZE
+
+# Заголовок зашифрованного сообщения: версия формата, идентификатор сеансового ключа и длина сеансового ключа,
+# зашифрованного открытым ключом получателя. За заголовком следуют зашифрованный ключ, одноразовый номер AES-GCM,
+# зашифрованный текст и метка подлинности
+HEADER = struct.Struct('!B8sH')
+VERSION = 1
+KEY_ID_SIZE = 8
+NONCE_SIZE = 12
+TAG_SIZE = 16
+
+
+class OutgoingSession:
+    """
+    Класс сеансового ключа для сообщений одному собеседнику
+    """
+
+    def __init__(self, public_key, encryptor):
+        self.public_key = public_key
+        self.key = os.urandom(32)
+        self.key_id = os.urandom(KEY_ID_SIZE)
+        self.wrapped = encryptor.encrypt(self.key)
+        self.header = HEADER.pack(VERSION, self.key_id, len(self.wrapped)) + self.wrapped
+        self.created = time.monotonic()
+        self.messages = 0
+
+
+class MessageCipher:
+    """
+    Класс шифрования сообщений пользователя. Текст шифруется AES-256-GCM сеансовым ключом, а RSA используется
+    только для передачи сеансового ключа: ключ создаётся для собеседника один раз, шифруется его открытым
+    ключом и заменяется новым через lifetime секунд, после max_messages сообщений или при смене открытого
+    ключа собеседника. Зашифрованный сеансовый ключ передаётся в каждом сообщении, поэтому любое сообщение,
+    в том числе сохранённое сервером до входа получателя, расшифровывается независимо от остальных. Получатель
+    расшифровывает сеансовый ключ закрытым ключом один раз и хранит его в кэше. Разобранные открытые ключи
+    собеседников тоже хранятся в кэше, поэтому смена сеансового ключа не требует разбора открытого ключа.
+    Имена отправителя и получателя входят в проверяемые данные сообщения. Сообщения прежнего формата (текст,
+    зашифрованный ключом RSA) по-прежнему расшифровываются
+    """
+
+    def __init__(self, name, keys, lifetime=SESSION_KEY_LIFETIME, max_messages=SESSION_KEY_MESSAGES,
+                 cache_size=SESSION_KEY_CACHE_SIZE):
+        self.name = name
+        self.decrypter = PKCS1_OAEP.new(keys)
+        self.rsa_size = keys.size_in_bytes()
+        self.lifetime = lifetime
+        self.max_messages = max_messages
+        self.cache_size = cache_size
+        self.sessions = {}
+        self.received = OrderedDict()
+        self.encryptors = OrderedDict()
+
+    @staticmethod
+    def associated_data(sender, receiver):
+        return f'{sender}\n{receiver}'.encode('utf-8')
+
+    def encryptor(self, public_key):
+        """
+        :param public_key: открытый ключ собеседника
+
+        Метод, возвращающий объект шифрования открытым ключом из кэша или разбирающий ключ
+        """
+
+        encryptor = self.encryptors.get(public_key)
+        if encryptor is not None:
+            self.encryptors.move_to_end(public_key)
+            return encryptor
+        encryptor = self.encryptors[public_key] = PKCS1_OAEP.new(RSA.import_key(public_key))
+        if len(self.encryptors) > self.cache_size:
+            self.encryptors.popitem(last=False)
+        return encryptor
+
+    def session(self, contact, public_key):
+        """
+        :param contact: имя собеседника
+        :param public_key: открытый ключ собеседника
+
+        Метод, возвращающий действующий сеансовый ключ для собеседника и создающий новый, если срок
+        действия ключа истёк или ключ собеседника сменился
+        """
+
+        session = self.sessions.get(contact)
+        if session is None or session.public_key != public_key or session.messages >= self.max_messages \
+                or time.monotonic() - session.created >= self.lifetime:
+            session = self.sessions[contact] = OutgoingSession(public_key, self.encryptor(public_key))
+        return session
+
+    def forget(self, contact):
+        """
+        :param contact: имя собеседника
+
+        Метод, удаляющий сеансовый ключ собеседника, например после смены его открытого ключа
+        """
+
+        self.sessions.pop(contact, None)
+
+    def encrypt(self, receiver, public_key, data):
+        """
+        :param receiver: имя получателя
+        :param public_key: открытый ключ получателя
+        :param data: байты сообщения
+
+        Метод, шифрующий сообщение получателю
+        """
+
+        session = self.session(receiver, public_key)
+        session.messages += 1
+        nonce = os.urandom(NONCE_SIZE)
+        cipher = AES.new(session.key, AES.MODE_GCM, nonce=nonce)
+        cipher.update(session.header + self.associated_data(self.name, receiver))
+        ciphertext, tag = cipher.encrypt_and_digest(data)
+        return b''.join((session.header, nonce, ciphertext, tag))
+
+    def session_key(self, sender, key_id, wrapped):
+        """
+        :param sender: имя отправителя
+        :param key_id: идентификатор сеансового ключа
+        :param wrapped: сеансовый ключ, зашифрованный открытым ключом этого пользователя
+
+        Метод, возвращающий сеансовый ключ отправителя из кэша или расшифровывающий его закрытым ключом
+        """
+
+        cache_key = (sender, key_id)
+        key = self.received.get(cache_key)
+        if key is not None:
+            self.received.move_to_end(cache_key)
+            return key
+        key = self.decrypter.decrypt(wrapped)
+        self.received[cache_key] = key
+        if len(self.received) > self.cache_size:
+            self.received.popitem(last=False)
+        return key
+
+    def decrypt(self, sender, data):
+        """
+        :param sender: имя отправителя
+        :param data: зашифрованное сообщение
+
+        Метод, расшифровывающий сообщение. Возбуждает ValueError, если сообщение повреждено или подделано
+        """
+
+        if len(data) == self.rsa_size:
+            return self.decrypter.decrypt(data)
+        if len(data) < HEADER.size:
+            raise ValueError('Слишком короткое сообщение')
+        version, key_id, wrapped_size = HEADER.unpack_from(data)
+        body = HEADER.size + wrapped_size
+        if version != VERSION or len(data) < body + NONCE_SIZE + TAG_SIZE:
+            raise ValueError('Неизвестный формат сообщения')
+        key = self.session_key(sender, key_id, data[HEADER.size:body])
+        cipher = AES.new(key, AES.MODE_GCM, nonce=data[body:body + NONCE_SIZE])
+        cipher.update(data[:body] + self.associated_data(sender, self.name))
+        return cipher.decrypt_and_verify(data[body + NONCE_SIZE:-TAG_SIZE], data[-TAG_SIZE:])
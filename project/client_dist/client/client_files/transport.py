@@ -1,7 +1,14 @@
+import errno
+import itertools
+import os
+import queue
 import socket
 import sys
 import time
 import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from PyQt5.QtCore import pyqtSignal, QObject
 import hashlib
 import binascii
@@ -14,22 +21,25 @@ from server_dist.server.common.errors import ServerError
 
 logger = logging.getLogger('client_dist')
 
-transport_lock = threading.Lock()
-
 
 class ClientTransport(threading.Thread, QObject):
     """
-    Класс, осуществляющий функционал клиента
+    Класс, осуществляющий функционал клиента. Входящие данные читает отдельный поток-приёмник: ответы сервера
+    передаются ожидающим их запросам по идентификатору запроса (а если сервер его не вернул - в порядке отправки
+    запросов), а сообщения, которые сервер присылает сам, ставятся в очередь, которую разбирает поток
+    ClientTransport. Поэтому отправка запросов не блокирует приём, несколько запросов могут ожидать ответа
+    одновременно, а входящие сообщения обрабатываются сразу
     """
 
     new_message = pyqtSignal(dict)
     connection_lost = pyqtSignal()
     message_205 = pyqtSignal()
 
-    def __init__(self, port, ip, name, db, password, keys):
+    def __init__(self, port, ip, name, db, password, keys, token_file=None):
         """
         Метод __init__, который помимо стандартных своих функций проверяет пароль пользователя и устанавливает
-        соединение с сервером
+        соединение с сервером. Если в token_file сохранён токен возобновления сессии, он передаётся серверу,
+        и при его действительности проверка пароля (и дорогое вычисление хэша пароля) пропускается
         """
         threading.Thread.__init__(self)
         QObject.__init__(self)
@@ -38,8 +48,21 @@ class ClientTransport(threading.Thread, QObject):
         self.db = db
         self.password = password
         self.keys = keys
+        self.framed = False
+        self.codec = JSON_CODEC
+        self.envelope = False
+        self.directory_version = 0
+        self.token_file = token_file
+        self.session_token = self.load_session_token()
+        self.send_lock = threading.Lock()
+        self.waiters = OrderedDict()
+        self.request_ids = itertools.count(1)
+        self.pushes = queue.SimpleQueue()
+        self.stream = None
+        self.running = False
 
         self.transport = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.transport.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         self.transport.settimeout(5)
 
         connected = False
@@ -59,40 +82,54 @@ class ClientTransport(threading.Thread, QObject):
             logger.critical('Не удалось установить соединение с сервером')
             raise ServerError('Не удалось установить соединение с сервером')
 
-        password_bytes = self.password.encode('utf-8')
-        salt = self.name.lower().encode('utf-8')
-        password_hash = binascii.hexlify(hashlib.pbkdf2_hmac('sha512', password_bytes, salt, 10000))
-        logger.debug(f'Password hash ready: {password_hash}')
-
         pubkey = self.keys.publickey().export_key().decode('ascii')
 
-        with transport_lock:
-            presence = {
-                ACTION: PRESENCE,
-                TIME: time.time(),
-                USER: {
-                    ACCOUNT_NAME: self.name,
-                    PUBLIC_KEY: pubkey
-                }
-            }
-            logger.debug(f"Presense message = {presence}")
-            try:
-                send_message(self.transport, presence)
-                ans = get_message(self.transport)
-                logger.debug(f'Server response = {ans}.')
-                if RESPONSE in ans:
-                    if ans[RESPONSE] == 400:
-                        raise ServerError(ans[ERROR])
-                    elif ans[RESPONSE] == 511:
-                        ans_data = ans[BIN]
-                        hash = hmac.new(password_hash, ans_data.encode('utf-8'), 'MD5').digest()
-                        my_ans = RESPONSE_511
-                        my_ans[BIN] = binascii.b2a_base64(hash).decode('ascii')
-                        send_message(self.transport, my_ans)
-                        self.process_response_ans(get_message(self.transport))
-            except (OSError, json.JSONDecodeError) as err:
-                logger.debug(f'Connection error.', exc_info=err)
-                raise ServerError('Сбой соединения в процессе авторизации.')
+        presence = {
+            ACTION: PRESENCE,
+            TIME: time.time(),
+            USER: {
+                ACCOUNT_NAME: self.name,
+                PUBLIC_KEY: pubkey
+            },
+            FEATURES: SUPPORTED_FEATURES,
+            CODECS: CODEC_PREFERENCE
+        }
+        if self.session_token:
+            presence[SESSION_TOKEN] = self.session_token
+        logger.debug(f"Presense message = {presence}")
+        try:
+            send_message(self.transport, presence, self.framed)
+            ans = get_message(self.transport, self.framed)
+            logger.debug(f'Server response = {ans}.')
+            if RESPONSE in ans:
+                if ans[RESPONSE] == 400:
+                    raise ServerError(ans[ERROR])
+                elif ans[RESPONSE] == 200:
+                    logger.debug('Сессия возобновлена по токену.')
+                    self.framed = FRAMING in ans.get(FEATURES, [])
+                    self.codec = get_codec(ans.get(CODEC)) if self.framed else JSON_CODEC
+                    self.envelope = ENVELOPE in ans.get(FEATURES, [])
+                    self.process_response_ans(ans)
+                elif ans[RESPONSE] == 511:
+                    self.framed = FRAMING in ans.get(FEATURES, [])
+                    self.codec = get_codec(ans.get(CODEC)) if self.framed else JSON_CODEC
+                    self.envelope = ENVELOPE in ans.get(FEATURES, [])
+                    password_hash = self.get_password_hash()
+                    ans_data = ans[BIN]
+                    hash = hmac.new(password_hash, ans_data.encode('utf-8'), 'MD5').digest()
+                    my_ans = RESPONSE_511
+                    my_ans[BIN] = binascii.b2a_base64(hash).decode('ascii')
+                    send_message(self.transport, my_ans, self.framed, self.codec)
+                    self.process_response_ans(get_message(self.transport, self.framed, self.codec))
+        except (OSError, ValueError) as err:
+            logger.debug(f'Connection error.', exc_info=err)
+            raise ServerError('Сбой соединения в процессе авторизации.')
+
+        self.stream = MessageStream(self.framed, self.codec)
+        self.transport.settimeout(None)
+        self.running = True
+        self.receiver = threading.Thread(target=self.receive_messages, daemon=True)
+        self.receiver.start()
 
         try:
             self.renew_users()
@@ -106,24 +143,173 @@ class ClientTransport(threading.Thread, QObject):
             logger.critical(f'Потеряно соединение с сервером.')
             raise ServerError('Потеряно соединение с сервером!')
 
-        self.running = True
+    def submit_request(self, message):
+        """
+        :param message: словарь запроса
+        Метод, отправляющий запрос серверу с новым идентификатором запроса и возвращающий Future, в который
+        поток-приёмник запишет ответ. Не ждёт ответа, поэтому запросы можно отправлять один за другим.
+        Сообщения пользователям, если сервер поддерживает конверты, отправляются кадром-конвертом, который
+        сервер пересылает получателю без разбора
+        """
+
+        waiter = Future()
+        with self.send_lock:
+            if not self.running:
+                raise ConnectionResetError(errno.ECONNRESET, 'Потеряно соединение с сервером')
+            request_id = next(self.request_ids)
+            waiter.request_id = request_id
+            self.waiters[request_id] = waiter
+            try:
+                if self.envelope and message.get(ACTION) == MESSAGE:
+                    self.transport.sendall(self.stream.encode_envelope(message, request_id))
+                else:
+                    message[REQUEST_ID] = request_id
+                    send_message(self.transport, message, self.framed, self.codec)
+            except OSError:
+                del self.waiters[request_id]
+                raise
+        return waiter
+
+    def request(self, message):
+        """
+        :param message: словарь запроса
+        Метод, отправляющий запрос серверу и ожидающий ответа на него
+        """
+
+        return self.wait_response(self.submit_request(message))
+
+    def wait_response(self, waiter):
+        """
+        :param waiter: Future запроса
+        Метод, ожидающий ответа сервера на запрос. Если сервер не ответил вовремя, запрос отменяется,
+        чтобы ответы на следующие запросы не доставались ему
+        """
+
+        try:
+            return waiter.result(timeout=RESPONSE_TIMEOUT)
+        except FutureTimeoutError:
+            if self.cancel_request(waiter):
+                raise TimeoutError('Сервер не ответил на запрос')
+        return waiter.result()
+
+    def cancel_request(self, waiter):
+        """
+        :param waiter: Future запроса
+        Метод, удаляющий запрос из ожидающих ответа и отменяющий его Future. Возвращает False, если ответ
+        уже передан запросу
+        """
+
+        with self.send_lock:
+            if self.waiters.get(waiter.request_id) is not waiter:
+                return False
+            del self.waiters[waiter.request_id]
+        waiter.cancel()
+        return True
+
+    def complete_request(self, message):
+        """
+        :param message: словарь ответа сервера
+        Метод, передающий ответ сервера ожидающему его запросу. Возвращает False, если такого запроса нет
+        """
+
+        with self.send_lock:
+            if REQUEST_ID in message:
+                waiter = self.waiters.pop(message[REQUEST_ID], None)
+            elif self.waiters:
+                waiter = self.waiters.popitem(last=False)[1]
+            else:
+                waiter = None
+        if waiter is None:
+            return False
+        waiter.set_result(message)
+        return True
+
+    def receive_messages(self):
+        """
+        Метод потока-приёмника: читает данные из сокета, передаёт ответы сервера ожидающим запросам,
+        а остальные сообщения ставит в очередь на обработку
+        """
+
+        logger.debug('Запущен процесс - приёмник сообщений с сервера.')
+        while True:
+            try:
+                data = self.transport.recv(RECV_BUFFER_SIZE)
+                if not data:
+                    raise ConnectionResetError(errno.ECONNRESET, 'Сервер закрыл соединение')
+                messages = self.stream.feed(data)
+            except (OSError, ValueError, TypeError) as err:
+                if self.running:
+                    logger.critical(f'Потеряно соединение с сервером.', exc_info=err)
+                    self.running = False
+                    self.connection_lost.emit()
+                break
+            for message in messages:
+                logger.debug(f'Принято сообщение с сервера: {message}')
+                if not (RESPONSE in message and message[RESPONSE] != 205 and self.complete_request(message)):
+                    self.pushes.put(message)
+        with self.send_lock:
+            self.running = False
+            waiters, self.waiters = self.waiters, OrderedDict()
+        for waiter in waiters.values():
+            waiter.set_exception(ConnectionResetError(errno.ECONNRESET, 'Потеряно соединение с сервером'))
+        self.pushes.put(None)
+
+    def get_password_hash(self):
+        """
+        Метод, вычисляющий хэш пароля пользователя. Вызывается только когда сервер запросил проверку пароля
+        """
+
+        password_bytes = self.password.encode('utf-8')
+        salt = self.name.lower().encode('utf-8')
+        password_hash = binascii.hexlify(hashlib.pbkdf2_hmac('sha512', password_bytes, salt, 10000))
+        logger.debug(f'Password hash ready: {password_hash}')
+        return password_hash
+
+    def load_session_token(self):
+        """
+        Метод, читающий сохранённый токен возобновления сессии
+        """
+
+        if not self.token_file or not os.path.exists(self.token_file):
+            return None
+        with open(self.token_file, 'r', encoding='ascii') as file:
+            return file.read().strip() or None
+
+    def save_session_token(self, token):
+        """
+        :param token: токен возобновления сессии, выданный сервером
+
+        Метод, сохраняющий токен возобновления сессии для следующего подключения. Токен позволяет войти
+        без пароля, поэтому файл доступен только владельцу, как и файл секрета токенов на сервере
+        """
+
+        self.session_token = token
+        if not self.token_file:
+            return
+        try:
+            descriptor = os.open(self.token_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            if hasattr(os, 'fchmod'):
+                os.fchmod(descriptor, 0o600)
+            with os.fdopen(descriptor, 'w', encoding='ascii') as file:
+                file.write(token)
+        except OSError as err:
+            logger.error(f'Не удалось сохранить токен сессии: {err}')
 
     def renew_users(self):
         """
         Метод, обновляющий таблицу доступных пользователей в базе данных текущего пользователя
         """
 
-        with transport_lock:
-            send_message(self.transport, {
-                ACTION: GET_USERS,
-                TIME: time.time(),
-                ACCOUNT_NAME: self.name
-            })
-            response = get_message(self.transport)
+        response = self.request({
+            ACTION: GET_USERS,
+            TIME: time.time(),
+            ACCOUNT_NAME: self.name
+        })
         logger.info(f'Получено сообщение от сервера {response}')
         if RESPONSE in response and response[RESPONSE] == 202 and DATA in response and isinstance(response[DATA],
                                                                                                   list):
             self.db.renew_users(response[DATA])
+            self.directory_version = response.get(DIRECTORY_VERSION, 0)
         else:
             logger.error('Не удалось обновить список доступных пользователей')
 
@@ -132,13 +318,11 @@ class ClientTransport(threading.Thread, QObject):
         Метод, обновляющий таблицу контактов в базе данных текущего пользователя
         """
 
-        with transport_lock:
-            send_message(self.transport, {
-                ACTION: GET_CONTACTS,
-                TIME: time.time(),
-                ACCOUNT_NAME: self.name
-            })
-            response = get_message(self.transport)
+        response = self.request({
+            ACTION: GET_CONTACTS,
+            TIME: time.time(),
+            ACCOUNT_NAME: self.name
+        })
         logger.info(f'Получено сообщение от сервера {response}')
         if RESPONSE in response and response[RESPONSE] == 202 and DATA in response and isinstance(response[DATA],
                                                                                                   list):
@@ -150,19 +334,23 @@ class ClientTransport(threading.Thread, QObject):
     def get_key(self, user):
         """
         :param user: имя пользователя, чей ключ нужно получить
-        Метод, запрашивающий публичный ключ данного пользователя
+        Метод, возвращающий публичный ключ данного пользователя. Ключ запрашивается у сервера, только если его
+        нет в базе данных текущего пользователя или срок его хранения истёк. Сервер сообщает о смене ключа
+        в изменениях списка пользователей, и сохранённый ключ удаляется
         """
 
+        key = self.db.get_public_key(user)
+        if key is not None:
+            return key
         logger.debug(f'Запрос публичного ключа для {user}')
         req = {
             ACTION: GET_PUBLIC_KEY,
             TIME: time.time(),
             ACCOUNT_NAME: user
         }
-        with transport_lock:
-            send_message(self.transport, req)
-            response = get_message(self.transport)
+        response = self.request(req)
         if RESPONSE in response and response[RESPONSE] == 511:
+            self.db.save_public_key(user, response[BIN])
             return response[BIN]
         else:
             logger.error(f'Не удалось получить ключ собеседника{user}.')
@@ -176,6 +364,8 @@ class ClientTransport(threading.Thread, QObject):
         logger.debug(f'Разбор сообщения: {message}')
         if RESPONSE in message:
             if message[RESPONSE] == 200:
+                if SESSION_TOKEN in message:
+                    self.save_session_token(message[SESSION_TOKEN])
                 return
             elif message[RESPONSE] == 400:
                 raise ServerError(f'400 : {message[ERROR]}')
@@ -185,25 +375,56 @@ class ClientTransport(threading.Thread, QObject):
                 self.message_205.emit()
             else:
                 logger.debug(f'Принят неизвестный код подтверждения {message[RESPONSE]}')
+        elif ACTION in message and message[ACTION] == DIRECTORY_UPDATE and DIRECTORY_VERSION in message:
+            self.apply_directory_update(message)
         elif ACTION in message and message[ACTION] == MESSAGE and \
                 SENDER in message and MESSAGE_TEXT in message and RECEIVER in message \
                 and message[RECEIVER] == self.name:
-            logger.info(f'Получено сообщение от пользователя {message[SENDER]}:\n{message[MESSAGE_TEXT]}')
+            logger.info(f'Получено сообщение от пользователя {message[SENDER]}')
+            message[MESSAGE_TEXT] = message_bytes(message[MESSAGE_TEXT])
             self.new_message.emit(message)
 
+    def apply_directory_update(self, message):
+        """
+        :param message: словарь с изменениями списка пользователей сервера
+        Метод, применяющий к базе данных текущего пользователя изменения списка пользователей, присланные сервером.
+        Если часть изменений пропущена (версии идут не подряд), списки пользователей и контактов
+        загружаются с сервера полностью, а сохранённые открытые ключи удаляются, так как смена ключа
+        могла быть среди пропущенных изменений
+        """
+
+        if message[DIRECTORY_VERSION] <= self.directory_version:
+            return
+        changes = [change for change in message.get(DATA, []) if change[0] > self.directory_version]
+        if not changes or changes[0][0] != self.directory_version + 1:
+            logger.info(f'Пропущены изменения списка пользователей после версии {self.directory_version}, '
+                        f'выполняется полная синхронизация.')
+            self.renew_users()
+            self.renew_contacts()
+            self.db.clear_public_keys()
+        else:
+            for version, user, change in changes:
+                if change == USER_ADDED:
+                    self.db.add_user(user)
+                elif change == USER_REMOVED:
+                    self.db.remove_user(user)
+                elif change == KEY_CHANGED:
+                    self.db.forget_public_key(user)
+                logger.debug(f'Применено изменение списка пользователей {version}: {user} {change}')
+            self.directory_version = message[DIRECTORY_VERSION]
+        self.message_205.emit()
+
     def add_contact(self, contact):
         """
         :param contact: имя пользователя, которого нужно добавил в контакты
         Метод, запрашивающий добавление другого пользователя в контакты текущего пользователя
         """
 
-        with transport_lock:
-            send_message(self.transport, {ACTION: ADD_CONTACT,
-                                          ACCOUNT_NAME: self.name,
-                                          TIME: time.time(),
-                                          CONTACT: contact
-                                          })
-            self.process_response_ans(get_message(self.transport))
+        self.process_response_ans(self.request({ACTION: ADD_CONTACT,
+                                                ACCOUNT_NAME: self.name,
+                                                TIME: time.time(),
+                                                CONTACT: contact
+                                                }))
 
     def delete_contact(self, contact):
         """
@@ -211,37 +432,36 @@ class ClientTransport(threading.Thread, QObject):
         Метод, запрашивающий удаление другого пользователя из списка текущего пользователя
         """
 
-        with transport_lock:
-            send_message(self.transport, {ACTION: DEL_CONTACT,
-                                          ACCOUNT_NAME: self.name,
-                                          TIME: time.time(),
-                                          CONTACT: contact
-                                          })
-            self.process_response_ans(get_message(self.transport))
+        self.process_response_ans(self.request({ACTION: DEL_CONTACT,
+                                                ACCOUNT_NAME: self.name,
+                                                TIME: time.time(),
+                                                CONTACT: contact
+                                                }))
 
     def transport_shutdown(self):
         """
         Метод, осуществляющий завершение работы клиента
         """
 
-        self.running = False
-        with transport_lock:
+        with self.send_lock:
+            self.running = False
             try:
                 send_message(self.transport, {
                         ACTION: EXIT,
                         TIME: time.time(),
                         ACCOUNT_NAME: self.name
-                    })
+                    }, self.framed, self.codec)
+                self.transport.shutdown(socket.SHUT_RDWR)
             except OSError:
                 pass
         logger.info('Завершение работы')
-        time.sleep(0.5)
 
-    def send_message(self, receiver, message):
+    def send_message_async(self, receiver, message):
         """
         :param receiver: имя получателя сообщения
-        :param message: текст сообщения
-        Метод, запрашивающий отправление сообщения от текущего пользователя другому пользователю
+        :param message: зашифрованный текст сообщения (байты)
+        Метод, отправляющий сообщение другому пользователю без ожидания ответа сервера. Возвращает Future
+        с ответом сервера
         """
 
         message_dict = {
@@ -252,38 +472,30 @@ class ClientTransport(threading.Thread, QObject):
             MESSAGE_TEXT: message
         }
         logger.debug(f'Сформирован словарь сообщения: {message_dict}')
+        return self.submit_request(message_dict)
 
-        with transport_lock:
-            send_message(self.transport, message_dict)
-            self.process_response_ans(get_message(self.transport))
-            logger.info(f'Отправлено сообщение для пользователя {receiver}')
+    def send_message(self, receiver, message):
+        """
+        :param receiver: имя получателя сообщения
+        :param message: текст сообщения
+        Метод, запрашивающий отправление сообщения от текущего пользователя другому пользователю
+        """
+
+        response = self.wait_response(self.send_message_async(receiver, message))
+        self.process_response_ans(response)
+        logger.info(f'Отправлено сообщение для пользователя {receiver}')
 
     def run(self):
         """
-        Метод, отслеживающий входящие сообщения и осуществляющий их приём
+        Метод, обрабатывающий сообщения, которые сервер присылает без запроса: сообщения других пользователей
+        и изменения списка пользователей. Завершается после закрытия соединения
         """
 
-        logger.debug('Запущен процесс - приёмник сообщений с сервера.')
-        while self.running:
-            time.sleep(1)
-            message = None
-            with transport_lock:
-                try:
-                    self.transport.settimeout(0.5)
-                    message = get_message(self.transport)
-                except OSError as err:
-                    if err.errno:
-                        logger.critical(f'Потеряно соединение с сервером.')
-                        self.running = False
-                        self.connection_lost.emit()
-                except (ConnectionError, ConnectionAbortedError,
-                        ConnectionResetError, json.JSONDecodeError, TypeError):
-                    logger.debug(f'Потеряно соединение с сервером.')
-                    self.running = False
-                    self.connection_lost.emit()
-                finally:
-                    self.transport.settimeout(5)
-
-            if message:
-                logger.debug(f'Принято сообщение с сервера: {message}')
-                self.process_response_ans(message)
\ No newline at end of file
+        while True:
+            message = self.pushes.get()
+            if message is None:
+                break
+            try:
+                self.process_response_ans(message)
+            except (OSError, ServerError) as err:
+                logger.error(f'Не удалось обработать сообщение сервера {message}: {err}')
@@ -1,6 +1,9 @@
+import functools
+import itertools
 import sys
 import logging
 import socket
+from server_dist.server.common.variables import LOG_SAMPLE_RATE
 
 # метод определения модуля, источника запуска.
 if sys.argv[0].find('client_dist') == -1:
@@ -11,16 +14,33 @@ else:
     logger = logging.getLogger('client_dist')
 
 
-def log(func_to_log):
+def log(func_to_log=None, sample_rate=LOG_SAMPLE_RATE):
     """
     :param func_to_log: функция для декорирования
-    Функция-декоратор, осуществляющая логирование других функций
+    :param sample_rate: доля записываемых вызовов, от 0 до 1
+    Функция-декоратор, осуществляющая логирование других функций. Уровень логирования проверяется при каждом
+    вызове, а строка сообщения собирается логгером только если запись действительно попадёт в лог, поэтому
+    при отключённом уровне DEBUG декоратор почти ничего не стоит. При sample_rate меньше 1 записывается
+    каждый n-й вызов, например @log(sample_rate=0.01) записывает каждый сотый вызов
     """
 
+    if func_to_log is None:
+        return functools.partial(log, sample_rate=sample_rate)
+    if sample_rate <= 0:
+        return func_to_log
+
+    is_enabled = logger.isEnabledFor
+    every = max(1, round(1 / sample_rate))
+    calls = itertools.count()
+    name = func_to_log.__name__
+    module = func_to_log.__module__
+
+    @functools.wraps(func_to_log)
     def log_saver(*args, **kwargs):
-        logger.debug(f'Была вызвана функция {func_to_log.__name__} c параметрами {args} , {kwargs}. Вызов из модуля {func_to_log.__module__}')
-        ret = func_to_log(*args, **kwargs)
-        return ret
+        if is_enabled(logging.DEBUG) and (every == 1 or next(calls) % every == 0):
+            logger.debug('Была вызвана функция %s c параметрами %r , %r. Вызов из модуля %s',
+                         name, args, kwargs, module)
+        return func_to_log(*args, **kwargs)
     return log_saver
 
 
@@ -31,20 +51,25 @@ def login_required(func):
     """
 
     def checker(*args, **kwargs):
-        from server_dist.server.server_files import MessageProcessor
-        from server_dist.server.common import ACTION, PRESENCE
+        from server_dist.server.server_files.core import MessageProcessor
+        from server_dist.server.server_files.async_core import StreamClient
+        from server_dist.server.common.variables import ACTION, PRESENCE, RESPONSE
         if isinstance(args[0], MessageProcessor):
             found = False
+            auth_pending = False
             for arg in args:
-                if isinstance(arg, socket.socket):
-                    for client in args[0].names:
-                        if args[0].names[client] == arg:
-                            found = True
+                if isinstance(arg, (socket.socket, StreamClient)):
+                    if args[0].registry.name_of(arg) is not None:
+                        found = True
+                    if arg in args[0].auth_pending:
+                        auth_pending = True
 
             for arg in args:
                 if isinstance(arg, dict):
                     if ACTION in arg and arg[ACTION] == PRESENCE:
                         found = True
+                    elif auth_pending and RESPONSE in arg and arg[RESPONSE] == 511:
+                        found = True
             if not found:
                 raise TypeError
         return func(*args, **kwargs)
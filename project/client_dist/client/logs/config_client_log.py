@@ -3,6 +3,7 @@ import os
 sys.path.append('../../../')
 import logging
 from server_dist.server.common.variables import LOGGING_LEVEL
+from server_dist.server.common.log_queue import BatchFileHandler, start_log_listener
 
 # создаём формировщик логов (formatter):
 client_formatter = logging.Formatter('%(asctime)s %(levelname)s %(filename)s %(message)s')
@@ -11,12 +12,12 @@ client_formatter = logging.Formatter('%(asctime)s %(levelname)s %(filename)s %(m
 path = os.path.dirname(os.path.abspath(__file__))
 path = os.path.join(path, 'client.log')
 
-log_file = logging.FileHandler(path, encoding='utf8')
+log_file = BatchFileHandler(path, encoding='utf8')
 log_file.setFormatter(client_formatter)
 
-# создаём регистратор и настраиваем его
+# создаём регистратор и настраиваем его: записи пишутся в файл отдельным потоком
 logger = logging.getLogger('client_dist')
-logger.addHandler(log_file)
+start_log_listener(logger, log_file)
 logger.setLevel(LOGGING_LEVEL)
 
 # отладка
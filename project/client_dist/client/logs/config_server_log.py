@@ -3,6 +3,7 @@ sys.path.append('../../../')
 import logging.handlers
 import os
 from server_dist.server.common.variables import LOGGING_LEVEL
+from server_dist.server.common.log_queue import BatchTimedRotatingFileHandler, start_log_listener
 
 # создаём формировщик логов (formatter):
 server_formatter = logging.Formatter('%(asctime)s %(levelname)s %(filename)s %(message)s')
@@ -11,12 +12,12 @@ server_formatter = logging.Formatter('%(asctime)s %(levelname)s %(filename)s %(m
 path = os.path.dirname(os.path.abspath(__file__))
 path = os.path.join(path, 'server.log')
 
-log_file = logging.handlers.TimedRotatingFileHandler(path, encoding='utf8', interval=1, when='D')
+log_file = BatchTimedRotatingFileHandler(path, encoding='utf8', interval=1, when='D')
 log_file.setFormatter(server_formatter)
 
-# создаём регистратор и настраиваем его
+# создаём регистратор и настраиваем его: записи пишутся в файл отдельным потоком
 logger = logging.getLogger('server_dist')
-logger.addHandler(log_file)
+start_log_listener(logger, log_file)
 logger.setLevel(LOGGING_LEVEL)
 
 # отладка
@@ -0,0 +1,282 @@
+import atexit
+import collections
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+from server_dist.server.common.variables import LOG_QUEUE_SIZE, LOG_QUEUE_RESERVE, LOG_BATCH_SIZE, \
+    LOG_FLUSH_INTERVAL
+
+# Запущенные потоки записи логов и обработчики, передающие им записи
+pipelines = []
+
+
+class BatchFlushMixin:
+    """
+    Класс-примесь для файловых обработчиков логов: файл не сбрасывается на диск после каждой записи,
+    это делает поток записи логов методом flush_batch после пачки записей
+    """
+
+    def flush(self):
+        pass
+
+    def flush_batch(self):
+        super().flush()
+
+
+class BatchFileHandler(BatchFlushMixin, logging.FileHandler):
+    """
+    Класс файлового обработчика логов со сбросом на диск пачками
+    """
+
+
+class BatchTimedRotatingFileHandler(BatchFlushMixin, logging.handlers.TimedRotatingFileHandler):
+    """
+    Класс файлового обработчика логов с ежедневной ротацией и сбросом на диск пачками
+    """
+
+
+class LogBuffer:
+    """
+    Класс ограниченной очереди записей логов. Записи добавляются без блокировок, а поток записи логов
+    будится, только когда накопилась пачка записей или пришло предупреждение либо ошибка, и в любом случае
+    не реже раза в interval секунд. Так поток, создающий записи, не переключается на поток записи
+    после каждой записи
+    """
+
+    def __init__(self, maxsize, batch_size=LOG_BATCH_SIZE, interval=LOG_FLUSH_INTERVAL):
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.interval = interval
+        self.records = collections.deque()
+        self.ready = threading.Event()
+
+    def qsize(self):
+        return len(self.records)
+
+    def put_nowait(self, record):
+        """
+        :param record: запись лога
+
+        Метод, добавляющий запись в очередь. Если очередь заполнена, возбуждается queue.Full
+        """
+
+        if len(self.records) >= self.maxsize:
+            raise queue.Full
+        self.records.append(record)
+        if len(self.records) >= self.batch_size or record.levelno >= logging.WARNING:
+            self.ready.set()
+
+    def put(self, record):
+        """
+        :param record: запись лога или признак остановки потока записи
+
+        Метод, добавляющий запись без учёта размера очереди и сразу будящий поток записи
+        """
+
+        self.records.append(record)
+        self.ready.set()
+
+    def get_nowait(self):
+        try:
+            return self.records.popleft()
+        except IndexError:
+            raise queue.Empty
+
+    def get(self, block=True):
+        """
+        Метод, возвращающий следующую запись и ожидающий её, если очередь пуста
+        """
+
+        while True:
+            try:
+                return self.records.popleft()
+            except IndexError:
+                if not block:
+                    raise queue.Empty
+            self.ready.wait(self.interval)
+            self.ready.clear()
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Класс обработчика, передающего записи логов в ограниченную очередь потока записи. Поток, создавший запись,
+    никогда не ждёт: когда в очереди остаётся меньше reserve мест, записи уровня ниже WARNING отбрасываются,
+    а оставшиеся места занимают только предупреждения и ошибки. Число отброшенных записей по уровням
+    попадает в лог одной записью, как только в очереди освобождается место
+    """
+
+    def __init__(self, log_queue, reserve=LOG_QUEUE_RESERVE):
+        super().__init__(log_queue)
+        self.low_priority_limit = log_queue.maxsize - reserve
+        self.dropped = {}
+
+    def prepare(self, record):
+        """
+        :param record: запись лога
+
+        Метод, подготавливающий запись к передаче в очередь. Текст сообщения собирается сразу, потому что
+        его аргументы могут измениться после вызова, а оформление строки остаётся потоку записи
+        """
+
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def emit(self, record):
+        """
+        :param record: запись лога
+
+        Метод, помещающий запись в очередь или отбрасывающий её, если очередь заполнена
+        """
+
+        try:
+            if record.levelno < logging.WARNING and self.queue.qsize() >= self.low_priority_limit:
+                self.count_dropped(record)
+                return
+            if self.dropped:
+                self.report_dropped(record.name)
+            self.queue.put_nowait(self.prepare(record))
+        except queue.Full:
+            self.count_dropped(record)
+        except Exception:
+            self.handleError(record)
+
+    def count_dropped(self, record):
+        """
+        :param record: отброшенная запись лога
+
+        Метод, учитывающий отброшенную запись
+        """
+
+        self.dropped[record.levelname] = self.dropped.get(record.levelname, 0) + 1
+
+    def report_dropped(self, name):
+        """
+        :param name: имя логгера
+
+        Метод, помещающий в очередь запись о числе отброшенных записей
+        """
+
+        summary = ', '.join(f'{level}: {count}' for level, count in self.dropped.items())
+        self.queue.put_nowait(logging.LogRecord(
+            name, logging.WARNING, __file__, 0, f'Очередь логирования переполнена, отброшено записей - {summary}',
+            None, None))
+        self.dropped = {}
+
+
+class BatchQueueListener(logging.handlers.QueueListener):
+    """
+    Класс потока записи логов: забирает записи из очереди и передаёт их обработчикам. Файлы сбрасываются
+    на диск, когда очередь опустела или записано batch_size записей подряд
+    """
+
+    def __init__(self, log_queue, *handlers, batch_size=LOG_BATCH_SIZE):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.batch_size = batch_size
+        self.pending = 0
+        self.running = False
+
+    def start(self):
+        """
+        Метод, запускающий поток записи логов
+        """
+
+        self._thread = None
+        super().start()
+        self.running = True
+
+    def stop(self):
+        """
+        Метод, дожидающийся записи всех записей из очереди и останавливающий поток
+        """
+
+        if not self.running:
+            return
+        self.running = False
+        super().stop()
+        self.flush_batch()
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+    def dequeue(self, block):
+        if self.pending:
+            try:
+                return self.queue.get_nowait()
+            except queue.Empty:
+                self.flush_batch()
+        return self.queue.get(block)
+
+    def handle(self, record):
+        super().handle(record)
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush_batch()
+
+    def flush_batch(self):
+        """
+        Метод, сбрасывающий записанное обработчиками на диск
+        """
+
+        for handler in self.handlers:
+            getattr(handler, 'flush_batch', handler.flush)()
+        self.pending = 0
+
+
+def start_log_listener(logger, *handlers, size=LOG_QUEUE_SIZE):
+    """
+    :param logger: логгер
+    :param handlers: обработчики, в которые записывает поток записи логов
+    :param size: размер очереди записей
+
+    Функция, подключающая к логгеру асинхронную запись: логгер только помещает записи в очередь,
+    а форматирование и запись в файлы выполняет отдельный поток
+    """
+
+    log_queue = LogBuffer(size)
+    listener = BatchQueueListener(log_queue, *handlers)
+    queue_handler = DroppingQueueHandler(log_queue)
+    logger.addHandler(queue_handler)
+    pipelines.append((queue_handler, listener))
+    listener.start()
+    return listener
+
+
+def stop_log_listeners():
+    """
+    Функция, дописывающая очереди записей логов и останавливающая потоки записи
+    """
+
+    for queue_handler, listener in pipelines:
+        listener.stop()
+
+
+def flush_log_files():
+    """
+    Функция, сбрасывающая файлы логов на диск перед fork, чтобы дочерний процесс не унаследовал
+    несброшенные данные и не записал их повторно
+    """
+
+    for queue_handler, listener in pipelines:
+        for handler in listener.handlers:
+            getattr(handler, 'flush_batch', handler.flush)()
+
+
+def restart_log_listeners():
+    """
+    Функция, запускающая потоки записи логов в дочернем процессе: после fork потоков в нём нет, а очереди
+    могли остаться заблокированными, поэтому они создаются заново
+    """
+
+    for queue_handler, listener in pipelines:
+        if listener.running:
+            queue_handler.queue = listener.queue = LogBuffer(listener.queue.maxsize)
+            listener.pending = 0
+            listener.start()
+
+
+atexit.register(stop_log_listeners)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(before=flush_log_files, after_in_child=restart_log_listeners)
@@ -1,34 +1,304 @@
 from server_dist.server.common.variables import *
+import base64
 import json
+import struct
 import sys
 sys.path.append('../../../')
-from server_dist.server.common.decos import log
+from server_dist.server.common.decos import log, logger
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
-@log
-def get_message(client):
+# Заголовок кадра: длина сообщения в байтах
+FRAME_HEADER = struct.Struct('!I')
+# Заголовок кадра-конверта: признак конверта, идентификатор запроса, длины имён отправителя и получателя.
+# Сообщение JSON начинается с '{', словарь MessagePack - с байта 0x80 и выше, поэтому нулевой первый байт
+# однозначно отличает конверт от обычного кадра
+ENVELOPE_MARKER = 0
+ENVELOPE_HEADER = struct.Struct('!BQHH')
+
+
+class JsonCodec:
     """
-    :param client: сокет с которого должно прийти сообщение
-    Функция, осуществляющая приём сообщения с определенного сокета
+    Класс, сериализующий сообщения в JSON. Байтовые значения (например, зашифрованный текст сообщения)
+    передаются строкой base64
+    """
+
+    name = CODEC_JSON
+
+    @staticmethod
+    def encode_bytes(value):
+        if isinstance(value, (bytes, bytearray)):
+            return base64.b64encode(value).decode('ascii')
+        raise TypeError(f'Объект типа {type(value).__name__} не сериализуется в JSON')
+
+    def encode(self, message):
+        return json.dumps(message, default=self.encode_bytes).encode(ENCODING)
+
+    def decode(self, data):
+        return json.loads(data.decode(ENCODING) if isinstance(data, (bytes, bytearray)) else data)
+
+
+class MsgpackCodec:
+    """
+    Класс, сериализующий сообщения в MessagePack. Байтовые значения передаются как есть, без base64
     """
 
-    encoded_response = client.recv(MAX_PACKAGE_LENGTH)
-    json_response = encoded_response.decode(ENCODING)
-    response = json.loads(json_response)
+    name = CODEC_MSGPACK
+
+    def encode(self, message):
+        return msgpack.packb(message, use_bin_type=True)
+
+    def decode(self, data):
+        return msgpack.unpackb(data, raw=False)
+
+
+JSON_CODEC = JsonCodec()
+CODECS_AVAILABLE = {JSON_CODEC.name: JSON_CODEC}
+if msgpack is not None:
+    CODECS_AVAILABLE[CODEC_MSGPACK] = MsgpackCodec()
+# Форматы в порядке предпочтения: сначала двоичные
+CODEC_PREFERENCE = [name for name in (CODEC_MSGPACK, CODEC_JSON) if name in CODECS_AVAILABLE]
+
+
+def choose_codec(offered):
+    """
+    :param offered: список форматов, предложенных другой стороной, в порядке её предпочтения
+    Функция, выбирающая первый из предложенных форматов, который поддерживается локально
+    """
+
+    for name in offered or ():
+        if name in CODECS_AVAILABLE:
+            return CODECS_AVAILABLE[name]
+    return JSON_CODEC
+
+
+def get_codec(name):
+    """
+    :param name: название формата
+    Функция, возвращающая объект формата по названию. Неизвестный формат заменяется на JSON
+    """
+
+    return CODECS_AVAILABLE.get(name, JSON_CODEC)
+
+
+def encode_message(message, framed=False, codec=JSON_CODEC):
+    """
+    :param message: словарь сообщения
+    :param framed: нужно ли добавлять к сообщению заголовок с его длиной
+    :param codec: формат сериализации
+    Функция, преобразующая сообщение в байты для отправки
+    """
+
+    encoded_message = codec.encode(message)
+    if framed:
+        return FRAME_HEADER.pack(len(encoded_message)) + encoded_message
+    return encoded_message
+
+
+def decode_message(encoded_message, codec=JSON_CODEC):
+    """
+    :param encoded_message: байты сообщения
+    :param codec: формат сериализации
+    Функция, преобразующая полученные байты в словарь сообщения
+    """
+
+    response = codec.decode(encoded_message)
     if isinstance(response, dict):
         return response
     else:
         raise TypeError
 
 
+def message_bytes(value):
+    """
+    :param value: зашифрованный текст сообщения: байты или строка base64
+    Функция, возвращающая зашифрованный текст сообщения в виде байтов независимо от формата, в котором
+    он был получен
+    """
+
+    if isinstance(value, str):
+        return base64.b64decode(value)
+    return bytes(value)
+
+
+def recv_exactly(client, length):
+    """
+    :param client: сокет, из которого читаются данные
+    :param length: количество байт, которое нужно прочитать
+    Функция, читающая из сокета ровно указанное количество байт
+    """
+
+    data = bytearray()
+    while len(data) < length:
+        chunk = client.recv(length - len(data))
+        if not chunk:
+            raise ConnectionResetError('Соединение закрыто')
+        data += chunk
+    return bytes(data)
+
+
+class Envelope:
+    """
+    Класс кадра-конверта с сообщением пользователю. Имена отправителя и получателя вынесены в небольшой
+    заголовок перед сообщением, поэтому сервер может переслать кадр получателю как есть, не декодируя
+    и не кодируя сообщение заново
+    """
+
+    __slots__ = ('frame', 'request_id', 'sender', 'receiver', 'payload_offset')
+
+    def __init__(self, frame):
+        if len(frame) < FRAME_HEADER.size + ENVELOPE_HEADER.size:
+            raise ValueError('Повреждён заголовок конверта')
+        marker, self.request_id, sender_length, receiver_length = \
+            ENVELOPE_HEADER.unpack_from(frame, FRAME_HEADER.size)
+        offset = FRAME_HEADER.size + ENVELOPE_HEADER.size
+        self.payload_offset = offset + sender_length + receiver_length
+        if self.payload_offset > len(frame):
+            raise ValueError('Повреждён заголовок конверта')
+        self.frame = frame
+        self.sender = frame[offset:offset + sender_length].decode(ENCODING)
+        self.receiver = frame[offset + sender_length:self.payload_offset].decode(ENCODING)
+
+    @staticmethod
+    def pack(message, request_id, codec):
+        """
+        :param message: словарь сообщения пользователю
+        :param request_id: идентификатор запроса или 0
+        :param codec: формат сериализации
+        Метод, упаковывающий сообщение в кадр-конверт
+        """
+
+        sender = message[SENDER].encode(ENCODING)
+        receiver = message[RECEIVER].encode(ENCODING)
+        payload = codec.encode(message)
+        header = ENVELOPE_HEADER.pack(ENVELOPE_MARKER, request_id, len(sender), len(receiver))
+        length = len(header) + len(sender) + len(receiver) + len(payload)
+        return b''.join((FRAME_HEADER.pack(length), header, sender, receiver, payload))
+
+    def forward(self):
+        """
+        Метод, возвращающий кадр для пересылки получателю: идентификатор запроса принадлежит соединению
+        отправителя, поэтому в пересылаемом кадре он обнуляется
+        """
+
+        if not self.request_id:
+            return self.frame
+        marker, request_id, sender_length, receiver_length = \
+            ENVELOPE_HEADER.unpack_from(self.frame, FRAME_HEADER.size)
+        header = ENVELOPE_HEADER.pack(marker, 0, sender_length, receiver_length)
+        offset = FRAME_HEADER.size + ENVELOPE_HEADER.size
+        return b''.join((self.frame[:FRAME_HEADER.size], header, self.frame[offset:]))
+
+    def decode(self, codec):
+        """
+        :param codec: формат сериализации
+        Метод, декодирующий сообщение из конверта. Идентификатор запроса добавляется в словарь сообщения.
+        Сервер проверяет только заголовок конверта и пересылает сообщение не разбирая, поэтому сообщение,
+        отправитель или получатель которого не совпадает с заголовком, считается поддельным: возбуждается
+        ValueError
+        """
+
+        message = decode_message(self.frame[self.payload_offset:], codec)
+        if message.get(SENDER) != self.sender or message.get(RECEIVER) != self.receiver:
+            raise ValueError('Отправитель или получатель сообщения не совпадает с заголовком конверта')
+        if self.request_id:
+            message[REQUEST_ID] = self.request_id
+        return message
+
+
+class MessageStream:
+    """
+    Класс, разбирающий поток байтов одного подключения на сообщения. Без кадрирования каждый приём данных
+    считается одним сообщением (старый протокол), с кадрированием данные накапливаются в буфере, и за один приём
+    может быть получено ноль или несколько сообщений. Формат сериализации задаётся атрибутом codec. Кадры-конверты
+    декодируются как обычные сообщения, а при relay=True (на сервере) возвращаются объектами Envelope без разбора.
+    Конверт, который не удалось декодировать или который подделан, отбрасывается без разрыва соединения: его
+    содержимое сервер не проверяет, и ошибка в нём - ошибка отправителя, а не соединения с сервером
+    """
+
+    def __init__(self, framed=False, codec=JSON_CODEC, relay=False):
+        self.framed = framed
+        self.codec = codec
+        self.relay = relay
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """
+        :param data: полученные из сокета байты
+        Метод, возвращающий список полностью полученных сообщений
+        """
+
+        if not self.framed:
+            return [decode_message(data, self.codec)]
+        self.buffer += data
+        messages = []
+        while len(self.buffer) >= FRAME_HEADER.size:
+            length, = FRAME_HEADER.unpack_from(self.buffer)
+            if length > MAX_FRAME_LENGTH:
+                raise ValueError(f'Слишком длинный кадр: {length} байт')
+            end = FRAME_HEADER.size + length
+            if len(self.buffer) < end:
+                break
+            if length and self.buffer[FRAME_HEADER.size] == ENVELOPE_MARKER:
+                envelope = Envelope(bytes(self.buffer[:end]))
+                if self.relay:
+                    messages.append(envelope)
+                else:
+                    try:
+                        messages.append(envelope.decode(self.codec))
+                    except (ValueError, TypeError) as err:
+                        logger.warning('Отброшен кадр-конверт от %s: %s', envelope.sender, err)
+            else:
+                messages.append(decode_message(bytes(self.buffer[FRAME_HEADER.size:end]), self.codec))
+            del self.buffer[:end]
+        return messages
+
+    def encode(self, message):
+        """
+        :param message: словарь сообщения
+        Метод, преобразующий сообщение в байты в соответствии с протоколом подключения
+        """
+
+        return encode_message(message, self.framed, self.codec)
+
+    def encode_envelope(self, message, request_id=0):
+        """
+        :param message: словарь сообщения пользователю
+        :param request_id: идентификатор запроса
+        Метод, упаковывающий сообщение пользователю в кадр-конверт в формате подключения
+        """
+
+        return Envelope.pack(message, request_id, self.codec)
+
+
+@log
+def get_message(client, framed=False, codec=JSON_CODEC):
+    """
+    :param client: сокет с которого должно прийти сообщение
+    :param framed: используется ли кадрирование сообщений
+    :param codec: формат сериализации
+    Функция, осуществляющая приём сообщения с определенного сокета
+    """
+
+    if framed:
+        length, = FRAME_HEADER.unpack(recv_exactly(client, FRAME_HEADER.size))
+        if length > MAX_FRAME_LENGTH:
+            raise ValueError(f'Слишком длинный кадр: {length} байт')
+        return decode_message(recv_exactly(client, length), codec)
+    return decode_message(client.recv(MAX_PACKAGE_LENGTH), codec)
+
+
 @log
-def send_message(sock, message):
+def send_message(sock, message, framed=False, codec=JSON_CODEC):
     """
     :param sock: сокет, на который нужно отправить сообщение
     :param message: словарь сообщения для отправки
+    :param framed: используется ли кадрирование сообщений
+    :param codec: формат сериализации
     Функция, осуществляющая отправку сообщений на определённый сокет
     """
 
-    js_message = json.dumps(message)
-    encoded_message = js_message.encode(ENCODING)
-    sock.send(encoded_message)
+    sock.sendall(encode_message(message, framed, codec))
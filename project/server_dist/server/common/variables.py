@@ -0,0 +1,141 @@
+import logging
+
+# Порт поумолчанию для сетевого ваимодействия
+DEFAULT_PORT = 7777
+# IP адрес по умолчанию для подключения клиента
+DEFAULT_IP_ADDRESS = '127.0.0.1'
+# Максимальная очередь подключений
+MAX_CONNECTIONS = 5
+# Максимальная длинна сообщения в байтах
+MAX_PACKAGE_LENGTH = 1024
+# Размер буфера для чтения из сокета при кадрированном протоколе
+RECV_BUFFER_SIZE = 65536
+# Максимальная длина одного кадра в байтах
+MAX_FRAME_LENGTH = 16 * 1024 * 1024
+# Размер очереди отправки клиента, после которого приостанавливается приём сообщений от его отправителей
+OUT_BUFFER_HIGH_WATER = 256 * 1024
+# Размер очереди отправки клиента, после которого клиент отключается как не успевающий принимать сообщения
+OUT_BUFFER_LIMIT = 4 * 1024 * 1024
+# Время в секундах, в течение которого переполненная очередь отправки может задерживать отправителей
+SLOW_CONSUMER_TIMEOUT = 30
+# Интервал в секундах, с которым статистика сообщений записывается в базу данных сервера
+STATS_FLUSH_INTERVAL = 5
+# Количество сообщений, после которого статистика записывается в базу данных сервера досрочно
+STATS_FLUSH_SIZE = 1000
+# Количество постоянных соединений в пуле базы данных сервера и допустимое число дополнительных
+DB_POOL_SIZE = 5
+DB_MAX_OVERFLOW = 10
+# Время в секундах, в течение которого соединение с базой данных ожидает снятия блокировки записи
+DB_BUSY_TIMEOUT = 5
+# Количество сообщений для отключённых пользователей, передаваемых за один шаг после входа пользователя
+OFFLINE_PAGE_SIZE = 500
+# Пауза в секундах перед повторной попыткой передачи, если очередь отправки пользователя переполнена
+OFFLINE_RETRY_DELAY = 0.05
+# Время в секундах, в течение которого токен возобновления сессии позволяет войти без проверки пароля
+SESSION_TOKEN_TTL = 3600
+# Количество последних изменений списка пользователей, которые сервер хранит для рассылки клиентам
+DIRECTORY_LOG_SIZE = 1000
+# Время в секундах, в течение которого клиент ждёт ответа сервера на запрос
+RESPONSE_TIMEOUT = 5
+# Пауза в секундах перед повторным подключением к соседнему узлу кластера
+CLUSTER_RECONNECT_INTERVAL = 1
+# Время в секундах и количество сообщений, после которых клиент заменяет сеансовый ключ шифрования собеседника
+SESSION_KEY_LIFETIME = 3600
+SESSION_KEY_MESSAGES = 10000
+# Количество сеансовых ключей собеседников, которые клиент хранит после их расшифровки
+SESSION_KEY_CACHE_SIZE = 1000
+# Время в секундах, в течение которого клиент использует сохранённый открытый ключ собеседника без запроса к серверу
+PUBLIC_KEY_TTL = 24 * 3600
+# Количество сообщений истории переписки, загружаемых в окно чата за один раз
+HISTORY_PAGE_SIZE = 50
+# Наибольшее количество сообщений в окне чата: остальные загружаются из базы данных при прокрутке
+HISTORY_VIEW_LIMIT = 4 * HISTORY_PAGE_SIZE
+# Наибольшее количество результатов поиска по истории сообщений
+SEARCH_RESULTS_LIMIT = 100
+# Количество последних найденных сообщений, среди которых выбираются наиболее подходящие
+SEARCH_CANDIDATES = 5000
+# Уровень синхронизации базы данных клиента с диском (PRAGMA synchronous): OFF, NORMAL, FULL или EXTRA
+CLIENT_DB_SYNCHRONOUS = 'NORMAL'
+# Наибольшее количество изменений базы данных клиента, записываемых одной транзакцией
+CLIENT_DB_WRITE_BATCH = 500
+# Кодировка проекта
+ENCODING = 'utf-8'
+# Текущий уровень логирования
+LOGGING_LEVEL = logging.DEBUG
+# Доля вызовов функций, записываемых в лог декоратором log
+LOG_SAMPLE_RATE = 1
+# Размер очереди записей логов, ожидающих записи в файл
+LOG_QUEUE_SIZE = 10000
+# Места в очереди записей логов, которые при её заполнении достаются только предупреждениям и ошибкам
+LOG_QUEUE_RESERVE = 1000
+# Количество записей логов, после которого файл лога сбрасывается на диск
+LOG_BATCH_SIZE = 500
+# Наибольшая пауза в секундах между записями логов в файл
+LOG_FLUSH_INTERVAL = 0.2
+
+# Прококол JIM основные ключи:
+ACTION = 'action'
+TIME = 'time'
+USER = 'user'
+ACCOUNT_NAME = 'account_name'
+SENDER = 'from'
+RECEIVER = 'to'
+PUBLIC_KEY = 'pubkey'
+FEATURES = 'features'
+SESSION_TOKEN = 'session_token'
+DIRECTORY_VERSION = 'directory_version'
+REQUEST_ID = 'request_id'
+CODECS = 'codecs'
+CODEC = 'codec'
+
+# Прочие ключи, используемые в протоколе
+PRESENCE = 'presence'
+RESPONSE = 'response'
+ERROR = 'error'
+MESSAGE = 'message'
+MESSAGE_TEXT = 'mess_text'
+EXIT = 'exit'
+BIN = 'bin'
+
+# Возможности протокола, согласуемые в приветственном сообщении
+FRAMING = 'framing'
+DIRECTORY = 'directory'
+ENVELOPE = 'envelope'
+SUPPORTED_FEATURES = [FRAMING, DIRECTORY, ENVELOPE]
+
+# Форматы сериализации сообщений. JSON используется по умолчанию, двоичные форматы согласуются
+# в приветственном сообщении и применяются только вместе с кадрированием
+CODEC_JSON = 'json'
+CODEC_MSGPACK = 'msgpack'
+
+# Изменения списка пользователей, рассылаемые сервером
+USER_ADDED = 'added'
+USER_REMOVED = 'removed'
+KEY_CHANGED = 'key_changed'
+
+# Словари - ответы:
+RESPONSE_200 = {RESPONSE: 200}
+RESPONSE_202 = {RESPONSE: 202}
+RESPONSE_400 = {
+            RESPONSE: 400,
+            ERROR: None
+        }
+RESPONSE_205 = {
+    RESPONSE: 205
+}
+
+RESPONSE_511 = {
+    RESPONSE: 511,
+    BIN: None
+}
+
+ADD_CONTACT = 'add_contact'
+DEL_CONTACT = 'del_contact'
+GET_CONTACTS = 'get_contacts'
+GET_USERS = 'get_users'
+CONTACT = 'contact'
+DATA = 'data'
+GET_PUBLIC_KEY = 'pubkey_need'
+DIRECTORY_UPDATE = 'directory_update'
+
+
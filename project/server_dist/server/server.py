@@ -3,12 +3,18 @@ import os.path
 import argparse
 from common.utils import *
 from common.decos import log
-from server_dist.server.server_files import ServerDB
+from server_dist.server.server_files.server_db import ServerDB
 from PyQt5.QtWidgets import QApplication
 from PyQt5.QtCore import Qt
 from server_dist.server.server_files.main_window import MainWindow
-from server_dist.server.server_files import MessageProcessor
+from server_dist.server.server_files.core import MessageProcessor
+from server_dist.server.server_files.async_core import AsyncMessageProcessor
+from server_dist.server.server_files.session_tokens import SessionTokens, load_token_secret
+from server_dist.server.server_files.workers import start_workers, stop_workers
+from server_dist.server.server_files.cluster import ClusterMessageProcessor, load_cluster_secret, \
+    parse_node_address, WILDCARD_ADDRESSES
 import logging
+import server_dist.server.logs.config_server_log
 
 logger = logging.getLogger('server_dist')
 
@@ -23,20 +29,41 @@ def arg_parser(default_port, default_address):
     parser.add_argument('-p', default=default_port, type=int, nargs='?')
     parser.add_argument('-a', default=default_address, nargs='?')
     parser.add_argument('--no_gui', action='store_true')
+    parser.add_argument('--asyncio', action='store_true')
+    parser.add_argument('--workers', default=1, type=int)
+    parser.add_argument('--node', default='')
+    parser.add_argument('--peers', default='')
+    parser.add_argument('--cluster-address', default='',
+                        help='адрес интерфейса, на котором узел принимает соединения соседей (по умолчанию - адрес '
+                             'узла из --node); должен быть доступен только узлам кластера')
+    parser.add_argument('--cluster-key', default=os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                                               'cluster.key'),
+                        help='файл с общим секретом узлов кластера, одинаковый на всех узлах')
+    parser.add_argument('--db', default='')
 
     namespace = parser.parse_args(sys.argv[1:])
+    if namespace.node and namespace.workers > 1:
+        parser.error('режим кластера (--node) нельзя совмещать с несколькими рабочими процессами')
+    cluster_address = namespace.cluster_address or namespace.node and parse_node_address(namespace.node)[0]
+    if namespace.node and cluster_address in WILDCARD_ADDRESSES:
+        parser.error('соединения соседей нужно принимать на адресе отдельного интерфейса (--node или '
+                     '--cluster-address), а не на всех адресах')
     listen_address = namespace.a
     listen_port = namespace.p
     gui_flag = namespace.no_gui
+    asyncio_flag = namespace.asyncio
+    workers = namespace.workers
+    cluster = (namespace.node, [peer for peer in namespace.peers.split(',') if peer], namespace.cluster_address,
+               namespace.cluster_key)
 
-    return listen_address, listen_port, gui_flag
+    return listen_address, listen_port, gui_flag, asyncio_flag, workers, cluster, namespace.db
 
 
 @log
 def config_load():
     config = configparser.ConfigParser()
     dir_path = os.path.dirname(os.path.realpath(__file__))
-    config.read(f"{dir_path}/{'server_dist+++.ini'}")
+    config.read(os.path.join(dir_path, 'server.ini'))
     if 'SETTINGS' in config:
         return config
     else:
@@ -45,22 +72,59 @@ def config_load():
         config.set('SETTINGS', 'Listen_Address', '')
         config.set('SETTINGS', 'Database_path', '')
         config.set('SETTINGS', 'Database_file', 'server_db')
+        config.set('SETTINGS', 'Out_buffer_high_water', str(OUT_BUFFER_HIGH_WATER))
+        config.set('SETTINGS', 'Out_buffer_limit', str(OUT_BUFFER_LIMIT))
+        config.set('SETTINGS', 'Slow_consumer_timeout', str(SLOW_CONSUMER_TIMEOUT))
+        config.set('SETTINGS', 'Session_token_ttl', str(SESSION_TOKEN_TTL))
         return config
 
 
 def main():
     config = config_load()
-    listen_address, listen_port, gui_flag = arg_parser(config['SETTINGS']['Default_port'], config['SETTINGS']['Listen_address'])
-    db = ServerDB(os.path.join(config['SETTINGS']['Database_path'], config['SETTINGS']['Database_file']))
+    listen_address, listen_port, gui_flag, asyncio_flag, workers, cluster, database_file = arg_parser(
+        config['SETTINGS']['Default_port'], config['SETTINGS']['Listen_address'])
+    db = ServerDB(os.path.join(config['SETTINGS']['Database_path'],
+                               database_file or config['SETTINGS']['Database_file']))
 
-    server = MessageProcessor(listen_address, listen_port, db)
+    high_water = config['SETTINGS'].getint('Out_buffer_high_water', OUT_BUFFER_HIGH_WATER)
+    buffer_limit = config['SETTINGS'].getint('Out_buffer_limit', OUT_BUFFER_LIMIT)
+    slow_consumer_timeout = config['SETTINGS'].getint('Slow_consumer_timeout', SLOW_CONSUMER_TIMEOUT)
+    token_secret = load_token_secret(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'token.key'))
+    session_tokens = SessionTokens(token_secret, config['SETTINGS'].getint('Session_token_ttl', SESSION_TOKEN_TTL))
+
+    if gui_flag and workers > 1:
+        processes, stop_event = start_workers(workers, listen_address, listen_port, db, high_water, buffer_limit,
+                                              slow_consumer_timeout, session_tokens)
+        while True:
+            command = input('Введите exit для завершения работы сервера.')
+            if command == 'exit':
+                stop_workers(processes, stop_event)
+                break
+        return
+
+    node, peers, cluster_address, cluster_key = cluster
+    if node:
+        try:
+            cluster_secret = load_cluster_secret(cluster_key)
+        except (OSError, ValueError) as err:
+            logger.critical(f'Не удалось загрузить общий секрет кластера: {err}')
+            sys.exit(1)
+        server = ClusterMessageProcessor(listen_address, listen_port, db, node, peers, high_water, buffer_limit,
+                                         slow_consumer_timeout, session_tokens, cluster_secret=cluster_secret,
+                                         cluster_address=cluster_address)
+    elif asyncio_flag:
+        server = AsyncMessageProcessor(listen_address, listen_port, db, high_water, buffer_limit,
+                                       slow_consumer_timeout, session_tokens)
+    else:
+        server = MessageProcessor(listen_address, listen_port, db, high_water, buffer_limit, slow_consumer_timeout,
+                                  session_tokens)
     server.start()
 
     if gui_flag:
         while True:
             command = input('Введите exit для завершения работы сервера.')
             if command == 'exit':
-                server.running = False
+                server.stop()
                 server.join()
                 break
 
@@ -69,7 +133,9 @@ def main():
         server_app.setAttribute(Qt.AA_DisableWindowContextHelpButton)
         main_window = MainWindow(db, server, config)
         server_app.exec_()
-        server.running = False
+        server.stop()
+        server.join()
+        db.release_session()
 
 
 if __name__ == '__main__':
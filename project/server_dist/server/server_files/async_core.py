@@ -0,0 +1,330 @@
+import asyncio
+import logging
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append('../../../')
+from server_dist.server.common.variables import *
+from server_dist.server.common.utils import MessageStream
+from server_dist.server.server_files.core import MessageProcessor
+
+logger = logging.getLogger('server_dist')
+
+
+class StreamClient:
+    """
+    Класс-обёртка над asyncio.StreamWriter, предоставляющая обработчикам MessageProcessor интерфейс сокета.
+    Обработчики выполняются в отдельном потоке, поэтому запись, приостановка и возобновление приёма передаются
+    в цикл событий потокобезопасно
+    """
+
+    def __init__(self, loop, writer):
+        self.loop = loop
+        self.writer = writer
+        self.peername = writer.get_extra_info('peername')[:2]
+        self.readable = asyncio.Event()
+        self.readable.set()
+
+    def sendall(self, data):
+        self.loop.call_soon_threadsafe(self.write, data)
+
+    def write(self, data):
+        # Данные, переданные обработчиком до того, как цикл событий узнал о разрыве соединения, отбрасываются
+        if not self.writer.is_closing():
+            self.writer.write(data)
+
+    def getpeername(self):
+        return self.peername
+
+    def queue_depth(self):
+        return self.writer.transport.get_write_buffer_size()
+
+    def pause_reading(self):
+        self.loop.call_soon_threadsafe(self.readable.clear)
+
+    def resume_reading(self):
+        self.loop.call_soon_threadsafe(self.readable.set)
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.writer.close)
+
+    def abort(self):
+        self.loop.call_soon_threadsafe(self.writer.transport.abort)
+
+    def __repr__(self):
+        return f'<StreamClient: {self.peername}>'
+
+
+class AsyncMessageProcessor(MessageProcessor):
+    """
+    Класс, реализующий функционал сервера на asyncio: на каждое подключение создаётся отдельная задача, а обработчики
+    команд MessageProcessor и обращения к базе данных выполняются в пуле потоков, не блокируя цикл событий.
+    Переполнение очереди отправки определяется по размеру буфера записи транспорта получателя: приём
+    от отправителей приостанавливается, пока буфер не опустится до нижней границы, а получатель, буфер которого
+    не освобождается дольше slow_consumer_timeout, отключается
+    """
+
+    def __init__(self, address, port, db, high_water=OUT_BUFFER_HIGH_WATER, buffer_limit=OUT_BUFFER_LIMIT,
+                 slow_consumer_timeout=SLOW_CONSUMER_TIMEOUT, session_tokens=None):
+        super().__init__(address, port, db, high_water, buffer_limit, slow_consumer_timeout, session_tokens)
+        self.loop = None
+        self.stop_event = None
+        self.handler_thread = None
+        self.connections = set()
+        self.drain_watchers = set()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='server_db',
+                                           initializer=self.mark_handler_thread)
+
+    def run(self):
+        """
+        Метод, запускающий цикл событий сервера
+        """
+
+        asyncio.run(self.serve())
+        self.executor.shutdown()
+
+    async def serve(self):
+        """
+        Метод, запускающий сервер и ожидающий его остановки
+        """
+
+        logger.info(
+            f'Запущен asyncio-сервер, порт для подключений: {self.port} , '
+            f'адрес с которого принимаются подключения: {self.address}. '
+            f'Если адрес не указан, принимаются соединения с любых адресов.')
+        self.loop = asyncio.get_running_loop()
+        self.stop_event = asyncio.Event()
+        if not self.running:
+            return
+        server = await asyncio.start_server(self.handle_connection, self.address or None, self.port,
+                                            reuse_address=True, backlog=socket.SOMAXCONN)
+        stats_flusher = asyncio.create_task(self.flush_stats_periodically())
+        async with server:
+            await self.stop_event.wait()
+        stats_flusher.cancel()
+        for watcher in list(self.drain_watchers):
+            watcher.cancel()
+        for client in list(self.clients):
+            await self.call_handler(self.delete_client, client)
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        await self.call_handler(self.db.flush_message_stats)
+        await self.call_handler(self.db.release_session)
+
+    async def flush_stats_periodically(self):
+        """
+        Задача, записывающая накопленную статистику сообщений в базу данных по таймеру
+        """
+
+        while True:
+            timeout = self.db.stats_flush_timeout()
+            if timeout == 0:
+                await self.call_handler(self.db.flush_message_stats)
+                continue
+            await asyncio.sleep(STATS_FLUSH_INTERVAL if timeout is None else timeout)
+
+    def stop(self):
+        """
+        Метод, останавливающий сервер
+        """
+
+        self.running = False
+        if self.loop:
+            self.loop.call_soon_threadsafe(self.stop_event.set)
+
+    def mark_handler_thread(self):
+        """
+        Метод, запоминающий поток, в котором выполняются обработчики
+        """
+
+        self.handler_thread = threading.current_thread()
+
+    def in_server_thread(self):
+        """
+        Метод, проверяющий, выполняется ли текущий код в потоке обработчиков
+        """
+
+        return threading.current_thread() is self.handler_thread
+
+    def call_soon(self, callback, *args):
+        """
+        :param callback: функция, которую нужно вызвать
+        :param args: аргументы функции
+
+        Метод, передающий вызов из другого потока в поток обработчиков
+        """
+
+        self.executor.submit(callback, *args)
+
+    async def call_handler(self, handler, *args):
+        """
+        :param handler: метод MessageProcessor
+        :param args: аргументы метода
+
+        Метод, выполняющий обработчик в пуле потоков, чтобы обращения к базе данных не блокировали цикл событий
+        """
+
+        return await self.loop.run_in_executor(self.executor, handler, *args)
+
+    async def handle_connection(self, reader, writer):
+        """
+        :param reader: поток чтения подключения
+        :param writer: поток записи подключения
+
+        Задача, обслуживающая одно подключение: принимает сообщения клиента и передаёт их на обработку
+        """
+
+        self.connections.add(asyncio.current_task())
+        client = StreamClient(self.loop, writer)
+        writer.transport.set_write_buffer_limits(high=self.high_water, low=self.low_water)
+        logger.info(f'Установлено соедение с ПК {client.getpeername()}')
+        await self.call_handler(self.register_client, client)
+        while self.running and client in self.clients:
+            try:
+                await client.readable.wait()
+                if client not in self.clients:
+                    break
+                data = await reader.read(RECV_BUFFER_SIZE)
+                if not data:
+                    break
+                messages = self.streams[client].feed(data)
+                if messages:
+                    await self.call_handler(self.dispatch_client_messages, messages, client)
+                await writer.drain()
+            except (OSError, ValueError, TypeError, KeyError) as err:
+                logger.debug(f'Getting data from client exception.', exc_info=err)
+                break
+        await self.call_handler(self.delete_client, client)
+        self.connections.discard(asyncio.current_task())
+
+    def register_client(self, client):
+        """
+        :param client: подключение клиента
+
+        Метод, добавляющий подключение в список клиентов сервера
+        """
+
+        self.registry.add(client)
+        self.streams[client] = MessageStream(relay=True)
+
+    def write(self, client, data):
+        """
+        :param client: подключение клиента
+        :param data: байты для отправки
+
+        Метод, передающий данные в буфер записи подключения. Клиент, буфер которого превысил предельный размер,
+        считается медленным и отключается
+        """
+
+        if client.queue_depth() > self.buffer_limit:
+            logger.error(f'Очередь отправки клиента {self.client_address(client)} превысила {self.buffer_limit} байт, '
+                         f'клиент отключается.')
+            raise ConnectionAbortedError('Клиент не успевает принимать сообщения')
+        client.sendall(data)
+
+    def apply_backpressure(self, sender, receiver):
+        """
+        :param sender: подключение клиента, от которого пришло сообщение
+        :param receiver: подключение клиента, которому сообщение отправлено
+
+        Метод, приостанавливающий приём сообщений от отправителя, пока буфер записи получателя не опустится
+        до нижней границы. За первым переполнением буфера получателя начинает следить отдельная задача
+        """
+
+        if receiver.queue_depth() > self.high_water:
+            logger.debug(f'Очередь отправки клиента {self.client_address(receiver)} переполнена, '
+                         f'приём от {self.client_address(sender)} приостановлен.')
+            self.paused.setdefault(receiver, set()).add(sender)
+            if receiver not in self.congested_since:
+                self.congested_since[receiver] = time.monotonic()
+                self.loop.call_soon_threadsafe(self.watch_drain, receiver)
+            self.update_events(sender)
+
+    def watch_drain(self, client):
+        """
+        :param client: подключение клиента
+
+        Метод, запускающий задачу ожидания освобождения буфера записи клиента
+        """
+
+        watcher = asyncio.create_task(self.wait_drained(client))
+        self.drain_watchers.add(watcher)
+        watcher.add_done_callback(self.drain_watchers.discard)
+
+    async def wait_drained(self, client):
+        """
+        :param client: подключение клиента
+
+        Задача, ожидающая, пока буфер записи клиента опустится до нижней границы, и возобновляющая приём
+        от приостановленных отправителей. Если буфер не освобождается дольше slow_consumer_timeout,
+        медленные получатели отключаются
+        """
+
+        try:
+            await asyncio.wait_for(client.writer.drain(), self.slow_consumer_timeout)
+        except asyncio.TimeoutError:
+            await self.call_handler(self.check_slow_consumers)
+            return
+        except OSError:
+            return
+        await self.call_handler(self.resume_senders, client)
+
+    def resume_senders(self, client):
+        """
+        :param client: подключение клиента, буфер записи которого освободился
+
+        Метод, возобновляющий приём от отправителей, приостановленных из-за переполнения буфера клиента
+        """
+
+        self.congested_since.pop(client, None)
+        for sender in self.paused.pop(client, ()):
+            self.resume_reading(sender)
+
+    def update_events(self, client):
+        """
+        :param client: подключение клиента
+
+        Метод, приостанавливающий или возобновляющий приём от клиента в зависимости от того, ждёт ли он
+        освобождения буфера записи какого-либо получателя
+        """
+
+        if any(client in waiting for waiting in self.paused.values()):
+            client.pause_reading()
+        else:
+            client.resume_reading()
+
+    def get_queue_depth(self, name):
+        """
+        :param name: имя пользователя
+
+        Метод, возвращающий размер буфера записи пользователя в байтах
+        """
+
+        client = self.names.get(name)
+        return client.queue_depth() if client else 0
+
+    def defer_offline_drain(self, client, name):
+        """
+        :param client: подключение клиента
+        :param name: имя пользователя
+
+        Метод, откладывающий передачу сохранённых сообщений, пока буфер записи подключения переполнен
+        """
+
+        self.loop.call_soon_threadsafe(self.loop.call_later, OFFLINE_RETRY_DELAY, self.call_soon,
+                                       self.drain_offline_messages, name)
+
+    def release_client(self, client):
+        """
+        :param client: подключение клиента
+
+        Метод, закрывающий подключение клиента. Подключение с переполненным буфером записи закрывается сразу,
+        не дожидаясь отправки данных, которые клиент не принимает
+        """
+
+        if client.queue_depth() > self.high_water:
+            client.abort()
+        else:
+            client.close()
+        client.resume_reading()
@@ -0,0 +1,318 @@
+import binascii
+import errno
+import hmac
+import logging
+import os
+import selectors
+import socket
+import sys
+import threading
+sys.path.append('../../../')
+from server_dist.server.common.variables import *
+from server_dist.server.server_files.peers import PeerMessageProcessor
+
+logger = logging.getLogger('server_dist')
+
+# Проверка узла кластера: каждая сторона соединения отправляет соседу случайный запрос CHALLENGE, а сосед отвечает
+# приветствием HELLO с подписью запроса, своего адреса и адреса получателя общим секретом кластера
+CHALLENGE = 'challenge'
+HELLO = 'hello'
+NODE = 'node'
+NONCE = 'nonce'
+DIGEST = 'digest'
+# Адреса, на которых порт соседей был бы доступен со всех интерфейсов
+WILDCARD_ADDRESSES = ('', '0.0.0.0', '::')
+
+
+def parse_node_address(node):
+    """
+    :param node: адрес узла в виде 'адрес:порт'
+    Функция, разбирающая адрес узла кластера
+    """
+
+    host, port = node.rsplit(':', 1)
+    return host, int(port)
+
+
+def load_cluster_secret(path):
+    """
+    :param path: путь к файлу с общим секретом кластера
+    Функция, читающая общий секрет узлов кластера. В отличие от секрета токенов, секрет не создаётся
+    автоматически: одинаковый файл нужно заранее разместить на всех узлах кластера
+    """
+
+    with open(path, 'rb') as file:
+        secret = file.read().strip()
+    if len(secret) < 32:
+        raise ValueError(f'Общий секрет кластера в файле {path} короче 32 байт')
+    return secret
+
+
+def hello_digest(secret, nonce, node, peer):
+    """
+    :param secret: общий секрет узлов кластера
+    :param nonce: запрос, полученный от соседа
+    :param node: адрес узла, отвечающего на запрос
+    :param peer: адрес соседа, которому адресовано приветствие
+    Функция, вычисляющая подпись HMAC-SHA256 приветствия узла кластера
+    """
+
+    digest = hmac.new(secret, f'{nonce}:{node}:{peer}'.encode(ENCODING), 'sha256').digest()
+    return binascii.b2a_base64(digest).decode('ascii')
+
+
+class ClusterMessageProcessor(PeerMessageProcessor):
+    """
+    Класс узла кластера серверов. Каждый узел обслуживает своих клиентов и соединён по TCP с остальными узлами:
+    узлы сообщают друг другу о входе и выходе пользователей и пересылают сообщения узлу, к которому подключён
+    получатель. Узел идентифицируется адресом, на котором он принимает соединения соседей. Между каждой парой
+    узлов одно соединение: его устанавливает узел с меньшим адресом, поэтому у всех узлов должен быть одинаковый
+    список узлов кластера. Соседи подтверждают знание общего секрета кластера (cluster_secret): пока сосед
+    не ответил на запрос узла правильно подписанным приветствием, любые его сообщения закрывают соединение.
+    Первым представляется узел, установивший соединение, а принявший соединение узел отвечает на запрос соседа
+    только после проверки его приветствия, поэтому подпись узла нельзя получить, подключившись к нему самому.
+    Порт соседей открывается на адресе cluster_address (по умолчанию - на адресе узла), который должен
+    принадлежать отдельному интерфейсу, доступному только узлам кластера: секрет защищает от подмены узла,
+    но не шифрует передаваемые данные. Сообщения пользователям не в сети хранит узел, на котором они
+    получены, и передаёт их только при входе пользователя на этот же узел
+    """
+
+    def __init__(self, address, port, db, node, peers, high_water=OUT_BUFFER_HIGH_WATER,
+                 buffer_limit=OUT_BUFFER_LIMIT, slow_consumer_timeout=SLOW_CONSUMER_TIMEOUT, session_tokens=None,
+                 reconnect_interval=CLUSTER_RECONNECT_INTERVAL, cluster_secret=None, cluster_address=None):
+        super().__init__(address, port, db, high_water, buffer_limit, slow_consumer_timeout, session_tokens)
+        if not cluster_secret:
+            raise ValueError('Для режима кластера нужен общий секрет узлов')
+        self.node = node
+        self.cluster_peers = [peer for peer in peers if peer != node]
+        self.reconnect_interval = reconnect_interval
+        self.cluster_secret = cluster_secret
+        self.cluster_address = cluster_address
+        self.peer_listener = None
+        self.connecting = {}
+        self.challenges = {}
+        self.peer_nonces = {}
+
+    def run(self):
+        """
+        Метод, открывающий порт для соединений соседних узлов, подключающийся к соседям и запускающий сервер
+        """
+
+        self.peer_listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.peer_listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        host, port = parse_node_address(self.node)
+        self.peer_listener.bind((self.cluster_address or host, port))
+        self.peer_listener.setblocking(False)
+        self.peer_listener.listen(socket.SOMAXCONN)
+        self.selector.register(self.peer_listener, selectors.EVENT_READ, self.accept_peers)
+        for peer in self.cluster_peers:
+            if peer > self.node:
+                self.connect_peer(peer)
+        logger.info(f'Узел кластера {self.node} запущен, соседи: {", ".join(self.cluster_peers)}.')
+        super().run()
+        self.peer_listener.close()
+        for sock in self.connecting:
+            sock.close()
+
+    def accept_peers(self, sock, mask):
+        """
+        :param sock: сокет для соединений соседних узлов
+        :param mask: маска событий селектора
+
+        Метод, принимающий соединения соседних узлов. Сосед становится известен после его приветствия
+        """
+
+        while True:
+            try:
+                link, link_address = sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                logger.error(f'Ошибка при подключении соседнего узла: {e}')
+                return
+            link.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.add_link(link, None)
+            self.challenge_peer(link)
+
+    def connect_peer(self, peer):
+        """
+        :param peer: адрес соседнего узла
+
+        Метод, начинающий неблокирующее подключение к соседнему узлу
+        """
+
+        if not self.running or peer in self.peers or peer in self.connecting.values():
+            return
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        result = sock.connect_ex(parse_node_address(peer))
+        if result not in (0, errno.EINPROGRESS):
+            sock.close()
+            self.schedule_reconnect(peer)
+            return
+        self.connecting[sock] = peer
+        self.selector.register(sock, selectors.EVENT_WRITE, self.complete_peer_connect)
+
+    def complete_peer_connect(self, sock, mask):
+        """
+        :param sock: сокет подключения к соседнему узлу
+        :param mask: маска событий селектора
+
+        Метод, завершающий подключение к соседнему узлу: регистрирует соединение и отправляет соседу запрос.
+        Адрес соседа известен, но соседом он считается только после проверки его приветствия
+        """
+
+        peer = self.connecting.pop(sock)
+        self.selector.unregister(sock)
+        error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error:
+            logger.debug(f'Не удалось подключиться к узлу {peer}: {errno.errorcode.get(error, error)}')
+            sock.close()
+            self.schedule_reconnect(peer)
+            return
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.add_link(sock, None)
+        self.links[sock] = peer
+        self.challenge_peer(sock)
+
+    def schedule_reconnect(self, peer):
+        """
+        :param peer: адрес соседнего узла
+
+        Метод, планирующий повторное подключение к соседнему узлу
+        """
+
+        if not self.running:
+            return
+        timer = threading.Timer(self.reconnect_interval, self.call_soon, args=(self.connect_peer, peer))
+        timer.daemon = True
+        timer.start()
+
+    def link_lost(self, peer_id):
+        """
+        :param peer_id: адрес соседнего узла
+
+        Метод, вызываемый после закрытия соединения с соседним узлом. Соединение восстанавливает узел,
+        который его устанавливал
+        """
+
+        if peer_id is not None and peer_id > self.node:
+            self.schedule_reconnect(peer_id)
+
+    def drop_link(self, link):
+        """
+        :param link: сокет соединения с соседним узлом
+
+        Метод, закрывающий соединение с соседним узлом и забывающий отправленный ему запрос
+        """
+
+        self.challenges.pop(link, None)
+        self.peer_nonces.pop(link, None)
+        super().drop_link(link)
+
+    def challenge_peer(self, link):
+        """
+        :param link: сокет соединения с соседним узлом
+
+        Метод, отправляющий соседу случайный запрос, на который тот должен ответить подписанным приветствием
+        """
+
+        nonce = binascii.hexlify(os.urandom(16)).decode('ascii')
+        self.challenges[link] = nonce
+        self.send_to_peer(link, {ACTION: CHALLENGE, NONCE: nonce})
+
+    def greet_peer(self, link):
+        """
+        :param link: сокет соединения с соседним узлом
+
+        Метод, отвечающий на запрос соседа приветствием с подписью запроса. Пока адрес соседа неизвестен
+        (соседа, подключившегося к этому узлу, ещё не проверили), ответ откладывается
+        """
+
+        peer = self.links.get(link)
+        if peer is None or link not in self.peer_nonces:
+            return
+        nonce = self.peer_nonces.pop(link)
+        self.send_to_peer(link, {ACTION: HELLO, NODE: self.node,
+                                 DIGEST: hello_digest(self.cluster_secret, nonce, self.node, peer)})
+
+    def accept_hello(self, message, link):
+        """
+        :param message: приветствие соседнего узла
+        :param link: сокет соединения с этим соседом
+
+        Метод, проверяющий приветствие соседа: подпись запроса этого узла общим секретом, принадлежность
+        соседа кластеру и, если соединение устанавливал этот узел, совпадение адреса соседа с адресом,
+        к которому узел подключался. Проверенный сосед получает ответ на свой запрос и список пользователей
+        этого узла
+        """
+
+        peer = message.get(NODE)
+        nonce = self.challenges.pop(link)
+        expected = hello_digest(self.cluster_secret, nonce, peer, self.node)
+        if not isinstance(message.get(DIGEST), str) or not hmac.compare_digest(message[DIGEST], expected):
+            logger.error(f'Отклонено соединение узла {peer}: неверная подпись приветствия.')
+            self.drop_link(link)
+            return
+        if self.links[link] not in (None, peer) or peer in self.peers or peer not in self.cluster_peers:
+            logger.error(f'Отклонено соединение узла {peer}: узел уже подключён или не входит в кластер.')
+            self.drop_link(link)
+            return
+        self.links[link] = peer
+        self.peers[peer] = link
+        logger.info(f'Установлено соединение с узлом кластера {peer}.')
+        self.greet_peer(link)
+        if link in self.links:
+            self.announce_users(link)
+
+    def process_peer_message(self, message, link):
+        """
+        :param message: словарь сообщения соседнего узла
+        :param link: сокет соединения с этим соседом
+
+        Метод, обрабатывающий сообщения соседнего узла. Пока сосед не ответил на запрос этого узла
+        подписанным приветствием, принимаются только запрос и приветствие
+        """
+
+        if message.get(ACTION) == CHALLENGE and isinstance(message.get(NONCE), str):
+            self.peer_nonces[link] = message[NONCE]
+            self.greet_peer(link)
+        elif link in self.challenges:
+            if message.get(ACTION) == HELLO and isinstance(message.get(NODE), str):
+                self.accept_hello(message, link)
+            else:
+                logger.error('Соседний узел не представился, соединение закрыто.')
+                self.drop_link(link)
+        elif message.get(ACTION) not in (CHALLENGE, HELLO):
+            super().process_peer_message(message, link)
+
+    def remote_login(self, message, peer_id):
+        """
+        :param message: сообщение соседа о входе пользователя
+        :param peer_id: адрес соседнего узла
+
+        Метод, записывающий вход пользователя на соседнем узле в базу данных этого узла: пользователь
+        попадает в список активных пользователей с адресом узла, а его новый публичный ключ - в список
+        пользователей. Если пользователь одновременно вошёл и на этот узел, в базе данных остаётся вход
+        на этот узел
+        """
+
+        name = message[ACCOUNT_NAME]
+        if name in self.names:
+            logger.warning(f'Пользователь {name} вошёл одновременно на этот узел и на узел {peer_id}.')
+            return
+        if name in self.remote_names or not self.db.check_user(name):
+            return
+        host, port = parse_node_address(peer_id)
+        self.db.user_login(name, host, port, message[PUBLIC_KEY])
+
+    def remote_logout(self, name):
+        """
+        :param name: имя пользователя
+
+        Метод, удаляющий пользователя соседнего узла из списка активных пользователей. Вход того же
+        пользователя на этот узел не затрагивается
+        """
+
+        if name not in self.names and self.db.check_user(name):
+            self.db.user_logout(name)
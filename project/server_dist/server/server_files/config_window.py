@@ -100,8 +100,8 @@ class ConfigWindow(QDialog):
             if 1023 < port < 65536:
                 self.config['SETTINGS']['Default_port'] = str(port)
                 dir_path = os.path.dirname(os.path.realpath(__file__))
-                dir_path = os.path.join(dir_path, '../../..')
-                with open(f"{dir_path}/{'server_dist+++.ini'}", 'w') as conf:
+                dir_path = os.path.join(dir_path, '..')
+                with open(os.path.join(dir_path, 'server.ini'), 'w') as conf:
                     self.config.write(conf)
                     message.information(
                         self, 'OK', 'Настройки успешно сохранены!')
@@ -1,14 +1,19 @@
 import threading
-import select
+import selectors
+import queue
+import time
 import socket
-import json
 import hmac
 import binascii
+import logging
 import os
 import sys
 sys.path.append('../../../')
-from server_dist.server.common import send_message, get_message
+from server_dist.server.common.utils import MessageStream, Envelope, JSON_CODEC, choose_codec
+from server_dist.server.common.variables import *
 from server_dist.server.common.decos import login_required
+from server_dist.server.server_files.session_tokens import SessionTokens
+from server_dist.server.server_files.registry import ConnectionRegistry
 
 logger = logging.getLogger('server_dist')
 
@@ -35,26 +40,49 @@ class MessageProcessor(threading.Thread):
     """
 
     port = PortDescriptor()
+    # Разрешить нескольким процессам слушать один порт (SO_REUSEPORT): ядро распределяет подключения между ними
+    reuse_port = False
 
-    def __init__(self, address, port, db):
+    def __init__(self, address, port, db, high_water=OUT_BUFFER_HIGH_WATER, buffer_limit=OUT_BUFFER_LIMIT,
+                 slow_consumer_timeout=SLOW_CONSUMER_TIMEOUT, session_tokens=None):
         super().__init__()
         self.daemon = True
         self.address = address
         self.port = port
         self.db = db
         self.transport = None
-
-        self.clients = []
-        self.messages = []
-        self.names = {}
-        self.receivers = None
-        self.errors = None
+        self.high_water = high_water
+        self.low_water = high_water // 4
+        self.buffer_limit = buffer_limit
+        self.slow_consumer_timeout = slow_consumer_timeout
+        self.session_tokens = session_tokens or SessionTokens()
+
+        self.registry = ConnectionRegistry()
+        self.clients = self.registry
+        self.streams = {}
+        self.out_buffers = {}
+        self.paused = {}
+        self.congested_since = {}
+        self.names = self.registry.names
+        self.auth_pending = {}
+        self.client_features = {}
+        self.current_request = None
+        self.directory_version = db.get_directory_version()
+        self.offline_draining = set()
+        self.offline_waiting = {}
+        self.offline_page_size = OFFLINE_PAGE_SIZE
+        self.selector = selectors.DefaultSelector()
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.wakeup_writer.setblocking(False)
+        self.pending_calls = queue.SimpleQueue()
 
         self.running = True
 
     def run(self):
         """
-        Метод, запускающий сервер и реализующий функционал приёма и передачи сообщений
+        Метод, запускающий сервер и реализующий функционал приёма и передачи сообщений.
+        Слушающий сокет и сокеты клиентов регистрируются в селекторе (epoll в Linux), поэтому сервер
+        спит, пока ни один сокет не готов, и обрабатывает только те сокеты, на которых произошли события
         """
 
         logger.info(
@@ -63,52 +91,397 @@ class MessageProcessor(threading.Thread):
             f'Если адрес не указан, принимаются соединения с любых адресов.')
         self.transport = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.transport.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            self.transport.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         self.transport.bind((self.address, self.port))
-        self.transport.settimeout(0.5)
+        self.transport.setblocking(False)
+        self.transport.listen(socket.SOMAXCONN)
+
+        self.selector.register(self.transport, selectors.EVENT_READ, self.accept_clients)
+        self.wakeup_reader.setblocking(False)
+        self.selector.register(self.wakeup_reader, selectors.EVENT_READ, self.process_wakeup)
 
-        self.transport.listen()
         while self.running:
             try:
-                client, client_address = self.transport.accept()
-            except OSError:
+                events = self.selector.select(self.get_select_timeout())
+            except OSError as e:
+                logger.error(f'Ошибка работы с сокетами: {e}')
+                continue
+            for key, mask in events:
+                key.data(key.fileobj, mask)
+            self.run_pending_calls()
+            self.check_slow_consumers()
+            if self.db.stats_flush_timeout() == 0:
+                self.db.flush_message_stats()
+
+        for client in list(self.clients):
+            self.delete_client(client)
+        self.db.flush_message_stats()
+        self.db.release_session()
+        self.selector.close()
+        self.transport.close()
+
+    def get_select_timeout(self):
+        """
+        Метод, возвращающий время, на которое селектор может уснуть: до плановой записи статистики сообщений
+        или до истечения времени ожидания самого старого из задерживающих отправителей получателей.
+        Если ни того, ни другого нет, селектор спит до появления событий. Если в очереди есть вызовы,
+        селектор только проверяет готовность сокетов, не засыпая
+        """
+
+        if not self.pending_calls.empty():
+            return 0
+        timeouts = []
+        stats_timeout = self.db.stats_flush_timeout()
+        if stats_timeout is not None:
+            timeouts.append(stats_timeout)
+        if self.congested_since:
+            timeouts.append(max(0, min(self.congested_since.values()) + self.slow_consumer_timeout - time.monotonic()))
+        return min(timeouts) if timeouts else None
+
+    def check_slow_consumers(self):
+        """
+        Метод, отключающий получателей, очередь отправки которых слишком долго остаётся переполненной
+        """
+
+        now = time.monotonic()
+        for client, since in list(self.congested_since.items()):
+            if now - since >= self.slow_consumer_timeout:
+                logger.error(f'Клиент {self.client_address(client)} не принимает сообщения дольше '
+                             f'{self.slow_consumer_timeout} с, клиент отключается.')
+                self.delete_client(client)
+
+    def stop(self):
+        """
+        Метод, останавливающий сервер. Будит селектор, чтобы цикл обработки событий сразу завершился
+        """
+
+        self.running = False
+        try:
+            self.wakeup_writer.send(b'\0')
+        except OSError:
+            pass
+
+    def call_soon(self, callback, *args):
+        """
+        :param callback: функция, которую нужно вызвать
+        :param args: аргументы функции
+
+        Метод, передающий вызов из другого потока (например, графического интерфейса) в поток сервера.
+        Вызов из потока сервера только ставится в очередь: цикл сервера выполнит его на следующем шаге
+        """
+
+        self.pending_calls.put((callback, args))
+        if self.in_server_thread():
+            return
+        try:
+            self.wakeup_writer.send(b'\0')
+        except OSError:
+            # Заполненный буфер сокета пробуждения означает, что селектор уже будет разбужен
+            pass
+
+    def in_server_thread(self):
+        """
+        Метод, проверяющий, выполняется ли текущий код в потоке сервера
+        """
+
+        return threading.current_thread() is self
+
+    def process_wakeup(self, sock, mask):
+        """
+        :param sock: сокет, через который будится селектор
+        :param mask: маска событий селектора
+
+        Метод, вычитывающий данные из сокета пробуждения селектора. Переданные вызовы выполняет цикл сервера
+        """
+
+        try:
+            while sock.recv(MAX_PACKAGE_LENGTH):
                 pass
-            else:
-                logger.info(f'Установлено соедение с ПК {client_address}')
-                client.settimeout(5)
-                self.clients.append(client)
+        except OSError:
+            pass
+
+    def run_pending_calls(self):
+        """
+        Метод, выполняющий поставленные в очередь вызовы. Выполняются только вызовы, поставленные в очередь
+        до начала обработки: вызовы, которые ставят себя в очередь повторно, выполнятся на следующем шаге цикла,
+        не задерживая обработку сокетов
+        """
 
-            senders = []
+        for _ in range(self.pending_calls.qsize()):
+            callback, args = self.pending_calls.get()
+            callback(*args)
+
+    def accept_clients(self, sock, mask):
+        """
+        :param sock: слушающий сокет сервера
+        :param mask: маска событий селектора
 
+        Метод, принимающий все ожидающие подключения и регистрирующий их сокеты в селекторе
+        """
+
+        while True:
             try:
-                if self.clients:
-                    senders, self.receivers, self.errors = select.select(self.clients, self.clients, [], 0)
+                client, client_address = sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
             except OSError as e:
-                logger.error(f'Ошибка работы с сокетами: {e}')
+                logger.error(f'Ошибка при подключении клиента: {e}')
+                return
+            logger.info(f'Установлено соедение с ПК {client_address}')
+            client.setblocking(False)
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.registry.add(client)
+            self.streams[client] = MessageStream(relay=True)
+            self.out_buffers[client] = bytearray()
+            self.selector.register(client, selectors.EVENT_READ, self.process_client_events)
+
+    def process_client_events(self, client, mask):
+        """
+        :param client: сокет клиента
+        :param mask: маска событий селектора
 
-            if senders:
-                for client_with_message in senders:
-                    try:
-                        self.process_client_message(get_message(client_with_message), client_with_message)
-                    except (OSError, json.JSONDecodeError, TypeError) as err:
-                        logger.debug(f'Getting data from client exception.', exc_info=err)
-                        self.delete_client(client_with_message)
+        Метод, обрабатывающий готовность сокета клиента к записи и чтению
+        """
+
+        if mask & selectors.EVENT_WRITE:
+            self.write_client(client)
+        if mask & selectors.EVENT_READ and client in self.clients:
+            self.read_client(client)
+
+    def read_client(self, client):
+        """
+        :param client: сокет клиента, готовый к чтению
+
+        Метод, принимающий сообщение от клиента и передающий его на обработку
+        """
+
+        try:
+            data = client.recv(RECV_BUFFER_SIZE)
+            if not data:
+                raise ConnectionResetError('Клиент закрыл соединение')
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as err:
+            logger.debug(f'Getting data from client exception.', exc_info=err)
+            self.delete_client(client)
+            return
+        try:
+            self.dispatch_client_messages(self.streams[client].feed(data), client)
+            if client not in self.clients:
+                return
+            self.apply_backpressure(client, client)
+        except (OSError, ValueError, TypeError) as err:
+            logger.debug(f'Getting data from client exception.', exc_info=err)
+            self.delete_client(client)
 
     def delete_client(self, client):
         """
         :param client: сокет клиента
 
-        Метод, отключающий клиента от сервера и удаляющий его из словаря текущих клиентов
+        Метод, отключающий клиента от сервера и удаляющий его из реестра подключений
+        """
+
+        if client not in self.clients:
+            return
+        logger.info(f'Клиент {self.client_address(client)} отключился от сервера.')
+        name = self.registry.remove(client)
+        if name is not None:
+            self.db.user_logout(name)
+            self.offline_draining.discard(name)
+        self.auth_pending.pop(client, None)
+        self.client_features.pop(client, None)
+        self.offline_waiting.pop(client, None)
+        self.streams.pop(client, None)
+        self.out_buffers.pop(client, None)
+        for waiting in self.paused.values():
+            waiting.discard(client)
+        self.release_client(client)
+        self.congested_since.pop(client, None)
+        for sender in self.paused.pop(client, ()):
+            self.resume_reading(sender)
+
+    def client_address(self, client):
+        """
+        :param client: сокет клиента
+
+        Метод, возвращающий адрес клиента для записи в лог
         """
 
-        logger.info(f'Клиент {client.getpeername()} отключился от сервера.')
-        for name in self.names:
-            if self.names[name] == client:
-                self.db.user_logout(name)
-                del self.names[name]
-                break
-        self.clients.remove(client)
+        try:
+            return client.getpeername()
+        except OSError:
+            return 'с закрытым соединением'
+
+    def release_client(self, client):
+        """
+        :param client: сокет клиента
+
+        Метод, снимающий сокет клиента с регистрации в селекторе и закрывающий его
+        """
+
+        try:
+            self.selector.unregister(client)
+        except KeyError:
+            pass
         client.close()
 
+    def send(self, client, message):
+        """
+        :param client: сокет клиента
+        :param message: словарь сообщения для отправки
+
+        Метод, отправляющий сообщение клиенту в соответствии с согласованным с ним протоколом
+        """
+
+        stream = self.streams.get(client)
+        if stream is None:
+            raise ConnectionResetError('Клиент отключён от сервера')
+        if self.current_request and self.current_request[0] is client and RESPONSE in message:
+            message = dict(message)
+            message[REQUEST_ID] = self.current_request[1]
+        self.write(client, stream.encode(message))
+
+    def write(self, client, data):
+        """
+        :param client: сокет клиента
+        :param data: байты для отправки
+
+        Метод, ставящий данные в очередь отправки клиента. Если очередь пуста, данные сразу отправляются без
+        блокировки, а неотправленный остаток дописывается, когда селектор сообщит о готовности сокета к записи.
+        Клиент, очередь которого превысила предельный размер, считается медленным и отключается
+        """
+
+        buffer = self.out_buffers[client]
+        if not buffer:
+            try:
+                sent = client.send(data)
+            except (BlockingIOError, InterruptedError):
+                sent = 0
+            data = data[sent:]
+            if not data:
+                return
+        buffer += data
+        if len(buffer) > self.buffer_limit:
+            logger.error(f'Очередь отправки клиента {self.client_address(client)} превысила {self.buffer_limit} байт, '
+                         f'клиент отключается.')
+            raise ConnectionAbortedError('Клиент не успевает принимать сообщения')
+        self.update_events(client)
+
+    def write_client(self, client):
+        """
+        :param client: сокет клиента, готовый к записи
+
+        Метод, отправляющий клиенту накопленные в очереди данные
+        """
+
+        buffer = self.out_buffers[client]
+        try:
+            sent = client.send(buffer)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as err:
+            logger.debug(f'Sending data to client exception.', exc_info=err)
+            self.delete_client(client)
+            return
+        del buffer[:sent]
+        if len(buffer) <= self.low_water:
+            self.congested_since.pop(client, None)
+            for sender in self.paused.pop(client, ()):
+                self.resume_reading(sender)
+            if client in self.offline_waiting:
+                self.call_soon(self.drain_offline_messages, self.offline_waiting.pop(client))
+        self.update_events(client)
+
+    def update_events(self, client):
+        """
+        :param client: сокет клиента
+
+        Метод, подписывающий сокет клиента на чтение (если приём от него не приостановлен) и на запись
+        (если очередь отправки не пуста)
+        """
+
+        events = 0
+        if not any(client in waiting for waiting in self.paused.values()):
+            events |= selectors.EVENT_READ
+        if self.out_buffers[client]:
+            events |= selectors.EVENT_WRITE
+        try:
+            current = self.selector.get_key(client).events
+        except KeyError:
+            current = 0
+        if events == current:
+            return
+        if not events:
+            self.selector.unregister(client)
+        elif not current:
+            self.selector.register(client, events, self.process_client_events)
+        else:
+            self.selector.modify(client, events, self.process_client_events)
+
+    def apply_backpressure(self, sender, receiver):
+        """
+        :param sender: сокет клиента, от которого пришло сообщение
+        :param receiver: сокет клиента, которому сообщение отправлено
+
+        Метод, приостанавливающий приём сообщений от отправителя, пока очередь отправки получателя
+        не опустится ниже нижней границы
+        """
+
+        if receiver in self.out_buffers and len(self.out_buffers[receiver]) > self.high_water:
+            logger.debug(f'Очередь отправки клиента {self.client_address(receiver)} переполнена, '
+                         f'приём от {self.client_address(sender)} приостановлен.')
+            self.paused.setdefault(receiver, set()).add(sender)
+            self.congested_since.setdefault(receiver, time.monotonic())
+            self.update_events(sender)
+
+    def resume_reading(self, client):
+        """
+        :param client: сокет клиента
+
+        Метод, возобновляющий приём сообщений от клиента
+        """
+
+        if client in self.clients:
+            self.update_events(client)
+
+    def remove_user(self, name):
+        """
+        :param name: имя пользователя
+
+        Метод, удаляющий пользователя с сервера: отключает его, если он подключён, удаляет из базы данных
+        и рассылает клиентам изменения списка пользователей. При вызове из другого потока (окна удаления
+        пользователя) выполнение передаётся в поток сервера
+        """
+
+        if not self.in_server_thread():
+            self.call_soon(self.remove_user, name)
+            return
+        client = self.registry.socket_of(name)
+        if client is not None:
+            self.delete_client(client)
+        self.db.delete_user(name)
+        self.service_update_lists()
+
+    def user_online(self, name):
+        """
+        :param name: имя пользователя
+
+        Метод, проверяющий, подключён ли пользователь к серверу
+        """
+
+        return name in self.names
+
+    def get_queue_depth(self, name):
+        """
+        :param name: имя пользователя
+
+        Метод, возвращающий размер очереди отправки пользователя в байтах
+        """
+
+        client = self.names.get(name)
+        return len(self.out_buffers.get(client, b''))
+
     def process_message(self, message):
         """
         :param message: словарь, содержащий данные об обрабатываемом сообщении
@@ -116,19 +489,162 @@ class MessageProcessor(threading.Thread):
         Метод, обеспечивающий отправление сообщения получателю, если он зарегистрирован на сервере
         """
 
-        if message[RECEIVER] in self.names and self.names[message[RECEIVER]] in self.receivers:
+        if message[RECEIVER] in self.names and message[RECEIVER] not in self.offline_draining:
             try:
-                send_message(self.names[message[RECEIVER]], message)
-                logger.info(f'Отправлено сообщение пользователю {message[RECEIVER]} от пользователя {message[SENDER]}.')
+                self.send(self.names[message[RECEIVER]], message)
+                logger.info('Отправлено сообщение пользователю %s от пользователя %s.', message[RECEIVER], message[SENDER])
+                self.apply_backpressure(self.names[message[SENDER]], self.names[message[RECEIVER]])
             except OSError:
-                self.delete_client(message[RECEIVER])
-        elif message[RECEIVER] in self.names and self.names[message[RECEIVER]] not in self.receivers:
-            logger.error(f'Связь с клиентом {message[RECEIVER]} была потеряна. Соединение закрыто, доставка невозможна.')
-            self.delete_client(self.names[message[RECEIVER]])
+                logger.error(f'Связь с клиентом {message[RECEIVER]} была потеряна. Соединение закрыто, доставка невозможна.')
+                self.delete_client(self.names[message[RECEIVER]])
+        elif self.db.check_user(message[RECEIVER]):
+            self.db.store_offline_message(message[RECEIVER], message)
+            logger.info(f'Пользователь {message[RECEIVER]} не в сети, сообщение от пользователя {message[SENDER]} '
+                        f'сохранено до его входа.')
         else:
             logger.error(
                 f'Пользователь {message[RECEIVER]} не зарегистрирован на сервере, отправка сообщения невозможна.')
 
+    def start_offline_drain(self, name):
+        """
+        :param name: имя пользователя
+
+        Метод, начинающий передачу пользователю сообщений, сохранённых, пока он был не в сети. До окончания
+        передачи новые сообщения пользователю тоже сохраняются в базе, чтобы не нарушить порядок сообщений
+        """
+
+        self.offline_draining.add(name)
+        self.drain_offline_messages(name)
+
+    def drain_offline_messages(self, name):
+        """
+        :param name: имя пользователя
+
+        Метод, передающий пользователю очередную страницу сохранённых сообщений. Следующая страница ставится
+        в очередь вызовов цикла сервера без записи в сокет пробуждения и передаётся на следующем шаге цикла,
+        а при переполненной очереди отправки - после её освобождения, поэтому большая очередь сообщений
+        не останавливает обслуживание других клиентов, сколько бы пользователей ни получали сообщения
+        """
+
+        client = self.names.get(name)
+        if client is None or name not in self.offline_draining:
+            return
+        if self.get_queue_depth(name) > self.high_water:
+            self.defer_offline_drain(client, name)
+            return
+        messages = self.db.get_offline_messages(name, self.offline_page_size)
+        try:
+            for message_id, message in messages:
+                message.pop(REQUEST_ID, None)
+                self.send(client, message)
+        except OSError:
+            logger.error(f'Связь с клиентом {name} была потеряна во время передачи сохранённых сообщений.')
+            self.delete_client(client)
+            return
+        if messages:
+            self.db.delete_offline_messages(name, messages[-1][0])
+            logger.info(f'Пользователю {name} передано сохранённых сообщений: {len(messages)}.')
+        if len(messages) < self.offline_page_size:
+            self.offline_draining.discard(name)
+            return
+        self.call_soon(self.drain_offline_messages, name)
+
+    def defer_offline_drain(self, client, name):
+        """
+        :param client: сокет клиента
+        :param name: имя пользователя
+
+        Метод, откладывающий передачу сохранённых сообщений до освобождения очереди отправки клиента
+        """
+
+        self.offline_waiting[client] = name
+
+    def dispatch_client_messages(self, messages, client):
+        """
+        :param messages: список сообщений, полученных от клиента за один приём данных
+        :param client: сокет клиента
+
+        Метод, обрабатывающий по порядку все сообщения, полученные от клиента за один приём данных
+        """
+
+        for message in messages:
+            if isinstance(message, Envelope):
+                self.relay_envelope(message, client)
+            else:
+                self.dispatch_client_message(message, client)
+            if client not in self.clients:
+                return
+
+    def can_relay(self, sender, receiver):
+        """
+        :param sender: сокет отправителя
+        :param receiver: сокет получателя
+
+        Метод, проверяющий, может ли получатель принять кадр-конверт отправителя без перекодирования:
+        получатель должен поддерживать конверты и использовать тот же формат сериализации
+        """
+
+        sender_stream = self.streams.get(sender)
+        receiver_stream = self.streams.get(receiver)
+        return receiver_stream is not None and receiver_stream.framed \
+            and ENVELOPE in self.client_features.get(receiver, ()) \
+            and receiver_stream.codec.name == sender_stream.codec.name
+
+    def relay_envelope(self, envelope, client):
+        """
+        :param envelope: кадр-конверт с сообщением пользователю
+        :param client: сокет клиента
+
+        Метод, пересылающий кадр-конверт получателю в том виде, в котором он получен. Маршрут определяется
+        по заголовку конверта, само сообщение не декодируется. Если переслать кадр как есть нельзя (получатель
+        не в сети, ещё получает сохранённые сообщения или не поддерживает конверты), сообщение декодируется
+        и обрабатывается как обычно. Сервер проверяет, что отправитель в заголовке - это пользователь соединения,
+        а совпадение заголовка с отправителем и получателем внутри сообщения проверяет Envelope.decode: при
+        декодировании на сервере поддельный конверт разрывает соединение отправителя, а получатель, которому
+        конверт переслан как есть, отбрасывает его сам
+        """
+
+        receiver = self.names.get(envelope.receiver)
+        if self.names.get(envelope.sender) is not client or receiver is None \
+                or envelope.receiver in self.offline_draining or not self.can_relay(client, receiver):
+            self.dispatch_client_message(envelope.decode(self.streams[client].codec), client)
+            return
+        self.current_request = (client, envelope.request_id) if envelope.request_id else None
+        try:
+            self.db.process_message(envelope.sender, envelope.receiver)
+            try:
+                self.write(receiver, envelope.forward())
+                logger.debug('Переслан конверт пользователю %s от пользователя %s.', envelope.receiver, envelope.sender)
+                self.apply_backpressure(client, receiver)
+            except OSError:
+                logger.error(f'Связь с клиентом {envelope.receiver} была потеряна. Соединение закрыто, '
+                             f'доставка невозможна.')
+                self.delete_client(receiver)
+            try:
+                self.send(client, RESPONSE_200)
+            except OSError:
+                self.delete_client(client)
+        finally:
+            self.current_request = None
+
+    def dispatch_client_message(self, message, client):
+        """
+        :param message: словарь, содержащий данные об обрабатываемом сообщении
+        :param client: сокет клиента
+
+        Метод, передающий сообщение клиента на обработку. Если в сообщении есть идентификатор запроса, он
+        добавляется во все ответы на это сообщение, чтобы клиент мог отправлять запросы, не дожидаясь ответов
+        на предыдущие, и сопоставлять ответы с запросами. Идентификатор принадлежит соединению отправителя,
+        поэтому он удаляется из сообщения и не попадает к получателю ни сразу, ни из сохранённых сообщений
+        """
+
+        if isinstance(message, dict) and REQUEST_ID in message:
+            self.current_request = (client, message.pop(REQUEST_ID))
+        try:
+            self.process_client_message(message, client)
+        finally:
+            self.current_request = None
+
     @login_required
     def process_client_message(self, message, client):
         """
@@ -146,25 +662,28 @@ class MessageProcessor(threading.Thread):
             -получение публичного ключа пользователя
         """
 
-        logger.debug(f'Разбор сообщения от клиента : {message}')
+        logger.debug('Разбор сообщения от клиента : %s', message)
         if ACTION in message and message[ACTION] == PRESENCE and TIME in message and USER in message:
             self.autorize_user(message, client)
 
+        elif RESPONSE in message and message[RESPONSE] == 511 and BIN in message and client in self.auth_pending:
+            self.complete_authorization(message, client)
+
         elif ACTION in message and message[ACTION] == MESSAGE and RECEIVER in message and TIME in message \
                 and SENDER in message and MESSAGE_TEXT in message and self.names[message[SENDER]] == client:
-            if message[RECEIVER] in self.names:
+            if self.user_online(message[RECEIVER]) or self.db.check_user(message[RECEIVER]):
                 self.db.process_message(
                     message[SENDER], message[RECEIVER])
                 self.process_message(message)
                 try:
-                    send_message(client, RESPONSE_200)
+                    self.send(client, RESPONSE_200)
                 except OSError:
                     self.delete_client(client)
             else:
                 response = RESPONSE_400
                 response[ERROR] = 'Пользователь не зарегистрирован на сервере.'
                 try:
-                    send_message(client, response)
+                    self.send(client, response)
                 except OSError:
                     pass
             return
@@ -176,29 +695,30 @@ class MessageProcessor(threading.Thread):
             response = RESPONSE_202
             response[DATA] = self.db.get_contacts(message[ACCOUNT_NAME])
             try:
-                send_message(client, response)
+                self.send(client, response)
             except OSError:
                 self.delete_client(client)
         elif ACTION in message and message[ACTION] == ADD_CONTACT and ACCOUNT_NAME in message and CONTACT in message \
                 and self.names[message[ACCOUNT_NAME]] == client:
             self.db.add_contact(message[ACCOUNT_NAME], message[CONTACT])
             try:
-                send_message(client, RESPONSE_200)
+                self.send(client, RESPONSE_200)
             except OSError:
                 self.delete_client(client)
         elif ACTION in message and message[ACTION] == DEL_CONTACT and ACCOUNT_NAME in message and CONTACT in message \
                 and self.names[message[ACCOUNT_NAME]] == client:
             self.db.delete_contact(message[ACCOUNT_NAME], message[CONTACT])
             try:
-                send_message(client, RESPONSE_200)
+                self.send(client, RESPONSE_200)
             except OSError:
                 self.delete_client(client)
         elif ACTION in message and message[ACTION] == GET_USERS and ACCOUNT_NAME in message \
                 and self.names[message[ACCOUNT_NAME]] == client:
-            response = RESPONSE_202
+            response = RESPONSE_202.copy()
+            response[DIRECTORY_VERSION] = self.db.get_directory_version()
             response[DATA] = [user[0] for user in self.db.get_users()]
             try:
-                send_message(client, response)
+                self.send(client, response)
             except OSError:
                 self.delete_client(client)
         elif ACTION in message and message[ACTION] == GET_PUBLIC_KEY and ACCOUNT_NAME in message:
@@ -206,21 +726,21 @@ class MessageProcessor(threading.Thread):
             response[BIN] = self.db.get_public_key(message[ACCOUNT_NAME])
             if response[BIN]:
                 try:
-                    send_message(client, response)
+                    self.send(client, response)
                 except OSError:
                     self.delete_client(client)
             else:
                 response = RESPONSE_400
                 response[ERROR] = 'Нет публичного ключа для данного пользователя'
                 try:
-                    send_message(client, response)
+                    self.send(client, response)
                 except OSError:
                     self.delete_client(client)
         else:
             response = RESPONSE_400
             response[ERROR] = 'Запрос некорректен.'
             try:
-                send_message(client, response)
+                self.send(client, response)
             except OSError:
                 self.delete_client(client)
 
@@ -230,77 +750,163 @@ class MessageProcessor(threading.Thread):
         :param transport: сокет клиента
 
         Метод, отвечающий за авторизацию пользователя на сервере. Проверяет не подключён ли уже пользователь к серверу и
-        зарегистрирован ли на сервере, затем через алгоритм хэширования проверяет введённый пароль и осуществляет
-        подключение пользователя, если всё в порядке
+        зарегистрирован ли на сервере, затем отправляет клиенту случайную строку для проверки пароля. Ответ клиента
+        приходит отдельным сообщением и обрабатывается методом complete_authorization, поэтому цикл обработки событий
+        не блокируется в ожидании ответа. Клиент, приславший действительный токен возобновления сессии,
+        подключается сразу, без проверки пароля
         """
 
         logger.debug(f'Start auth process for {message[USER]}')
-        if message[USER][ACCOUNT_NAME] in self.names.keys():
+        if self.user_online(message[USER][ACCOUNT_NAME]):
             response = RESPONSE_400
             response[ERROR] = 'Имя пользователя уже занято.'
             try:
                 logger.debug(f'Username busy, sending {response}')
-                send_message(transport, response)
+                self.send(transport, response)
             except OSError:
                 logger.debug('OS Error')
                 pass
-            self.clients.remove(transport)
-            transport.close()
+            self.delete_client(transport)
         elif not self.db.check_user(message[USER][ACCOUNT_NAME]):
             response = RESPONSE_400
             response[ERROR] = 'Пользователь не зарегистрирован.'
             try:
                 logger.debug(f'Unknown username, sending {response}')
-                send_message(transport, response)
+                self.send(transport, response)
             except OSError:
                 pass
-            self.clients.remove(transport)
-            transport.close()
+            self.delete_client(transport)
         else:
+            features = [feature for feature in message.get(FEATURES, []) if feature in SUPPORTED_FEATURES]
+            if FRAMING not in features and ENVELOPE in features:
+                features.remove(ENVELOPE)
+            self.client_features[transport] = features
+            codec = choose_codec(message.get(CODECS)) if FRAMING in features else JSON_CODEC
+            if SESSION_TOKEN in message and self.session_tokens.verify(
+                    message[SESSION_TOKEN], message[USER][ACCOUNT_NAME],
+                    self.db.get_hash(message[USER][ACCOUNT_NAME]), message[USER][PUBLIC_KEY]):
+                logger.debug('Valid session token, skipping passwd check.')
+                response = RESPONSE_200.copy()
+                response[FEATURES] = features
+                response[CODEC] = codec.name
+                self.login_user(message[USER], transport, response, FRAMING in features, codec)
+                return
             logger.debug('Correct username, starting passwd check.')
-            message_auth = RESPONSE_511
+            message_auth = RESPONSE_511.copy()
             random_str = binascii.hexlify(os.urandom(64))
             message_auth[BIN] = random_str.decode('ascii')
+            message_auth[FEATURES] = features
+            message_auth[CODEC] = codec.name
             hash = hmac.new(self.db.get_hash(message[USER][ACCOUNT_NAME]), random_str, 'MD5').digest()
             logger.debug(f'Auth message = {message_auth}')
             try:
-                send_message(transport, message_auth)
-                response = get_message(transport)
+                self.send(transport, message_auth)
             except OSError as err:
                 logger.debug('Error in auth, data:', exc_info=err)
-                transport.close()
+                self.delete_client(transport)
                 return
-            client_digest = binascii.a2b_base64(response[BIN])
-            if RESPONSE in response and response[RESPONSE] == 511 and \
-                    hmac.compare_digest(hash, client_digest):
-                self.names[message[USER][ACCOUNT_NAME]] = transport
-                client_ip, client_port = transport.getpeername()
-                try:
-                    send_message(transport, RESPONSE_200)
-                except OSError:
-                    self.delete_client(message[USER][ACCOUNT_NAME])
-                self.db.user_login(
-                    message[USER][ACCOUNT_NAME],
-                    client_ip,
-                    client_port,
-                    message[USER][PUBLIC_KEY])
-            else:
-                response = RESPONSE_400
-                response[ERROR] = 'Неверный пароль.'
-                try:
-                    send_message(transport, response)
-                except OSError:
-                    pass
-                self.clients.remove(transport)
-                transport.close()
+            self.streams[transport].framed = FRAMING in features
+            self.streams[transport].codec = codec
+            self.auth_pending[transport] = (message[USER], hash)
+
+    def complete_authorization(self, response, transport):
+        """
+        :param response: словарь, содержащий ответ клиента на запрос проверки пароля
+        :param transport: сокет клиента
+
+        Метод, завершающий авторизацию пользователя: сверяет присланный клиентом хэш с ожидаемым и осуществляет
+        подключение пользователя, если всё в порядке
+        """
+
+        user, hash = self.auth_pending.pop(transport)
+        client_digest = binascii.a2b_base64(response[BIN])
+        if self.user_online(user[ACCOUNT_NAME]):
+            response = RESPONSE_400
+            response[ERROR] = 'Имя пользователя уже занято.'
+            try:
+                self.send(transport, response)
+            except OSError:
+                pass
+            self.delete_client(transport)
+        elif hmac.compare_digest(hash, client_digest):
+            self.login_user(user, transport, RESPONSE_200.copy())
+        else:
+            response = RESPONSE_400
+            response[ERROR] = 'Неверный пароль.'
+            try:
+                self.send(transport, response)
+            except OSError:
+                pass
+            self.delete_client(transport)
+
+    def login_user(self, user, transport, response, framed=None, codec=None):
+        """
+        :param user: словарь с данными пользователя из приветственного сообщения
+        :param transport: сокет клиента
+        :param response: словарь ответа об успешном входе
+        :param framed: переключить ли клиента на сообщения с заголовком длины после отправки ответа
+        :param codec: формат сериализации, на который клиент переключается после отправки ответа
+
+        Метод, подключающий пользователя, прошедшего проверку: отправляет ответ с новым токеном возобновления
+        сессии, записывает вход в базу данных и начинает передачу сохранённых для пользователя сообщений
+        """
+
+        self.registry.bind(user[ACCOUNT_NAME], transport)
+        client_ip, client_port = transport.getpeername()
+        response[SESSION_TOKEN] = self.session_tokens.issue(
+            user[ACCOUNT_NAME], self.db.get_hash(user[ACCOUNT_NAME]), user[PUBLIC_KEY])
+        try:
+            self.send(transport, response)
+        except OSError:
+            self.delete_client(transport)
+            return
+        if framed is not None:
+            self.streams[transport].framed = framed
+        if codec is not None:
+            self.streams[transport].codec = codec
+        self.db.user_login(
+            user[ACCOUNT_NAME],
+            client_ip,
+            client_port,
+            user[PUBLIC_KEY])
+        if self.db.get_directory_version() != self.directory_version:
+            self.service_update_lists()
+        self.start_offline_drain(user[ACCOUNT_NAME])
 
     def service_update_lists(self):
         """
-        Метод, осуществляющий обновление словаря пользователей сервера
+        Метод, рассылающий клиентам изменения списка пользователей сервера. Клиентам, поддерживающим версии
+        списка, отправляются только изменения после предыдущей рассылки, остальным при добавлении или удалении
+        пользователей - RESPONSE_205 для полной перезагрузки списков. Сообщение кодируется один раз для всех
+        клиентов. При вызове из другого потока (например, из окон графического интерфейса) выполнение передаётся
+        в поток сервера
         """
 
-        for client in self.names:
+        if not self.in_server_thread():
+            self.call_soon(self.service_update_lists)
+            return
+        version = self.db.get_directory_version()
+        if version == self.directory_version:
+            return
+        changes = self.db.get_directory_changes(self.directory_version)
+        self.directory_version = version
+        update = {ACTION: DIRECTORY_UPDATE, DIRECTORY_VERSION: version, DATA: changes or []}
+        users_changed = changes is None or any(change[2] != KEY_CHANGED for change in changes)
+        encoded = {}
+        for name, client in list(self.names.items()):
+            stream = self.streams.get(client)
+            if stream is None:
+                continue
+            if DIRECTORY in self.client_features.get(client, ()):
+                message = update
+            elif users_changed:
+                message = RESPONSE_205
+            else:
+                continue
+            key = (message is update, stream.framed, stream.codec.name)
+            if key not in encoded:
+                encoded[key] = stream.encode(message)
             try:
-                send_message(self.names[client], RESPONSE_205)
+                self.write(client, encoded[key])
             except OSError:
-                self.delete_client(self.names[client])
+                self.delete_client(client)
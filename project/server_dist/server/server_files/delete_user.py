@@ -51,12 +51,7 @@ class DeleteUserDialog(QDialog):
         Метод, провоцирующий удаление пользователя из базы данных сервера и отключающий его от сервера
         """
 
-        self.db.delete_user(self.selector.currentText())
-        if self.selector.currentText() in self.server.names:
-            sock = self.server.names[self.selector.currentText()]
-            del self.server.names[self.selector.currentText()]
-            self.server.remove_client(sock)
-        self.server.service_update_lists()
+        self.server.remove_user(self.selector.currentText())
         self.close()
 
 
@@ -71,9 +71,11 @@ class MainWindow(QMainWindow):
         list_users = self.db.get_active_users()
         list = QStandardItemModel()
         list.setHorizontalHeaderLabels(
-            ['Имя Клиента', 'IP Адрес', 'Порт', 'Время подключения'])
+            ['Имя Клиента', 'IP Адрес', 'Порт', 'Время подключения', 'Очередь, байт'])
         for row in list_users:
             user, ip, port, time = row
+            queue = QStandardItem(str(self.server.get_queue_depth(user)))
+            queue.setEditable(False)
             user = QStandardItem(user)
             user.setEditable(False)
             ip = QStandardItem(ip)
@@ -82,11 +84,14 @@ class MainWindow(QMainWindow):
             port.setEditable(False)
             time = QStandardItem(str(time.replace(microsecond=0)))
             time.setEditable(False)
-            list.appendRow([user, ip, port, time])
+            list.appendRow([user, ip, port, time, queue])
         self.active_clients_table.setModel(list)
         self.active_clients_table.resizeColumnsToContents()
         self.active_clients_table.resizeRowsToContents()
 
+        hits, misses = self.db.get_cache_stats()
+        self.statusBar().showMessage(f'Server Working. Кэш пользователей: попаданий {hits}, промахов {misses}')
+
     def show_stats(self):
         """
         Метод, вызывающий окно со статистикой пользователей
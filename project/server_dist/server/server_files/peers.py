@@ -0,0 +1,376 @@
+import logging
+import selectors
+import sys
+sys.path.append('../../../')
+from server_dist.server.common.utils import MessageStream, Envelope, CODECS_AVAILABLE, CODEC_PREFERENCE, \
+    get_codec, message_bytes
+from server_dist.server.common.variables import *
+from server_dist.server.server_files.core import MessageProcessor
+
+logger = logging.getLogger('server_dist')
+
+# Сообщения, которыми обмениваются соседние серверы
+ROUTE = 'route'
+UNROUTE = 'unroute'
+RELAY = 'relay'
+# Формат сериализации сообщений между соседними серверами
+PEER_CODEC = CODECS_AVAILABLE[CODEC_PREFERENCE[0]]
+
+
+class PeerMessageProcessor(MessageProcessor):
+    """
+    Базовый класс сервера, соединённого с соседними серверами (рабочими процессами или узлами кластера).
+    О входе и выходе своих пользователей сервер сообщает соседям, поэтому каждый сервер знает, к какому
+    соседу подключён пользователь, и пересылает туда адресованные ему сообщения. Соединения с соседями
+    используют те же очереди отправки и то же подавление отправителей, что и соединения клиентов
+    """
+
+    def __init__(self, address, port, db, high_water=OUT_BUFFER_HIGH_WATER, buffer_limit=OUT_BUFFER_LIMIT,
+                 slow_consumer_timeout=SLOW_CONSUMER_TIMEOUT, session_tokens=None):
+        super().__init__(address, port, db, high_water, buffer_limit, slow_consumer_timeout, session_tokens)
+        self.links = {}
+        self.peers = {}
+        self.remote_names = {}
+
+    def run(self):
+        """
+        Метод, запускающий сервер и закрывающий соединения с соседями после его остановки
+        """
+
+        super().run()
+        for link in list(self.links):
+            link.close()
+
+    def add_link(self, link, peer_id):
+        """
+        :param link: сокет соединения с соседним сервером
+        :param peer_id: идентификатор соседа или None, если он ещё не известен
+
+        Метод, регистрирующий соединение с соседним сервером
+        """
+
+        link.setblocking(False)
+        self.links[link] = peer_id
+        if peer_id is not None:
+            self.peers[peer_id] = link
+        self.streams[link] = MessageStream(True, PEER_CODEC)
+        self.out_buffers[link] = bytearray()
+        self.selector.register(link, selectors.EVENT_READ, self.process_client_events)
+
+    def process_client_events(self, client, mask):
+        """
+        :param client: сокет клиента или соединения с соседним сервером
+        :param mask: маска событий селектора
+
+        Метод, обрабатывающий готовность сокета к записи и чтению. События соединений с соседями
+        обрабатываются отдельно
+        """
+
+        if client not in self.links:
+            super().process_client_events(client, mask)
+            return
+        if mask & selectors.EVENT_WRITE:
+            self.write_client(client)
+        if mask & selectors.EVENT_READ and client in self.links:
+            self.read_link(client)
+
+    def read_link(self, link):
+        """
+        :param link: сокет соединения с соседним сервером
+
+        Метод, принимающий сообщения соседнего сервера. Ошибка обработки сообщения закрывает соединение
+        с соседом и откатывает транзакцию базы данных, не останавливая цикл сервера
+        """
+
+        try:
+            data = link.recv(RECV_BUFFER_SIZE)
+            if not data:
+                logger.info(f'Соседний сервер {self.links[link]} закрыл соединение.')
+                self.drop_link(link)
+                return
+            messages = self.streams[link].feed(data)
+        except (BlockingIOError, InterruptedError):
+            return
+        except (OSError, ValueError, TypeError) as err:
+            logger.error(f'Потеряна связь с соседним сервером {self.links[link]}.', exc_info=err)
+            self.drop_link(link)
+            return
+        for message in messages:
+            try:
+                self.process_peer_message(message, link)
+            except Exception as err:
+                logger.error(f'Не удалось обработать сообщение соседнего сервера {self.links[link]}, '
+                             f'соединение закрыто.', exc_info=err)
+                self.db.rollback_session()
+                self.drop_link(link)
+            if link not in self.links:
+                return
+
+    def drop_link(self, link):
+        """
+        :param link: сокет соединения с соседним сервером
+
+        Метод, закрывающий соединение с соседним сервером. Пользователи этого соседа считаются отключившимися
+        """
+
+        if link not in self.links:
+            return
+        peer_id = self.links.pop(link)
+        if self.peers.get(peer_id) is link:
+            del self.peers[peer_id]
+            for name in [name for name, peer in self.remote_names.items() if peer == peer_id]:
+                del self.remote_names[name]
+                self.remote_logout(name)
+        self.streams.pop(link, None)
+        self.out_buffers.pop(link, None)
+        for waiting in self.paused.values():
+            waiting.discard(link)
+        self.congested_since.pop(link, None)
+        for sender in self.paused.pop(link, ()):
+            self.resume_reading(sender)
+        self.release_client(link)
+        self.link_lost(peer_id)
+
+    def link_lost(self, peer_id):
+        """
+        :param peer_id: идентификатор соседа
+
+        Метод, вызываемый после закрытия соединения с соседним сервером
+        """
+
+        pass
+
+    def delete_client(self, client):
+        """
+        :param client: сокет клиента
+
+        Метод, отключающий клиента от сервера. Об отключении пользователя сообщается соседям,
+        кроме случая остановки сервера
+        """
+
+        if client in self.links:
+            self.drop_link(client)
+            return
+        name = self.registry.name_of(client)
+        super().delete_client(client)
+        if name is not None and self.running:
+            self.broadcast({ACTION: UNROUTE, ACCOUNT_NAME: name})
+
+    def resume_reading(self, client):
+        """
+        :param client: сокет клиента или соединения с соседним сервером
+
+        Метод, возобновляющий приём сообщений от клиента или соседнего сервера
+        """
+
+        if client in self.links:
+            self.update_events(client)
+        else:
+            super().resume_reading(client)
+
+    def send_to_peer(self, link, message):
+        """
+        :param link: сокет соединения с соседним сервером
+        :param message: словарь сообщения
+
+        Метод, отправляющий сообщение соседнему серверу
+        """
+
+        try:
+            self.write(link, self.streams[link].encode(message))
+        except OSError as err:
+            logger.error(f'Потеряна связь с соседним сервером {self.links[link]}.', exc_info=err)
+            self.drop_link(link)
+
+    def broadcast(self, message):
+        """
+        :param message: словарь сообщения
+
+        Метод, отправляющий сообщение всем соседям
+        """
+
+        for link in list(self.peers.values()):
+            self.send_to_peer(link, message)
+
+    def route_message(self, name):
+        """
+        :param name: имя пользователя этого сервера
+
+        Метод, формирующий сообщение соседям о том, что пользователь подключён к этому серверу
+        """
+
+        return {ACTION: ROUTE, ACCOUNT_NAME: name, PUBLIC_KEY: self.db.get_public_key(name),
+                DIRECTORY_VERSION: self.db.get_directory_version()}
+
+    def announce_users(self, link):
+        """
+        :param link: сокет соединения с соседним сервером
+
+        Метод, сообщающий соседу обо всех пользователях этого сервера
+        """
+
+        for name in list(self.names):
+            self.send_to_peer(link, self.route_message(name))
+
+    def user_online(self, name):
+        """
+        :param name: имя пользователя
+
+        Метод, проверяющий, подключён ли пользователь к этому серверу или к одному из соседей
+        """
+
+        return name in self.names or name in self.remote_names
+
+    def login_user(self, user, transport, response, framed=None, codec=None):
+        """
+        :param user: словарь с данными пользователя из приветственного сообщения
+        :param transport: сокет клиента
+        :param response: словарь ответа об успешном входе
+        :param framed: переключить ли клиента на сообщения с заголовком длины после отправки ответа
+        :param codec: формат сериализации, на который клиент переключается после отправки ответа
+
+        Метод, подключающий пользователя и сообщающий соседям, что пользователь находится на этом сервере
+        """
+
+        super().login_user(user, transport, response, framed, codec)
+        if self.names.get(user[ACCOUNT_NAME]) is transport:
+            self.broadcast(self.route_message(user[ACCOUNT_NAME]))
+
+    def remote_login(self, message, peer_id):
+        """
+        :param message: сообщение соседа о входе пользователя
+        :param peer_id: идентификатор соседа
+
+        Метод, учитывающий вход пользователя на соседнем сервере
+        """
+
+        pass
+
+    def remote_logout(self, name):
+        """
+        :param name: имя пользователя
+
+        Метод, учитывающий выход пользователя с соседнего сервера
+        """
+
+        pass
+
+    def process_message(self, message):
+        """
+        :param message: словарь, содержащий данные об обрабатываемом сообщении
+
+        Метод, отправляющий сообщение получателю. Сообщение пользователю соседнего сервера пересылается
+        этому соседу
+        """
+
+        link = self.peers.get(self.remote_names.get(message[RECEIVER]))
+        if message[RECEIVER] in self.names or link is None:
+            super().process_message(message)
+            return
+        self.send_to_peer(link, {ACTION: MESSAGE, DATA: message})
+        if link in self.links and message[SENDER] in self.names:
+            self.apply_backpressure(self.names[message[SENDER]], link)
+
+    def relay_envelope(self, envelope, client):
+        """
+        :param envelope: кадр-конверт с сообщением пользователю
+        :param client: сокет клиента
+
+        Метод, пересылающий кадр-конверт получателю. Конверт пользователю соседнего сервера пересылается
+        этому соседу без разбора
+        """
+
+        link = self.peers.get(self.remote_names.get(envelope.receiver))
+        if envelope.receiver in self.names or link is None or self.names.get(envelope.sender) is not client:
+            super().relay_envelope(envelope, client)
+            return
+        self.current_request = (client, envelope.request_id) if envelope.request_id else None
+        try:
+            self.db.process_message(envelope.sender, envelope.receiver)
+            self.send_to_peer(link, {ACTION: RELAY, CODEC: self.streams[client].codec.name, DATA: envelope.forward()})
+            if link in self.links:
+                self.apply_backpressure(client, link)
+            try:
+                self.send(client, RESPONSE_200)
+            except OSError:
+                self.delete_client(client)
+        finally:
+            self.current_request = None
+
+    def process_peer_message(self, message, link):
+        """
+        :param message: словарь сообщения соседнего сервера
+        :param link: сокет соединения с этим соседом
+
+        Метод, обрабатывающий сообщения соседнего сервера:
+            -вход пользователя на соседнем сервере
+            -выход пользователя с соседнего сервера
+            -сообщение пользователю этого сервера
+            -кадр-конверт пользователю этого сервера
+        """
+
+        peer_id = self.links[link]
+        if message[ACTION] == ROUTE:
+            self.remote_login(message, peer_id)
+            self.remote_names[message[ACCOUNT_NAME]] = peer_id
+            if self.db.get_directory_version() != self.directory_version:
+                self.service_update_lists()
+        elif message[ACTION] == UNROUTE:
+            if self.remote_names.get(message[ACCOUNT_NAME]) == peer_id:
+                del self.remote_names[message[ACCOUNT_NAME]]
+                self.remote_logout(message[ACCOUNT_NAME])
+        elif message[ACTION] == MESSAGE:
+            self.deliver_remote_message(message[DATA], link)
+        elif message[ACTION] == RELAY:
+            codec = get_codec(message[CODEC])
+            envelope = Envelope(message_bytes(message[DATA]))
+            receiver = self.names.get(envelope.receiver)
+            stream = self.streams.get(receiver)
+            if receiver is not None and envelope.receiver not in self.offline_draining and stream.framed \
+                    and ENVELOPE in self.client_features.get(receiver, ()) and stream.codec.name == codec.name:
+                self.deliver_remote_frame(receiver, envelope.frame, link)
+            else:
+                try:
+                    message = envelope.decode(codec)
+                except (ValueError, TypeError) as err:
+                    logger.warning('Отброшен кадр-конверт от %s: %s', envelope.sender, err)
+                    return
+                message.pop(REQUEST_ID, None)
+                self.deliver_remote_message(message, link)
+
+    def deliver_remote_message(self, message, link):
+        """
+        :param message: словарь сообщения пользователю
+        :param link: сокет соединения с сервером отправителя
+
+        Метод, передающий сообщение, полученное от соседа, пользователю этого сервера. Если пользователь
+        уже отключился, сообщение сохраняется до его следующего входа
+        """
+
+        receiver = self.names.get(message[RECEIVER])
+        if receiver is None or message[RECEIVER] in self.offline_draining:
+            if self.db.check_user(message[RECEIVER]):
+                self.db.store_offline_message(message[RECEIVER], message)
+            return
+        try:
+            self.send(receiver, message)
+        except OSError:
+            self.delete_client(receiver)
+            return
+        self.apply_backpressure(link, receiver)
+
+    def deliver_remote_frame(self, receiver, frame, link):
+        """
+        :param receiver: сокет получателя
+        :param frame: кадр-конверт
+        :param link: сокет соединения с сервером отправителя
+
+        Метод, передающий полученный от соседа кадр-конверт получателю как есть
+        """
+
+        try:
+            self.write(receiver, frame)
+        except OSError:
+            self.delete_client(receiver)
+            return
+        self.apply_backpressure(link, receiver)
@@ -0,0 +1,89 @@
+class ConnectionRegistry:
+    """
+    Класс реестра подключений сервера. Хранит все подключения и связь имя пользователя - подключение -
+    номер файлового дескриптора в словарях в обе стороны, поэтому поиск подключения по имени, имени по подключению
+    и подключения по дескриптору, а также добавление и удаление подключения выполняются за постоянное время.
+    Подключения хранятся в словаре, сохраняющем порядок добавления. Словарь names (имя - подключение) открыт
+    для чтения, изменять его можно только методами реестра
+    """
+
+    def __init__(self):
+        self.connections = {}
+        self.names = {}
+        self.sockets = {}
+        self.filenos = {}
+
+    def __contains__(self, client):
+        return client in self.connections
+
+    def __iter__(self):
+        return iter(self.connections)
+
+    def __len__(self):
+        return len(self.connections)
+
+    def add(self, client):
+        """
+        :param client: подключение клиента
+
+        Метод, добавляющий подключение в реестр. Объекты без файлового дескриптора (например, подключения
+        asyncio) в индекс дескрипторов не попадают
+        """
+
+        fileno = client.fileno() if hasattr(client, 'fileno') else -1
+        self.connections[client] = fileno
+        if fileno >= 0:
+            self.filenos[fileno] = client
+
+    def remove(self, client):
+        """
+        :param client: подключение клиента
+
+        Метод, удаляющий подключение из реестра. Возвращает имя пользователя подключения или None
+        """
+
+        fileno = self.connections.pop(client, -1)
+        if self.filenos.get(fileno) is client:
+            del self.filenos[fileno]
+        name = self.sockets.pop(client, None)
+        if name is not None:
+            del self.names[name]
+        return name
+
+    def bind(self, name, client):
+        """
+        :param name: имя пользователя
+        :param client: подключение клиента
+
+        Метод, связывающий подключение с именем вошедшего пользователя
+        """
+
+        self.names[name] = client
+        self.sockets[client] = name
+
+    def name_of(self, client):
+        """
+        :param client: подключение клиента
+
+        Метод, возвращающий имя пользователя подключения или None, если пользователь ещё не вошёл
+        """
+
+        return self.sockets.get(client)
+
+    def socket_of(self, name):
+        """
+        :param name: имя пользователя
+
+        Метод, возвращающий подключение пользователя или None
+        """
+
+        return self.names.get(name)
+
+    def by_fileno(self, fileno):
+        """
+        :param fileno: номер файлового дескриптора
+
+        Метод, возвращающий подключение по номеру файлового дескриптора или None
+        """
+
+        return self.filenos.get(fileno)
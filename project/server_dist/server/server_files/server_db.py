@@ -0,0 +1,646 @@
+from sqlalchemy import *
+from sqlalchemy import event
+from sqlalchemy.orm import mapper, sessionmaker, scoped_session
+from sqlalchemy.pool import QueuePool
+import datetime
+import json
+import threading
+import time
+import sys
+sys.path.append('../../../')
+from server_dist.server.common.utils import JsonCodec
+from server_dist.server.common.variables import STATS_FLUSH_INTERVAL, STATS_FLUSH_SIZE, DB_POOL_SIZE, \
+    DB_MAX_OVERFLOW, DB_BUSY_TIMEOUT, DIRECTORY_LOG_SIZE, USER_ADDED, USER_REMOVED, KEY_CHANGED, REQUEST_ID
+
+
+class ServerDB:
+    """
+    Класс, определяющий, создающий и изменяющий серверную базу данных.
+    Базой пользуются одновременно поток сервера и поток графического интерфейса, поэтому каждый поток работает
+    через собственную сессию (scoped_session) и собственное соединение из пула, а база переведена в режим WAL,
+    в котором чтение не блокирует запись
+    """
+
+    class User:
+        def __init__(self, name, hash):
+            self.id = None
+            self.name = name
+            self.last_login = datetime.datetime.now()
+            self.hash = hash
+            self.public_key = None
+
+        def __repr__(self):
+            return f'<User: {self.id}-{self.name}>'
+
+    class ActiveUser:
+        def __init__(self, user, login_time, login_ip, login_port):
+            self.id = None
+            self.user = user
+            self.login_time = login_time
+            self.login_ip = login_ip
+            self.login_port = login_port
+
+        def __repr__(self):
+            return f'<Active User: {self.id}-{self.user}>'
+
+    class LoginHistory:
+        def __init__(self, user, login_time, login_ip, login_port):
+            self.id = None
+            self.user = user
+            self.login_time = login_time
+            self.login_ip = login_ip
+            self.login_port = login_port
+
+        def __repr__(self):
+            return f'<Login: {self.id}-{self.user}-{self.login_time}>'
+
+    class Contact:
+        def __init__(self, user, contact):
+            self.id = None
+            self.user = user
+            self.contact = contact
+
+        def __repr__(self):
+            return f'<Contact: {self.id}-{self.user}-{self.contact}>'
+
+    class OfflineMessage:
+        def __init__(self, receiver, message):
+            self.id = None
+            self.receiver = receiver
+            self.message = message
+
+        def __repr__(self):
+            return f'<OfflineMessage: {self.id}-{self.receiver}>'
+
+    class DirectoryChange:
+        def __init__(self, name, change):
+            self.version = None
+            self.name = name
+            self.change = change
+
+        def __repr__(self):
+            return f'<DirectoryChange: {self.version}-{self.name}-{self.change}>'
+
+    class MessageHistory:
+        def __init__(self, user):
+            self.user = user
+            self.sent = 0
+            self.received = 0
+
+        def __repr__(self):
+            return f'<MessageHistory: {self.user}-{self.sent}-{self.received}>'
+
+    def __init__(self, path, stats_flush_interval=STATS_FLUSH_INTERVAL, stats_flush_size=STATS_FLUSH_SIZE,
+                 pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, busy_timeout=DB_BUSY_TIMEOUT):
+        self.engine = create_engine(f'sqlite:///{path}.db3', echo=False, pool_recycle=7200,
+                                    poolclass=QueuePool, pool_size=pool_size, max_overflow=max_overflow,
+                                    connect_args={'check_same_thread': False, 'timeout': busy_timeout})
+        event.listen(self.engine, 'connect', self.configure_connection)
+        self.metadata = MetaData()
+
+        users_table = Table('users', self.metadata,
+                            Column('id', Integer, primary_key=True),
+                            Column('name', String, unique=True),
+                            Column('last_login', DateTime),
+                            Column('hash', String),
+                            Column('public_key', Text)
+                            )
+
+        active_users_table = Table('active_users', self.metadata,
+                                   Column('id', Integer, primary_key=True),
+                                   Column('user', ForeignKey('users.id'), unique=True),
+                                   Column('login_time', DateTime),
+                                   Column('login_ip', String),
+                                   Column('login_port', String)
+                                   )
+
+        login_history_table = Table('login_history', self.metadata,
+                                    Column('id', Integer, primary_key=True),
+                                    Column('user', ForeignKey('users.id')),
+                                    Column('login_time', DateTime),
+                                    Column('login_ip', String),
+                                    Column('login_port', String)
+                                    )
+
+        contacts_table = Table('contacts', self.metadata,
+                               Column('id', Integer, primary_key=True),
+                               Column('user', ForeignKey('users.id')),
+                               Column('contact', ForeignKey('users.id'))
+                               )
+
+        message_history_table = Table('message_history', self.metadata,
+                                      Column('user', ForeignKey('users.id'), primary_key=True),
+                                      Column('sent', Integer),
+                                      Column('received', Integer)
+                                      )
+
+        offline_messages_table = Table('offline_messages', self.metadata,
+                                       Column('id', Integer, primary_key=True),
+                                       Column('receiver', ForeignKey('users.id'), index=True),
+                                       Column('message', Text)
+                                       )
+
+        directory_changes_table = Table('directory_changes', self.metadata,
+                                        Column('version', Integer, primary_key=True),
+                                        Column('name', String),
+                                        Column('change', String)
+                                        )
+
+        self.metadata.create_all(self.engine)
+
+        mapper(self.User, users_table)
+        mapper(self.ActiveUser, active_users_table)
+        mapper(self.LoginHistory, login_history_table)
+        mapper(self.Contact, contacts_table)
+        mapper(self.MessageHistory, message_history_table)
+        mapper(self.OfflineMessage, offline_messages_table)
+        mapper(self.DirectoryChange, directory_changes_table)
+
+        self.session = scoped_session(sessionmaker(bind=self.engine))
+        self.session.query(self.ActiveUser).delete()
+        self.session.commit()
+
+        self.stats_flush_interval = stats_flush_interval
+        self.stats_flush_size = stats_flush_size
+        self.stats_lock = threading.Lock()
+        self.message_stats = {}
+        self.pending_messages = 0
+        self.stats_flushed_at = time.monotonic()
+
+        self.directory_version = self.session.query(func.max(self.DirectoryChange.version)).scalar() or 0
+
+        self.cache_lock = threading.Lock()
+        self.users_cache = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.fill_users_cache()
+
+    @staticmethod
+    def configure_connection(connection, connection_record):
+        """
+        :param connection: новое соединение с базой данных
+        :param connection_record: запись пула о соединении
+
+        Метод, настраивающий каждое новое соединение пула: включает режим WAL, в котором чтение из потока
+        интерфейса не ждёт записи из потока сервера, и ослабляет синхронизацию с диском до уровня NORMAL,
+        безопасного в режиме WAL
+        """
+
+        cursor = connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+
+    def release_session(self):
+        """
+        Метод, закрывающий сессию текущего потока и возвращающий её соединение в пул.
+        Вызывается потоком перед завершением работы с базой данных
+        """
+
+        self.session.remove()
+
+    def rollback_session(self):
+        """
+        Метод, откатывающий незавершённую транзакцию сессии текущего потока после ошибки, чтобы сессией
+        можно было пользоваться дальше
+        """
+
+        self.session.rollback()
+
+    def dispose_connections(self):
+        """
+        Метод, закрывающий все соединения пула. Вызывается перед запуском рабочих процессов сервера,
+        чтобы процессы не делили унаследованные соединения и открывали собственные
+        """
+
+        self.session.remove()
+        self.engine.dispose()
+
+    def fill_users_cache(self):
+        """
+        Метод, заполняющий кэш пользователей (имя -> идентификатор, хэш пароля, публичный ключ) из базы данных
+        """
+
+        users = {user.name: (user.id, user.hash, user.public_key) for user in
+                 self.session.query(self.User.name, self.User.id, self.User.hash, self.User.public_key)}
+        with self.cache_lock:
+            self.users_cache = users
+
+    def get_cached_user(self, name):
+        """
+        :param name: имя пользователя
+
+        Метод, возвращающий кортеж (идентификатор, хэш пароля, публичный ключ) пользователя из кэша. При промахе
+        данные загружаются из базы данных и сохраняются в кэше. Для незарегистрированного пользователя
+        возвращает None
+        """
+
+        with self.cache_lock:
+            user = self.users_cache.get(name)
+            if user is not None:
+                self.cache_hits += 1
+                return user
+            self.cache_misses += 1
+        user = self.session.query(self.User.id, self.User.hash, self.User.public_key).filter_by(name=name).first()
+        if user is None:
+            return None
+        user = tuple(user)
+        with self.cache_lock:
+            self.users_cache[name] = user
+        return user
+
+    def get_user_id(self, name):
+        """
+        :param name: имя пользователя
+
+        Метод, возвращающий идентификатор пользователя
+        """
+
+        return self.get_cached_user(name)[0]
+
+    def invalidate_user_cache(self, name=None):
+        """
+        :param name: имя пользователя
+
+        Метод, удаляющий пользователя из кэша, а если имя не указано - очищающий кэш полностью. Используется
+        после изменения таблицы пользователей в обход методов класса
+        """
+
+        with self.cache_lock:
+            if name is None:
+                self.users_cache = {}
+            else:
+                self.users_cache.pop(name, None)
+
+    def get_cache_stats(self):
+        """
+        Метод, возвращающий количество попаданий и промахов кэша пользователей
+        """
+
+        return self.cache_hits, self.cache_misses
+
+    def add_user(self, name, hash):
+        """
+        :param name: имя нового пользователя
+        :param hash: хэш пароля нового пользователя
+
+        Метод, добавляющий в таблицу пользователей нового пользователя
+        """
+
+        user = self.User(name, hash)
+        self.session.add(user)
+        self.session.commit()
+        self.session.add(self.MessageHistory(user.id))
+        self.add_directory_change(name, USER_ADDED)
+        self.session.commit()
+        with self.cache_lock:
+            self.users_cache[name] = (user.id, user.hash, user.public_key)
+
+    def delete_user(self, name):
+        """
+        :param name: имя пользователя, которого нужно удалить
+
+        Метод, удаляющий пользователя из базы данных
+        """
+
+        user = self.get_user_id(name)
+        self.session.query(self.ActiveUser).filter_by(user=user).delete()
+        self.session.query(self.LoginHistory).filter_by(user=user).delete()
+        self.session.query(self.Contact).filter_by(user=user).delete()
+        self.session.query(self.Contact).filter_by(contact=user).delete()
+        self.session.query(self.MessageHistory).filter_by(user=user).delete()
+        self.session.query(self.OfflineMessage).filter_by(receiver=user).delete()
+        self.session.query(self.User).filter_by(id=user).delete()
+        self.add_directory_change(name, USER_REMOVED)
+        self.session.commit()
+        self.invalidate_user_cache(name)
+
+    def user_login(self, name, ip, port, key):
+        """
+        :param name: имя пользователя
+        :param ip: адрес подключения
+        :param port: порт подключения
+        :param key:  публичный ключ пользователя
+
+        Метод, сохраняющий данные о входе пользователя на сервер в базе данных сервера
+        """
+
+        user = self.get_cached_user(name)
+        if user is None:
+            raise ValueError('Пользователь не зарегистрирован')
+        user_id, hash, public_key = user
+
+        changes = {self.User.last_login: datetime.datetime.now()}
+        if public_key != key:
+            changes[self.User.public_key] = key
+            self.add_directory_change(name, KEY_CHANGED)
+        self.session.query(self.User).filter_by(id=user_id).update(changes, synchronize_session=False)
+
+        self.session.add(self.ActiveUser(user_id, datetime.datetime.now(), ip, port))
+        self.session.add(self.LoginHistory(user_id, datetime.datetime.now(), ip, port))
+
+        self.session.commit()
+        with self.cache_lock:
+            self.users_cache[name] = (user_id, hash, key)
+
+    def user_logout(self, name):
+        """
+        :param name: имя пользователя
+
+        Метод, удаляющий пользователя из таблицы активных пользователей
+        """
+
+        self.session.query(self.ActiveUser).filter_by(user=self.get_user_id(name)).delete()
+        self.session.commit()
+
+    def get_hash(self, name):
+        """
+        :param name: имя пользователя
+
+        Метод, возвращающий хэш пароля пользователя из базы данных
+        """
+
+        return self.get_cached_user(name)[1]
+
+    def get_public_key(self, name):
+        """
+        :param name: имя пользователя
+
+        Метод, возвращающий публичный ключ пользователя из базы данных
+        """
+
+        return self.get_cached_user(name)[2]
+
+    def get_users(self):
+        """
+        Метод, возвращающий список доступных пользователей из базы данных сервера
+        """
+
+        return self.session.query(self.User.name, self.User.last_login).all()
+
+    def check_user(self, name):
+        """
+        :param name: имя пользователя
+
+        Метод, проверяющий зарегистрирован ли пользователь на сервере
+        """
+
+        if self.get_cached_user(name):
+            return True
+        else:
+            return False
+
+    def get_active_users(self):
+        """
+        Метод, возвращающий список активных пользователей из базы данных
+        """
+
+        return self.session.query(self.User.name, self.ActiveUser.login_ip, self.ActiveUser.login_port, self.ActiveUser.login_time).join(self.User).all()
+
+    def get_login_history(self, name):
+        """
+        :param name: имя пользователя
+
+        Метод, возвращающий истроию входа пользователя на сервер из базы данных
+        """
+
+        return self.session.query(self.LoginHistory).filter_by(user=self.get_user_id(name)).all()
+
+    def get_contacts(self, name):
+        """
+        :param name: имя пользователя
+
+        Метод, возвращающий список контактов пользователя из базы данных
+        """
+
+        return [contact[1] for contact in self.session.query(self.Contact, self.User.name).filter_by(user=self.get_user_id(name))
+                .join(self.User, self.Contact.contact == self.User.id).all()]
+
+    def get_message_history(self, name=None):
+        """
+        :param name: имя пользователя
+
+        Метод возвращающий историю сообщений конкретного пользователя или всех пользователей
+        """
+
+        self.flush_message_stats()
+        if not name:
+            return self.session.query(self.User.name, self.User.last_login, self.MessageHistory.sent, self.MessageHistory.received).join(self.User).all()
+        return self.session.query(self.User.name, self.User.last_login, self.MessageHistory.sent, self.MessageHistory.received)\
+            .filter(self.MessageHistory.user == self.get_user_id(name)).join(self.User).all()
+
+    def add_contact(self, user_name, contact_name):
+        """
+        :param user_name: имя пользователя
+        :param contact_name: имя пользователя, которого нужно добавить в контакты
+
+        Метод, добавляющий одного пользователя в список контактов другого пользователя
+        """
+
+        user = self.get_user_id(user_name)
+        contact = self.get_user_id(contact_name)
+        self.session.add(self.Contact(user, contact))
+        self.session.commit()
+
+    def delete_contact(self, user_name, contact_name):
+        """
+        :param user_name: имя пользователя
+        :param contact_name: имя пользователя, которого нужно удалить из контактов
+
+        Метод, удаляющий одного пользователя из списка контактов другого пользователя
+        """
+
+        user = self.get_user_id(user_name)
+        contact = self.get_user_id(contact_name)
+        self.session.query(self.Contact).filter_by(user=user, contact=contact).delete()
+        self.session.commit()
+
+    def add_directory_change(self, name, change):
+        """
+        :param name: имя пользователя
+        :param change: вид изменения: USER_ADDED, USER_REMOVED или KEY_CHANGED
+
+        Метод, записывающий изменение списка пользователей в журнал изменений в текущей транзакции и увеличивающий
+        версию списка. Журнал хранит только последние DIRECTORY_LOG_SIZE изменений
+        """
+
+        change = self.DirectoryChange(name, change)
+        self.session.add(change)
+        self.session.flush()
+        self.directory_version = change.version
+        self.session.query(self.DirectoryChange).filter(
+            self.DirectoryChange.version <= change.version - DIRECTORY_LOG_SIZE).delete(synchronize_session=False)
+
+    def get_directory_version(self):
+        """
+        Метод, возвращающий текущую версию списка пользователей
+        """
+
+        return self.directory_version
+
+    def sync_directory_version(self, version):
+        """
+        :param version: версия списка пользователей, записанная другим процессом сервера
+
+        Метод, учитывающий изменения списка пользователей, записанные в базу другим рабочим процессом
+        """
+
+        if version > self.directory_version:
+            self.directory_version = version
+
+    def get_directory_changes(self, version):
+        """
+        :param version: версия списка пользователей, известная получателю
+
+        Метод, возвращающий список изменений (версия, имя пользователя, вид изменения), произошедших после
+        данной версии. Если часть этих изменений уже удалена из журнала, возвращает None
+        """
+
+        changes = self.session.query(self.DirectoryChange.version, self.DirectoryChange.name,
+                                     self.DirectoryChange.change).filter(self.DirectoryChange.version > version)\
+            .order_by(self.DirectoryChange.version).all()
+        if version < self.directory_version and (not changes or changes[0][0] != version + 1):
+            return None
+        return [list(change) for change in changes]
+
+    def store_offline_message(self, receiver_name, message):
+        """
+        :param receiver_name: имя получателя
+        :param message: словарь сообщения
+
+        Метод, сохраняющий сообщение для отключённого пользователя до его следующего входа на сервер.
+        Текст сообщения хранится в том виде, в котором его прислал отправитель, то есть зашифрованным;
+        байтовые значения двоичных форматов сохраняются строкой base64. Идентификатор запроса отправителя
+        не сохраняется
+        """
+
+        message = {key: value for key, value in message.items() if key != REQUEST_ID}
+        self.session.add(self.OfflineMessage(self.get_user_id(receiver_name),
+                                             json.dumps(message, default=JsonCodec.encode_bytes)))
+        self.session.commit()
+
+    def get_offline_messages(self, receiver_name, limit):
+        """
+        :param receiver_name: имя получателя
+        :param limit: наибольшее количество сообщений
+
+        Метод, возвращающий список из не более чем limit самых старых сохранённых сообщений пользователя
+        в виде кортежей (идентификатор, словарь сообщения)
+        """
+
+        messages = self.session.query(self.OfflineMessage.id, self.OfflineMessage.message)\
+            .filter_by(receiver=self.get_user_id(receiver_name)).order_by(self.OfflineMessage.id).limit(limit).all()
+        return [(message_id, json.loads(message)) for message_id, message in messages]
+
+    def delete_offline_messages(self, receiver_name, last_id):
+        """
+        :param receiver_name: имя получателя
+        :param last_id: идентификатор последнего переданного сообщения
+
+        Метод, удаляющий переданные пользователю сохранённые сообщения с идентификаторами не больше last_id
+        """
+
+        self.session.query(self.OfflineMessage).filter(self.OfflineMessage.receiver == self.get_user_id(receiver_name),
+                                                       self.OfflineMessage.id <= last_id).delete(synchronize_session=False)
+        self.session.commit()
+
+    def count_offline_messages(self, receiver_name):
+        """
+        :param receiver_name: имя получателя
+
+        Метод, возвращающий количество сохранённых сообщений пользователя
+        """
+
+        return self.session.query(self.OfflineMessage).filter_by(receiver=self.get_user_id(receiver_name)).count()
+
+    def process_message(self, sender_name, receiver_name):
+        """
+        :param sender_name: имя отправителя
+        :param receiver_name: имя получателя
+
+        Метод, учитывающий сообщение в статистике. Счётчики накапливаются в памяти и записываются в таблицу
+        истории сообщений одной транзакцией при накоплении stats_flush_size сообщений или по таймеру
+        """
+
+        with self.stats_lock:
+            self.message_stats.setdefault(sender_name, [0, 0])[0] += 1
+            self.message_stats.setdefault(receiver_name, [0, 0])[1] += 1
+            self.pending_messages += 1
+            flush_needed = self.pending_messages >= self.stats_flush_size
+        if flush_needed:
+            self.flush_message_stats()
+
+    def stats_flush_timeout(self):
+        """
+        Метод, возвращающий количество секунд до плановой записи статистики сообщений или None,
+        если записывать нечего
+        """
+
+        if not self.pending_messages:
+            return None
+        return max(0, self.stats_flushed_at + self.stats_flush_interval - time.monotonic())
+
+    def flush_message_stats(self):
+        """
+        Метод, записывающий накопленную статистику сообщений в таблицу истории сообщений одной транзакцией
+        """
+
+        with self.stats_lock:
+            stats, self.message_stats = self.message_stats, {}
+            self.pending_messages = 0
+            self.stats_flushed_at = time.monotonic()
+            if not stats:
+                return
+            for name, (sent, received) in stats.items():
+                user = self.get_cached_user(name)
+                if user is not None:
+                    self.session.query(self.MessageHistory).filter_by(user=user[0]).update({
+                        self.MessageHistory.sent: self.MessageHistory.sent + sent,
+                        self.MessageHistory.received: self.MessageHistory.received + received
+                    }, synchronize_session=False)
+            self.session.commit()
+
+
+if __name__ == '__main__':
+    test_db = ServerDB()
+    test_db.user_login('client_1', '192.168.1.4', 8080)
+    test_db.user_login('client_2', '192.168.1.5', 7777)
+
+    print(' ---- test_db.get_active_users() ----')
+    print(test_db.get_active_users())
+
+    test_db.user_logout('client_1')
+    print(' ---- test_db.get_active_users() after logout client_1 ----')
+    print(test_db.get_active_users())
+
+    print(' ---- test_db.login_history(client_1) ----')
+    print(test_db.get_login_history('client_1'))
+
+    print(' ---- test_db.get_users() ----')
+    print(test_db.get_users())
+
+    print(' ---- test_db.get_contacts() of client_1----')
+    print(test_db.get_contacts('client_1'))
+
+    print(' ---- test_db.add_contact() client_2 to client_1----')
+    test_db.add_contact('client_1', 'client_2')
+    print(test_db.get_contacts('client_1'))
+
+    print(' ---- test_db.delete_contact() client_2 of client_1----')
+    test_db.delete_contact('client_1', 'client_2')
+    print(test_db.get_contacts('client_1'))
+
+    print(' ---- test_db.get_message_history() of client_1 and client_2----')
+    print(test_db.get_message_history('client_1'))
+    print(test_db.get_message_history('client_2'))
+
+    print(' ---- test_db.count_message() client_1 to client_2----')
+    test_db.process_message('client_1', 'client_2')
+    print(test_db.get_message_history('client_1'))
+    print(test_db.get_message_history('client_2'))
+
+    test_db.user_logout('client_2')
+    test_db.session.query(test_db.User).filter(test_db.User.name.in_(['client_1', 'client_2'])).delete()
+
+    print(' ---- test_db.users_list() ----')
+    print(test_db.get_users())
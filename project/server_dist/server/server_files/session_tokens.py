@@ -0,0 +1,89 @@
+import hashlib
+import hmac
+import logging
+import os
+import time
+import sys
+sys.path.append('../../../')
+from server_dist.server.common.variables import SESSION_TOKEN_TTL
+
+logger = logging.getLogger('server_dist')
+
+
+def load_token_secret(path):
+    """
+    :param path: путь к файлу с секретом
+
+    Функция, читающая секрет для подписи токенов из файла, а если файла нет - создающая его. Секрет хранится
+    в файле, чтобы выданные токены оставались действительными после перезапуска сервера
+    """
+
+    if os.path.exists(path):
+        with open(path, 'rb') as file:
+            secret = file.read()
+        if len(secret) >= 32:
+            return secret
+        logger.warning(f'Секрет токенов в файле {path} слишком короткий, создаётся новый.')
+    secret = os.urandom(32)
+    descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(descriptor, 'wb') as file:
+        file.write(secret)
+    return secret
+
+
+class SessionTokens:
+    """
+    Класс, выдающий и проверяющий подписанные токены возобновления сессии. Токен выдаётся после успешной проверки
+    пароля и позволяет клиенту в течение ttl секунд входить без запроса проверки пароля. Токен не хранится
+    на сервере: он содержит срок действия и подпись HMAC-SHA256 от имени пользователя, срока действия, хэша пароля
+    и публичного ключа, поэтому смена пароля или ключа делает выданные токены недействительными
+    """
+
+    def __init__(self, secret=None, ttl=SESSION_TOKEN_TTL):
+        self.secret = secret or os.urandom(32)
+        self.ttl = ttl
+
+    def sign(self, name, expires, password_hash, public_key):
+        """
+        :param name: имя пользователя
+        :param expires: время окончания действия токена
+        :param password_hash: хэш пароля пользователя из базы данных
+        :param public_key: публичный ключ пользователя
+
+        Метод, вычисляющий подпись токена
+        """
+
+        key_digest = hashlib.sha256((public_key or '').encode('utf-8')).hexdigest()
+        payload = f'{name}\n{expires}\n{key_digest}\n'.encode('utf-8') + password_hash
+        return hmac.new(self.secret, payload, 'sha256').hexdigest()
+
+    def issue(self, name, password_hash, public_key):
+        """
+        :param name: имя пользователя
+        :param password_hash: хэш пароля пользователя из базы данных
+        :param public_key: публичный ключ пользователя
+
+        Метод, выдающий токен возобновления сессии
+        """
+
+        expires = int(time.time()) + self.ttl
+        return f'{expires}.{self.sign(name, expires, password_hash, public_key)}'
+
+    def verify(self, token, name, password_hash, public_key):
+        """
+        :param token: токен, присланный клиентом
+        :param name: имя пользователя
+        :param password_hash: хэш пароля пользователя из базы данных
+        :param public_key: публичный ключ пользователя
+
+        Метод, проверяющий подпись и срок действия токена
+        """
+
+        try:
+            expires, signature = token.split('.', 1)
+            expires = int(expires)
+        except (AttributeError, ValueError):
+            return False
+        if expires < time.time():
+            return False
+        return hmac.compare_digest(signature, self.sign(name, expires, password_hash, public_key))
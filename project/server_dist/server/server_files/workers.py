@@ -0,0 +1,122 @@
+import itertools
+import logging
+import multiprocessing
+import socket
+import sys
+sys.path.append('../../../')
+from server_dist.server.common.log_queue import stop_log_listeners
+from server_dist.server.common.variables import *
+from server_dist.server.server_files.peers import PeerMessageProcessor
+from server_dist.server.server_files.session_tokens import SessionTokens
+
+logger = logging.getLogger('server_dist')
+
+
+class WorkerMessageProcessor(PeerMessageProcessor):
+    """
+    Класс рабочего процесса многопроцессного сервера. Все рабочие процессы слушают один порт (SO_REUSEPORT),
+    и каждый обслуживает свою часть подключений. Процессы соединены попарно локальными сокетами (AF_UNIX),
+    по которым передаются сведения о пользователях и сообщения пользователям других процессов
+    """
+
+    reuse_port = True
+
+    def __init__(self, address, port, db, worker_id, links, high_water=OUT_BUFFER_HIGH_WATER,
+                 buffer_limit=OUT_BUFFER_LIMIT, slow_consumer_timeout=SLOW_CONSUMER_TIMEOUT, session_tokens=None):
+        super().__init__(address, port, db, high_water, buffer_limit, slow_consumer_timeout, session_tokens)
+        self.worker_id = worker_id
+        for peer_id, link in links.items():
+            self.add_link(link, peer_id)
+
+    def remote_login(self, message, peer_id):
+        """
+        :param message: сообщение соседа о входе пользователя
+        :param peer_id: номер рабочего процесса
+
+        Метод, учитывающий вход пользователя в другом рабочем процессе. Процессы работают с общей базой данных,
+        поэтому достаточно сбросить кэш пользователя (ключ мог измениться) и учесть новую версию списка
+        пользователей
+        """
+
+        self.db.invalidate_user_cache(message[ACCOUNT_NAME])
+        self.db.sync_directory_version(message[DIRECTORY_VERSION])
+
+
+def run_worker(worker_id, address, port, db, links, all_links, options, session_tokens, stop_event):
+    """
+    :param worker_id: номер рабочего процесса
+    :param address: адрес, с которого принимаются подключения
+    :param port: порт для подключений
+    :param db: база данных сервера
+    :param links: словарь сокетов соединений с другими процессами по их номерам
+    :param all_links: все сокеты соединений между процессами
+    :param options: параметры очередей отправки сервера
+    :param session_tokens: объект выдачи и проверки токенов возобновления сессии
+    :param stop_event: событие остановки сервера
+
+    Функция рабочего процесса: запускает сервер и ждёт команды на остановку. Сокеты, соединяющие другие
+    процессы, закрываются, чтобы закрытие соединения процессом было видно его соседям. Перед выходом процесса
+    дописываются очереди логов, так как дочерний процесс завершается без обработчиков atexit
+    """
+
+    own = set(links.values())
+    for link in all_links:
+        if link not in own:
+            link.close()
+    server = WorkerMessageProcessor(address, port, db, worker_id, links, *options, session_tokens=session_tokens)
+    server.start()
+    try:
+        stop_event.wait()
+    except KeyboardInterrupt:
+        pass
+    server.stop()
+    server.join()
+    stop_log_listeners()
+
+
+def start_workers(count, address, port, db, high_water=OUT_BUFFER_HIGH_WATER, buffer_limit=OUT_BUFFER_LIMIT,
+                  slow_consumer_timeout=SLOW_CONSUMER_TIMEOUT, session_tokens=None):
+    """
+    :param count: число рабочих процессов
+    :param address: адрес, с которого принимаются подключения
+    :param port: порт для подключений
+    :param db: база данных сервера
+    :param session_tokens: объект выдачи и проверки токенов возобновления сессии
+
+    Функция, запускающая рабочие процессы сервера, попарно соединённые локальными сокетами. Возвращает список
+    процессов и событие, которое нужно установить для их остановки. Все процессы используют один секрет
+    токенов возобновления сессии, чтобы клиент мог возобновить сессию в любом из них
+    """
+
+    session_tokens = session_tokens or SessionTokens()
+    links = {worker_id: {} for worker_id in range(count)}
+    for first, second in itertools.combinations(range(count), 2):
+        links[first][second], links[second][first] = socket.socketpair()
+    all_links = [link for worker_links in links.values() for link in worker_links.values()]
+    db.dispose_connections()
+    context = multiprocessing.get_context('fork')
+    stop_event = context.Event()
+    options = (high_water, buffer_limit, slow_consumer_timeout)
+    processes = [context.Process(target=run_worker, name=f'server_worker_{worker_id}', daemon=True,
+                                 args=(worker_id, address, port, db, links[worker_id], all_links, options,
+                                       session_tokens, stop_event))
+                 for worker_id in range(count)]
+    for process in processes:
+        process.start()
+    for link in all_links:
+        link.close()
+    logger.info(f'Запущено рабочих процессов сервера: {count}.')
+    return processes, stop_event
+
+
+def stop_workers(processes, stop_event):
+    """
+    :param processes: список рабочих процессов
+    :param stop_event: событие остановки сервера
+
+    Функция, останавливающая рабочие процессы сервера и дожидающаяся их завершения
+    """
+
+    stop_event.set()
+    for process in processes:
+        process.join()
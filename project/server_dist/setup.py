@@ -6,5 +6,6 @@ setup(name="barrakuda_messenger_server",
       author="barrakuda8",
       author_email="brpslelush@gmail.com",
       packages=find_packages(),
-      install_requires=['PyQt5', 'sqlalchemy', 'pycryptodome', 'pycryptodomex']
+      install_requires=['PyQt5', 'sqlalchemy', 'pycryptodome', 'pycryptodomex'],
+      extras_require={'msgpack': ['msgpack']}
       )